@@ -2,24 +2,80 @@ import os
 import re
 import time
 import json
+import hashlib
+import sqlite3
+import threading
+import zlib
+import bisect
+import unicodedata
+import contextlib
+import contextvars
+import shutil
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+import signal
+import socket
+from email.utils import parsedate_to_datetime
+import argparse
 import requests
-import gradio as gr
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
-import torch
 import logging
 from dotenv import load_dotenv
-from transformers import pipeline, AutoTokenizer
 import sys
 
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("TICKET_LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno
 load_dotenv()
 
 # 1. MODELO ESPECÍFICO PARA ESPAÑOL
-MODEL_NAME = "Recognai/zeroshot_selectra_medium"  # Modelo en español para zero-shot
+MODELOS = [
+    "Recognai/zeroshot_selectra_medium",  # Modelo en español para zero-shot
+    "vicgalle/xlm-roberta-large-xnli-anli"  # Alternativo multilingüe
+]
+# Modelos separados por comas en lugar de los anteriores (por ejemplo, una copia local)
+if os.getenv("TICKET_MODELS"):
+    MODELOS = os.getenv("TICKET_MODELS").split(",")
+# "model" carga el modelo en el primer uso; "keywords" usa solo palabras clave
+TICKET_CLASSIFIER_MODE = os.getenv("TICKET_CLASSIFIER_MODE", "model")
+# Motor del modelo: "nli" (zero-shot) o "embeddings" (similitud, con NLI solo para casos ambiguos)
+TICKET_CLASSIFIER_ENGINE = os.getenv("TICKET_CLASSIFIER_ENGINE", "nli")
+# Backend de inferencia del modelo zero-shot en CPU: "torch" (fp32), "int8" (cuantización dinámica) u "onnx" (ONNX Runtime)
+TICKET_INFERENCE_BACKEND = os.getenv("TICKET_INFERENCE_BACKEND", "torch")
+# Directorio donde se guardan los modelos cuantizados y exportados, para no repetir el paso en cada arranque
+MODEL_CACHE_DIR = os.getenv("TICKET_MODEL_CACHE", ".cache_modelos")
+# Socket Unix de un servidor de inferencia (python app.py --servidor-inferencia): si se indica,
+# este proceso no carga el modelo y le envía los lotes al servidor
+INFERENCE_SOCKET = os.getenv("TICKET_INFERENCE_SOCKET")
+# Clave opcional para autenticar las conexiones al servidor (además de los permisos 0600 del socket)
+INFERENCE_AUTHKEY = os.getenv("TICKET_INFERENCE_AUTHKEY", "").encode("utf-8") or None
+# Segundos de espera por la respuesta de un lote y por el servidor al arrancar
+INFERENCE_TIMEOUT = float(os.getenv("TICKET_INFERENCE_TIMEOUT", "60"))
+INFERENCE_CONNECT_TIMEOUT = float(os.getenv("TICKET_INFERENCE_CONNECT_TIMEOUT", "30"))
+EMBEDDING_MODEL_NAME = os.getenv("TICKET_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+# Diferencia mínima de similitud entre las dos mejores categorías para no consultar al modelo NLI
+EMBEDDING_MARGIN = float(os.getenv("TICKET_EMBEDDING_MARGIN", "0.05"))
+EMBEDDING_CACHE_DIR = os.getenv("TICKET_EMBEDDING_CACHE", ".cache_embeddings")
+# Cascada: los tickets con exactamente una categoría por palabras clave no pasan por el modelo
+TICKET_CASCADE = os.getenv("TICKET_CASCADE", "0") == "1"
+# Fracción de tickets resueltos por palabras clave que también se envían al modelo para medir el acuerdo
+CASCADE_SAMPLE_RATE = float(os.getenv("TICKET_CASCADE_SAMPLE", "0.05"))
+# Agrupación de casi duplicados: se clasifica un representante por grupo y los demás heredan su categoría
+TICKET_CLUSTERING = os.getenv("TICKET_CLUSTERING", "0") == "1"
+# Similitud de Jaccard estimada (MinHash) mínima con el representante para entrar en su grupo
+CLUSTER_THRESHOLD = float(os.getenv("TICKET_CLUSTER_THRESHOLD", "0.8"))
+# Archivo JSON o YAML con las reglas (categorías, urgencia, umbrales, plantilla); sin él se usan las de abajo
+RULES_PATH = os.getenv("TICKET_RULES_PATH")
+# Segundos entre comprobaciones de cambios en el archivo de reglas
+RULES_CHECK_INTERVAL = float(os.getenv("TICKET_RULES_CHECK_INTERVAL", "2"))
+# Reglas por defecto
 CATEGORIAS = {
     "logística": re.compile(r"pedido|entrega|env[íi]o|llegada|reparto|transporte|seguimiento", re.IGNORECASE),
     "pagos": re.compile(r"pago|tarjeta|cobro|d[eé]bito|cr[eé]dito|transacci[oó]n", re.IGNORECASE),
@@ -33,19 +89,591 @@ URGENCY_PATTERNS = [  # Patrones
     r"!\s*!+",
     r"\b(prioridad [1-3]|nivel [1-3])\b"
 ]
+HYPOTHESIS_TEMPLATE = "Este ticket trata sobre {}."
+# Descripciones que se comparan con cada ticket en el motor de embeddings
+DESCRIPCIONES_CATEGORIAS = {
+    "logística": "Problemas con el envío, la entrega, el transporte o el seguimiento de un pedido.",
+    "pagos": "Problemas con un pago, un cobro, una tarjeta de crédito o débito o una transacción.",
+    "producto defectuoso": "El producto llegó roto, dañado, en mal estado o no funciona.",
+    "cuenta": "Problemas para acceder a la cuenta, iniciar sesión, registrarse o con la contraseña del usuario.",
+    "facturación": "Problemas con la factura, el recibo, los impuestos, los cargos o el precio cobrado."
+}
+# Umbral de confianza ajustable por categoría
+UMBRALES = {
+    "logística": 0.4,  # Umbral más bajo por la ambigüedad natural
+    "otros": 0.3,
+    "default": 0.5
+}
+# Número de pares premisa/hipótesis por pasada del modelo
+BATCH_SIZE = int(os.getenv("TICKET_BATCH_SIZE", "32"))
+# Filas por fragmento en modo streaming (0 = leer el CSV completo en memoria)
+CHUNKSIZE = int(os.getenv("TICKET_CHUNKSIZE", "0"))
+# Procesos de clasificación en paralelo (1 = en el proceso actual)
+WORKERS = int(os.getenv("TICKET_WORKERS", "1"))
+# Filas por fragmento enviado a cada proceso cuando no se usa streaming
+FRAGMENTO_WORKERS = 1000
+# Cola de trabajos de la interfaz web
+TICKET_JOBS_PATH = os.getenv("TICKET_JOBS_PATH", "trabajos")
+TICKET_JOBS_CONCURRENCY = int(os.getenv("TICKET_JOBS_CONCURRENCY", "2"))
+TICKET_JOBS_RESUME = os.getenv("TICKET_JOBS_RESUME", "0") == "1"
+# API HTTP: micro-lotes de hasta TICKET_API_MAX_BATCH textos, esperando como mucho TICKET_API_MAX_WAIT_MS
+API_MAX_BATCH = int(os.getenv("TICKET_API_MAX_BATCH", "32"))
+API_MAX_WAIT_MS = float(os.getenv("TICKET_API_MAX_WAIT_MS", "10"))
+# Textos pendientes admitidos antes de responder 429
+API_MAX_QUEUE = int(os.getenv("TICKET_API_MAX_QUEUE", "1000"))
+# Backend de almacenamiento de tickets: jsonl (por defecto), sqlite o json
+TICKET_STORE_BACKEND = os.getenv("TICKET_STORE_BACKEND", "jsonl")
+TICKET_STORE_PATH = os.getenv("TICKET_STORE_PATH")
+
+# 2. Métricas en formato Prometheus
+class Metrica:
+    """Serie de valores por combinación de etiquetas; la base de contadores e histogramas."""
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas: dict) -> tuple:
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}, no {tuple(etiquetas)}")
+        return tuple(str(etiquetas[e]) for e in self.etiquetas)
+
+    def _formatear_etiquetas(self, clave: tuple, extra: dict = None) -> str:
+        pares = list(zip(self.etiquetas, clave)) + list((extra or {}).items())
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{e}="{self._escapar(v)}"' for e, v in pares) + "}"
+
+    @staticmethod
+    def _escapar(valor) -> str:
+        return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    def exportar(self) -> list:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            for clave, valor in sorted(self._valores.items()):
+                lineas.extend(self._lineas(clave, valor))
+        return lineas
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, **etiquetas) -> float:
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas), 0)
+
+    def _lineas(self, clave, valor):
+        return [f"{self.nombre}{self._formatear_etiquetas(clave)} {valor}"]
+
+class Histograma(Metrica):
+    tipo = "histogram"
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, n: int = 1, **etiquetas):
+        """Registra `n` observaciones de `valor` (p. ej. la latencia media de los tickets de un lote)."""
+        clave = self._clave(etiquetas)
+        with self._lock:
+            conteos, suma, total = self._valores.get(clave, ([0] * len(self.buckets), 0.0, 0))
+            indice = bisect.bisect_left(self.buckets, valor)
+            if indice < len(conteos):
+                conteos[indice] += n
+            self._valores[clave] = (conteos, suma + valor * n, total + n)
+
+    @contextlib.contextmanager
+    def medir(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def conteo(self, **etiquetas) -> int:
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas), (None, 0.0, 0))[2]
+
+    def _lineas(self, clave, valor):
+        conteos, suma, total = valor
+        lineas, acumulado = [], 0
+        for limite, conteo in zip(self.buckets, conteos):
+            acumulado += conteo
+            lineas.append(f"{self.nombre}_bucket{self._formatear_etiquetas(clave, {'le': limite})} {acumulado}")
+        lineas.append(f"{self.nombre}_bucket{self._formatear_etiquetas(clave, {'le': '+Inf'})} {total}")
+        lineas.append(f"{self.nombre}_sum{self._formatear_etiquetas(clave)} {suma}")
+        lineas.append(f"{self.nombre}_count{self._formatear_etiquetas(clave)} {total}")
+        return lineas
+
+class RegistroMetricas:
+    """
+    Registro mínimo de métricas sin dependencias externas, expuesto en /metrics.
+    Los valores son del proceso actual: los workers de --workers llevan sus propios contadores.
+    """
+    def __init__(self):
+        self._metricas = {}
+
+    def _registrar(self, metrica: Metrica) -> Metrica:
+        return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: tuple = ()) -> Contador:
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = Histograma.BUCKETS) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def exportar(self) -> str:
+        """Formato de texto de exposición de Prometheus (versión 0.0.4)."""
+        return "\n".join(linea for metrica in self._metricas.values() for linea in metrica.exportar()) + "\n"
+
+metricas = RegistroMetricas()
+METRICA_CARGA_MODELO = metricas.histograma(
+    "ticket_modelo_carga_segundos", "Tiempo de carga del modelo", ("modelo", "backend"),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+METRICA_LATENCIA = metricas.histograma(
+    "ticket_clasificacion_segundos", "Latencia de clasificación por ticket según el nivel que lo resolvió", ("nivel",)
+)
+METRICA_CACHE = metricas.contador("ticket_cache_consultas_total", "Consultas a la caché de clasificación", ("resultado",))
+METRICA_TICKETS = metricas.contador("ticket_procesados_total", "Tickets clasificados", ("origen",))
+METRICA_URGENTES = metricas.contador("ticket_urgentes_total", "Tickets clasificados como urgentes", ("origen",))
+METRICA_ZENDESK = metricas.histograma("ticket_zendesk_segundos", "Latencia de las llamadas a Zendesk", ("metodo",))
+METRICA_ZENDESK_RESPUESTAS = metricas.contador(
+    "ticket_zendesk_respuestas_total", "Respuestas de Zendesk por código HTTP ('error' si no hubo respuesta)", ("codigo",)
+)
+METRICA_STORE = metricas.histograma(
+    "ticket_store_escritura_segundos", "Tiempo de escritura en el almacén de tickets", ("backend", "operacion")
+)
+
+# 3. Almacenamiento de tickets
+def _validar_paginacion(pagina: int, por_pagina: int):
+    if pagina < 1 or not 1 <= por_pagina <= 500:
+        raise ValueError("La página empieza en 1 y `por_pagina` debe estar entre 1 y 500")
+
+def _resultado_pagina(tickets: list, total: int, pagina: int, por_pagina: int) -> dict:
+    return {
+        "tickets": tickets,
+        "total": total,
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "paginas": max(1, -(-total // por_pagina))
+    }
+
+class IndiceTickets:
+    """
+    Índices en memoria para los almacenes JSON y JSONL.
+    - Conjuntos de ids por categoría, urgencia y estado para filtrar sin recorrer todo el historial.
+    - Lista ordenada por (created_at, id) para paginar del más reciente al más antiguo.
+    Un alta con un id existente reemplaza al ticket anterior, como en SQLite.
+    """
+    CAMPOS = ("category", "urgent", "status")
+
+    def __init__(self, tickets=()):
+        self._tickets = {}
+        self._por_campo = {campo: {} for campo in self.CAMPOS}
+        self._orden = []
+        for ticket in tickets:
+            self.agregar(ticket)
+
+    @staticmethod
+    def _posicion(ticket: dict) -> tuple:
+        return (str(ticket.get("created_at", "")), ticket["id"])
+
+    def agregar(self, ticket: dict):
+        anterior = self._tickets.get(ticket["id"])
+        if anterior is not None:
+            for campo in self.CAMPOS:
+                self._por_campo[campo][anterior.get(campo)].discard(anterior["id"])
+            self._orden.pop(bisect.bisect_left(self._orden, self._posicion(anterior)))
+        self._tickets[ticket["id"]] = ticket
+        for campo in self.CAMPOS:
+            self._por_campo[campo].setdefault(ticket.get(campo), set()).add(ticket["id"])
+        bisect.insort(self._orden, self._posicion(ticket))
+
+    def consultar(self, categoria: str = None, urgente: bool = None, estado: str = None, desde: str = None,
+                  hasta: str = None, pagina: int = 1, por_pagina: int = 20) -> dict:
+        _validar_paginacion(pagina, por_pagina)
+        candidatos = None
+        for campo, valor in (("category", categoria), ("urgent", urgente), ("status", estado)):
+            if valor is not None:
+                ids = self._por_campo[campo].get(valor, set())
+                candidatos = ids if candidatos is None else candidatos & ids
+        inicio = bisect.bisect_left(self._orden, (desde,)) if desde else 0
+        fin = bisect.bisect_left(self._orden, (hasta,)) if hasta else len(self._orden)
+        en_rango = reversed(self._orden[inicio:fin])
+        if candidatos is not None:
+            en_rango = (posicion for posicion in en_rango if posicion[1] in candidatos)
+        ids = list(en_rango)
+        pagina_ids = ids[(pagina - 1) * por_pagina:pagina * por_pagina]
+        return _resultado_pagina([self._tickets[i] for _, i in pagina_ids], len(ids), pagina, por_pagina)
+
+    def conteos(self) -> dict:
+        por_categoria = {}
+        for categoria, ids in self._por_campo["category"].items():
+            if ids:
+                urgentes = len(ids & self._por_campo["urgent"].get(True, set()))
+                por_categoria[categoria] = {"total": len(ids), "urgentes": urgentes}
+        return {"total": len(self._tickets), "por_categoria": por_categoria}
+
+class _ConsultasEnMemoria:
+    """Consultas de los almacenes basados en archivo: el índice se construye en la primera consulta."""
+    _indice = None
+
+    def _indice_cargado(self) -> IndiceTickets:
+        if self._indice is None:
+            self._indice = IndiceTickets(self.load())
+        return self._indice
+
+    def _indexar(self, ticket: dict):
+        if self._indice is not None:
+            self._indice.agregar(ticket)
+
+    def consultar(self, **filtros) -> dict:
+        return self._indice_cargado().consultar(**filtros)
+
+    def conteos(self) -> dict:
+        return self._indice_cargado().conteos()
+
+class JSONTicketStore(_ConsultasEnMemoria):
+    """Almacén original: reescribe el archivo JSON completo en cada alta."""
+    def __init__(self, ruta: str = "tickets_db.json"):
+        self.ruta = ruta
+        self._tickets = None
+
+    def load(self) -> list:
+        if self._tickets is None:
+            try:
+                with open(self.ruta) as f:
+                    self._tickets = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._tickets = []
+        return list(self._tickets)
+
+    def append(self, ticket: dict):
+        self.load()
+        self._tickets.append(ticket)
+        with open(self.ruta, 'w') as f:
+            json.dump(self._tickets, f, indent=2)
+        self._indexar(ticket)
+
+    def clear(self):
+        self._tickets = []
+        self._indice = None
+        with open(self.ruta, 'w') as f:
+            json.dump([], f)
+
+class JSONLTicketStore(_ConsultasEnMemoria):
+    """
+    Almacén append-only en formato JSON Lines.
+    - Cada alta agrega una línea al final del archivo (O(1)).
+    - Al cargar, si hay registros repetidos por id o líneas corruptas, se compacta el archivo.
+    - Si el archivo todavía no existe y hay un historial del almacén JSON anterior con el mismo
+      nombre (`tickets_db.json` para `tickets_db.jsonl`), se importa y el JSON se renombra a
+      `.json.migrado`, para no perder el historial ni repetir ids al cambiar de backend.
+    """
+    def __init__(self, ruta: str = "tickets_db.jsonl"):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._migrado = False
+
+    def _migrar_json(self):
+        if self._migrado:
+            return
+        self._migrado = True
+        anterior = f"{os.path.splitext(self.ruta)[0]}.json"
+        if anterior == self.ruta or os.path.exists(self.ruta) or not os.path.exists(anterior):
+            return
+        try:
+            with open(anterior, encoding="utf-8") as f:
+                tickets = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"No se pudo importar el historial de {anterior}: {e}")
+            return
+        self.compactar(tickets)
+        os.replace(anterior, f"{anterior}.migrado")
+        logger.info(f"Historial importado de {anterior} a {self.ruta} ({len(tickets)} tickets)")
+
+    def load(self) -> list:
+        self._migrar_json()
+        tickets = {}
+        lineas = 0
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                for linea in f:
+                    if not linea.strip():
+                        continue
+                    lineas += 1
+                    try:
+                        ticket = json.loads(linea)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Línea corrupta ignorada en {self.ruta}")
+                        continue
+                    tickets[ticket["id"]] = ticket
+        except FileNotFoundError:
+            return []
+        tickets = list(tickets.values())
+        if len(tickets) != lineas:
+            self.compactar(tickets)
+        return tickets
+
+    def append(self, ticket: dict):
+        self._migrar_json()
+        linea = json.dumps(ticket, ensure_ascii=False) + "\n"
+        with self._lock, open(self.ruta, "a", encoding="utf-8") as f:
+            f.write(linea)
+            self._indexar(ticket)
+
+    def compactar(self, tickets: list):
+        """Reescribe el archivo de forma atómica con un registro por ticket."""
+        temporal = f"{self.ruta}.tmp"
+        with self._lock:
+            with open(temporal, "w", encoding="utf-8") as f:
+                for ticket in tickets:
+                    f.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+            os.replace(temporal, self.ruta)
+
+    def clear(self):
+        self._migrar_json()
+        with self._lock, open(self.ruta, "w", encoding="utf-8"):
+            self._indice = None
 
-# 2. Clase para manejo de tickets
+class SQLiteTicketStore:
+    """Almacén SQLite en modo WAL: cada alta es un INSERT independiente."""
+    def __init__(self, ruta: str = "tickets_db.sqlite"):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tickets (
+                id INTEGER PRIMARY KEY,
+                category TEXT,
+                urgent INTEGER,
+                status TEXT,
+                created_at TEXT,
+                data TEXT NOT NULL
+            )"""
+        )
+        # Cada índice sirve para filtrar por su campo y, a la vez, ordenar por fecha
+        for campo in ("category", "urgent", "status"):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tickets_{campo} ON tickets ({campo}, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets (created_at)")
+        self._conn.commit()
+
+    def load(self) -> list:
+        with self._lock:
+            filas = self._conn.execute("SELECT data FROM tickets ORDER BY rowid").fetchall()
+        return [json.loads(fila[0]) for fila in filas]
+
+    def append(self, ticket: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tickets (id, category, urgent, status, created_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (ticket["id"], ticket["category"], int(ticket["urgent"]), ticket["status"],
+                 ticket["created_at"], json.dumps(ticket, ensure_ascii=False))
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM tickets")
+            self._conn.commit()
+
+    def consultar(self, categoria: str = None, urgente: bool = None, estado: str = None, desde: str = None,
+                  hasta: str = None, pagina: int = 1, por_pagina: int = 20) -> dict:
+        """Página de tickets filtrados, del más reciente al más antiguo (`desde` <= created_at < `hasta`)."""
+        _validar_paginacion(pagina, por_pagina)
+        condiciones, parametros = [], []
+        for condicion, valor in (("category = ?", categoria), ("urgent = ?", None if urgente is None else int(urgente)),
+                                 ("status = ?", estado), ("created_at >= ?", desde), ("created_at < ?", hasta)):
+            if valor is not None:
+                condiciones.append(condicion)
+                parametros.append(valor)
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tickets{where}", parametros).fetchone()[0]
+            filas = self._conn.execute(
+                f"SELECT data FROM tickets{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                (*parametros, por_pagina, (pagina - 1) * por_pagina)
+            ).fetchall()
+        return _resultado_pagina([json.loads(fila[0]) for fila in filas], total, pagina, por_pagina)
+
+    def conteos(self) -> dict:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT category, COUNT(*), SUM(urgent) FROM tickets GROUP BY category"
+            ).fetchall()
+        por_categoria = {categoria: {"total": total, "urgentes": urgentes or 0} for categoria, total, urgentes in filas}
+        return {"total": sum(c["total"] for c in por_categoria.values()), "por_categoria": por_categoria}
+
+TICKET_STORES = {
+    "json": JSONTicketStore,
+    "jsonl": JSONLTicketStore,
+    "sqlite": SQLiteTicketStore
+}
+
+def crear_ticket_store(backend: str = None, ruta: str = None):
+    """Crea el almacén indicado por parámetro o por TICKET_STORE_BACKEND / TICKET_STORE_PATH."""
+    backend = (backend or TICKET_STORE_BACKEND).lower()
+    if backend not in TICKET_STORES:
+        raise ValueError(f"Backend de almacenamiento desconocido: '{backend}' (opciones: {', '.join(TICKET_STORES)})")
+    ruta = ruta or TICKET_STORE_PATH
+    return TICKET_STORES[backend](ruta) if ruta else TICKET_STORES[backend]()
+
+# 4. Cliente de Zendesk
+class ZendeskClient:
+    """
+    Cliente HTTP para Zendesk.
+    - Reutiliza conexiones con un `requests.Session` y un pool de tamaño `max_en_vuelo`.
+    - Limita las peticiones simultáneas y reintenta 429/5xx respetando Retry-After.
+    - `create_tickets` usa el endpoint bulk `create_many` (hasta 100 tickets por petición).
+    """
+    CODIGOS_REINTENTABLES = (429, 500, 502, 503, 504)
+    MAX_CREATE_MANY = 100
+    ESTADOS_FINALES = ("completed", "failed", "killed")
+
+    def __init__(self, subdomain=None, email=None, api_token=None, base_url=None,
+                 max_en_vuelo=4, max_reintentos=5, timeout=30, backoff=0.5, intervalo_job=1.0):
+        subdomain = subdomain or os.getenv("ZENDESK_SUBDOMAIN")
+        email = email or os.getenv("ZENDESK_EMAIL")
+        api_token = api_token or os.getenv("ZENDESK_API_TOKEN")
+        self.base_url = (base_url or os.getenv("ZENDESK_BASE_URL") or f"https://{subdomain}.zendesk.com").rstrip("/")
+        self.max_en_vuelo = max_en_vuelo
+        self.max_reintentos = max_reintentos
+        self.timeout = timeout
+        self.backoff = backoff
+        self.intervalo_job = intervalo_job
+        self._semaforo = threading.BoundedSemaphore(max_en_vuelo)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_en_vuelo, pool_maxsize=max_en_vuelo)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.auth = (f"{email}/token", api_token)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    @staticmethod
+    def payload(description: str, category: str, urgent: bool) -> dict:
+        return {
+            "subject": f"[{category}] {'[URGENTE] ' if urgent else ''}Ticket Automático",
+            "comment": {"body": description},
+            "priority": "urgent" if urgent else "normal",
+            "tags": ["auto_classified", category],
+            "type": "problem"
+        }
+
+    def _espera(self, response, intento: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return self.backoff * (2 ** intento)
+
+    def _request(self, metodo: str, ruta: str, **kwargs):
+        for intento in range(self.max_reintentos + 1):
+            with self._semaforo, METRICA_ZENDESK.medir(metodo=metodo):
+                try:
+                    response = self.session.request(metodo, f"{self.base_url}{ruta}", timeout=self.timeout, **kwargs)
+                except requests.RequestException:
+                    METRICA_ZENDESK_RESPUESTAS.inc(codigo="error")
+                    raise
+            METRICA_ZENDESK_RESPUESTAS.inc(codigo=response.status_code)
+            if response.status_code not in self.CODIGOS_REINTENTABLES or intento == self.max_reintentos:
+                return response
+            espera = self._espera(response, intento)
+            logger.warning(f"Zendesk respondió {response.status_code}, reintentando en {espera:.1f}s")
+            time.sleep(espera)
+
+    def create_ticket(self, ticket: dict):
+        """Crea un único ticket; devuelve la respuesta HTTP."""
+        return self._request("POST", "/api/v2/tickets.json", json={"ticket": ticket})
+
+    def create_tickets(self, batch: list) -> list:
+        """
+        Crea un lote de tickets con create_many, enviando los bloques en paralelo.
+        Devuelve, en el orden de entrada, {"id": ...} o {"error": ...} por ticket.
+        """
+        bloques = [batch[i:i + self.MAX_CREATE_MANY] for i in range(0, len(batch), self.MAX_CREATE_MANY)]
+        with ThreadPoolExecutor(max_workers=self.max_en_vuelo) as pool:
+            resultados = list(pool.map(self._crear_bloque, bloques))
+        return [resultado for bloque in resultados for resultado in bloque]
+
+    def _crear_bloque(self, bloque: list) -> list:
+        try:
+            response = self._request("POST", "/api/v2/tickets/create_many.json", json={"tickets": bloque})
+            if response.status_code not in (200, 201, 202):
+                return [{"error": f"Error {response.status_code}: {response.text}"}] * len(bloque)
+            job = self._esperar_job(response.json()["job_status"])
+        except Exception as e:
+            return [{"error": str(e)}] * len(bloque)
+
+        resultados = [{"error": f"Job {job.get('id')} terminó con estado {job.get('status')}"}] * len(bloque)
+        for i, resultado in enumerate(job.get("results") or []):
+            indice = resultado.get("index", i)
+            if "id" in resultado and not resultado.get("error"):
+                resultados[indice] = {"id": resultado["id"]}
+            else:
+                resultados[indice] = {"error": resultado.get("details") or resultado.get("error", "desconocido")}
+        return resultados
+
+    def _esperar_job(self, job: dict) -> dict:
+        while job.get("status") not in self.ESTADOS_FINALES:
+            time.sleep(self.intervalo_job)
+            response = self._request("GET", f"/api/v2/job_statuses/{job['id']}.json")
+            response.raise_for_status()
+            job = response.json()["job_status"]
+        return job
+
+# 5. Clase para manejo de tickets
 class TicketSystem:
-    def limpiar_historial(self, filename="tickets_db.json"):
+    def limpiar_historial(self, filename=None):
         """Limpia el historial de tickets simulados."""
         self.tickets = []
         self.next_id = 1000
-        self.save_to_json(filename)
+        self.store.clear()
+        if filename:
+            self.save_to_json(filename)
         return True
-    def __init__(self):
+    def __init__(self, store=None, zendesk=None):
         self.mode = os.getenv("TICKET_API_MODE", "simulated")
-        self.tickets = []
+        self.store = store or crear_ticket_store()
+        self._zendesk = zendesk
+        self._tickets = None  # Se cargan del almacén en el primer acceso
         self.next_id = 1000
+
+    @property
+    def tickets(self):
+        if self._tickets is None:
+            self._tickets = self.store.load()
+            ids_simulados = [t["id"] for t in self._tickets if t.get("source") == "Simulado"]
+            if ids_simulados:
+                self.next_id = max(self.next_id, max(ids_simulados) + 1)
+        return self._tickets
+
+    @tickets.setter
+    def tickets(self, tickets):
+        self._tickets = tickets
+
+    @property
+    def zendesk(self):
+        if self._zendesk is None:
+            self._zendesk = ZendeskClient()
+        return self._zendesk
         
     def create_ticket(self, description: str, category: str, urgent: bool):
         """Crea un ticket en Zendesk o modo simulado"""
@@ -55,6 +683,7 @@ class TicketSystem:
             return self._create_simulated_ticket(description, category, urgent)
     
     def _create_simulated_ticket(self, description: str, category: str, urgent: bool):
+        tickets = self.tickets  # Carga el historial antes de asignar el siguiente id
         ticket = {
             "id": self.next_id,
             "description": description,
@@ -65,52 +694,52 @@ class TicketSystem:
             "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
             "source": "Simulado"
         }
-        self.tickets.append(ticket)
+        tickets.append(ticket)
         self.next_id += 1
-        self.save_to_json()
+        self._guardar(ticket)
         return ticket
     
+    def create_tickets(self, batch: list) -> list:
+        """
+        Crea un lote de tickets a partir de tuplas (description, category, urgent).
+        En modo Zendesk se envían en bloque con create_many.
+        """
+        if self.mode != "zendesk":
+            return [self._create_simulated_ticket(*item) for item in batch]
+        resultados = self.zendesk.create_tickets([ZendeskClient.payload(*item) for item in batch])
+        tickets = []
+        for (description, category, urgent), resultado in zip(batch, resultados):
+            if "error" in resultado:
+                tickets.append(resultado)
+                continue
+            ticket = self._zendesk_ticket(description, category, urgent, {"id": resultado["id"]})
+            self.tickets.append(ticket)
+            self._guardar(ticket)
+            tickets.append(ticket)
+        return tickets
+
+    def _zendesk_ticket(self, description: str, category: str, urgent: bool, ticket_data: dict) -> dict:
+        return {
+            "id": ticket_data["id"],
+            "description": description,
+            "category": category,
+            "urgent": urgent,
+            "status": ticket_data.get("status", "open"),
+            "assigned_to": "Agente Humano" if urgent else "Sistema Automático",
+            "created_at": ticket_data.get("created_at", time.strftime("%Y-%m-%d %H:%M:%S")),
+            "source": "Zendesk"
+        }
+
     def _create_zendesk_ticket(self, description: str, category: str, urgent: bool):
         """Crea un ticket real en Zendesk"""
-        subdomain = os.getenv("ZENDESK_SUBDOMAIN")
-        email = os.getenv("ZENDESK_EMAIL")
-        api_token = os.getenv("ZENDESK_API_TOKEN")
-        
-        priority = "urgent" if urgent else "normal"
-        subject = f"[{category}] {'[URGENTE] ' if urgent else ''}Ticket Automático"
-        
-        data = {
-            "ticket": {
-                "subject": subject,
-                "comment": {"body": description},
-                "priority": priority,
-                "tags": ["auto_classified", category],
-                "type": "problem"
-            }
-        }
-        
         try:
-            response = requests.post(
-                f"https://{subdomain}.zendesk.com/api/v2/tickets.json",
-                json=data,
-                auth=(f"{email}/token", api_token),
-                headers={"Content-Type": "application/json"}
-            )
+            response = self.zendesk.create_ticket(ZendeskClient.payload(description, category, urgent))
             
             if response.status_code == 201:
                 ticket_data = response.json().get("ticket", {})
-                ticket = {
-                    "id": ticket_data["id"],
-                    "description": description,
-                    "category": category,
-                    "urgent": urgent,
-                    "status": ticket_data.get("status", "open"),
-                    "assigned_to": "Agente Humano" if urgent else "Sistema Automático",
-                    "created_at": ticket_data.get("created_at", time.strftime("%Y-%m-%d %H:%M:%S")),
-                    "source": "Zendesk"
-                }
+                ticket = self._zendesk_ticket(description, category, urgent, ticket_data)
                 self.tickets.append(ticket)
-                self.save_to_json()
+                self._guardar(ticket)
                 return ticket
             else:
                 error_msg = f"Error {response.status_code}: {response.text}"
@@ -121,159 +750,1929 @@ class TicketSystem:
     
     def get_tickets(self):
         return self.tickets
+
+    def consultar_tickets(self, **filtros) -> dict:
+        """Página de tickets filtrada por categoria, urgente, estado y rango de fechas (ver store.consultar)."""
+        return self.store.consultar(**filtros)
+
+    def conteos_tickets(self) -> dict:
+        """Tickets por categoría, con cuántos son urgentes."""
+        return self.store.conteos()
     
+    def _guardar(self, ticket: dict):
+        with METRICA_STORE.medir(backend=type(self.store).__name__, operacion="append"):
+            self.store.append(ticket)
+
     def save_to_json(self, filename="tickets_db.json"):
-        with open(filename, 'w') as f:
+        """Exporta una instantánea completa del historial a un archivo JSON."""
+        with METRICA_STORE.medir(backend="JSONSnapshot", operacion="snapshot"), open(filename, 'w') as f:
             json.dump(self.tickets, f, indent=2)
 
-# 3. Cargar modelo de clasificación con manejo de errores
-MODEL_LOADED = False
-classifier = None
-
-try:
-    # Modelo específico para español
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    classifier = pipeline(
-        "zero-shot-classification",
-        model=MODEL_NAME,
-        device=0 if torch.cuda.is_available() else -1
-    )
-    MODEL_LOADED = True
-    logger.info("✅ Modelo en español cargado exitosamente")
-except Exception as e:
-    logger.error(f"⚠️ Error cargando modelo principal: {e}")
-    logger.info("🔶 Usando modelo alternativo multilingüe...")
-    try:
-        MODEL_NAME = "vicgalle/xlm-roberta-large-xnli-anli"
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-        classifier = pipeline(
+# 6. Cargar modelo de clasificación con manejo de errores
+class ClassifierProvider:
+    """
+    Carga diferida del modelo zero-shot.
+    - El modelo (y torch/transformers) se carga en la primera llamada a `get()`.
+    - `warmup()` inicia la carga en segundo plano, por ejemplo mientras arranca Gradio.
+    - En modo "keywords" nunca se carga nada y `get()` devuelve None.
+    - Con `socket` no se carga una copia propia: `get()` devuelve un ClienteInferencia
+      conectado al servidor que tiene el modelo.
+    """
+    BACKENDS = ("torch", "int8", "onnx")
+
+    def __init__(self, modelos: list, modo: str = "model", backend: str = "torch", cache_dir: str = ".cache_modelos",
+                 socket: str = None):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Backend de inferencia desconocido: '{backend}' (opciones: {', '.join(self.BACKENDS)})")
+        self.modelos = modelos
+        self.modo = modo
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.socket = socket
+        self.model_name = modelos[0]
+        self.classifier = None
+        self.tiempo_carga = None
+        self._intentado = False
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self) -> bool:
+        return self.modo != "keywords"
+
+    @property
+    def cargado(self) -> bool:
+        return self.classifier is not None
+
+    def get(self):
+        if not self.activo:
+            return None
+        if not self._intentado:
+            with self._lock:
+                if not self._intentado:
+                    self._cargar()
+        return self.classifier
+
+    def warmup(self) -> threading.Thread:
+        hilo = threading.Thread(target=self.get, name="carga-modelo", daemon=True)
+        hilo.start()
+        return hilo
+
+    def _cargar(self):
+        inicio = time.perf_counter()
+        if self.socket:
+            self._conectar_servidor(inicio)
+            self._intentado = True
+            return
+        try:
+            import torch
+            from transformers import pipeline
+        except ImportError as e:
+            logger.error(f"⚠️ No se pudo importar torch/transformers: {e}")
+            self._intentado = True
+            return
+        for i, nombre in enumerate(self.modelos):
+            if i > 0:
+                logger.info("🔶 Usando modelo alternativo multilingüe...")
+            try:
+                self.classifier = self._crear_clasificador(nombre, torch, pipeline)
+                self.model_name = nombre
+                self.tiempo_carga = time.perf_counter() - inicio
+                METRICA_CARGA_MODELO.observar(self.tiempo_carga, modelo=nombre, backend=self.backend)
+                logger.info(f"✅ Modelo {nombre} ({self.backend}) cargado exitosamente en {self.tiempo_carga:.1f}s")
+                break
+            except Exception as e:
+                logger.error(f"⚠️ Error cargando modelo {nombre}: {e}")
+        else:
+            logger.info("🔶 Usando clasificación por palabras clave como fallback")
+        self._intentado = True
+
+    def _conectar_servidor(self, inicio: float):
+        """Espera al servidor de inferencia hasta INFERENCE_CONNECT_TIMEOUT; sin él se usan palabras clave."""
+        cliente = ClienteInferencia(self.socket, INFERENCE_AUTHKEY)
+        limite = time.monotonic() + INFERENCE_CONNECT_TIMEOUT
+        while True:
+            try:
+                info = cliente.info()
+                break
+            except ConnectionError as e:
+                if time.monotonic() >= limite:
+                    logger.error(f"⚠️ Servidor de inferencia no disponible: {e}")
+                    logger.info("🔶 Usando clasificación por palabras clave como fallback")
+                    return
+                time.sleep(0.2)
+        self.classifier = cliente
+        self.model_name = info["modelo"]
+        self.backend = info["backend"]
+        self.tiempo_carga = time.perf_counter() - inicio
+        logger.info(f"✅ Conectado al servidor de inferencia {self.socket} ({self.model_name}, "
+                    f"{self.backend}, pid {info['pid']}) en {self.tiempo_carga:.1f}s")
+
+    def _crear_clasificador(self, nombre: str, torch, pipeline):
+        """Crea el clasificador con el backend configurado; si el backend falla, usa torch fp32."""
+        if self.backend != "torch":
+            ruta = os.path.join(self.cache_dir, re.sub(r"[^\w.-]", "_", nombre), self.backend)
+            try:
+                if self.backend == "int8":
+                    return self._crear_int8(nombre, ruta, torch, pipeline)
+                return self._crear_onnx(nombre, ruta, torch)
+            except Exception as e:
+                logger.error(f"⚠️ Backend {self.backend} no disponible para {nombre}, usando torch: {e}")
+                self.backend = "torch"
+        return pipeline(
             "zero-shot-classification",
-            model=MODEL_NAME,
+            model=nombre,
             device=0 if torch.cuda.is_available() else -1
         )
-        MODEL_LOADED = True
-        logger.info("✅ Modelo multilingüe cargado exitosamente")
-    except Exception as alt_e:
-        logger.error(f"⚠️ Error cargando modelo alternativo: {alt_e}")
-        logger.info("🔶 Usando clasificador aleatorio como fallback")
 
-# 4. Funciones de clasificación
-def es_urgente(text: str) -> bool:
-    text = text.lower()
-    for pattern in URGENCY_PATTERNS:
-        if re.search(pattern, text, flags=re.IGNORECASE):
-            return True
-    return False
+    @staticmethod
+    def _crear_int8(nombre: str, ruta: str, torch, pipeline):
+        """Cuantización dinámica int8 de las capas lineales; el modelo cuantizado se guarda en `ruta`."""
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        archivo = os.path.join(ruta, "modelo_int8.pt")
+        if os.path.exists(archivo):
+            modelo = torch.load(archivo, weights_only=False)
+            tokenizer = AutoTokenizer.from_pretrained(ruta)
+        else:
+            logger.info(f"Cuantizando {nombre} a int8 (solo la primera vez)...")
+            modelo = AutoModelForSequenceClassification.from_pretrained(nombre).eval()
+            modelo = torch.ao.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+            tokenizer = AutoTokenizer.from_pretrained(nombre)
+            os.makedirs(ruta, exist_ok=True)
+            tokenizer.save_pretrained(ruta)
+            temporal = f"{archivo}.{os.getpid()}.tmp"
+            torch.save(modelo, temporal)
+            os.replace(temporal, archivo)
+        return pipeline("zero-shot-classification", model=modelo, tokenizer=tokenizer, device=-1)
 
-def clasificar_con_palabras_clave(text: str) -> str:
-    text_lower = text.lower()
-    for category, pattern in CATEGORIAS.items():
-        if pattern.search(text_lower):
-            return category
-    return "otros"
+    @staticmethod
+    def _crear_onnx(nombre: str, ruta: str, torch):
+        """Exporta el modelo a ONNX una sola vez y lo ejecuta con ONNX Runtime."""
+        import onnxruntime
+        from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+        archivo = os.path.join(ruta, "model.onnx")
+        if not os.path.exists(archivo):
+            logger.info(f"Exportando {nombre} a ONNX (solo la primera vez)...")
+            modelo = AutoModelForSequenceClassification.from_pretrained(nombre).eval()
+            tokenizer = AutoTokenizer.from_pretrained(nombre)
+            muestra = tokenizer(["Mi pedido no llegó"], ["Este ticket trata sobre logística."], return_tensors="pt")
+            entradas = [n for n in ZeroShotONNX.ENTRADAS if n in muestra]
+            ejes = {n: {0: "lote", 1: "secuencia"} for n in entradas}
+            os.makedirs(ruta, exist_ok=True)
+            temporal = f"{archivo}.{os.getpid()}.tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    modelo, (), temporal, kwargs={n: muestra[n] for n in entradas},
+                    input_names=entradas, output_names=["logits"],
+                    dynamic_axes={**ejes, "logits": {0: "lote"}}, dynamo=False
+                )
+            tokenizer.save_pretrained(ruta)
+            modelo.config.save_pretrained(ruta)
+            os.replace(temporal, archivo)
+        opciones = onnxruntime.SessionOptions()
+        opciones.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sesion = onnxruntime.InferenceSession(archivo, opciones, providers=["CPUExecutionProvider"])
+        return ZeroShotONNX(sesion, AutoTokenizer.from_pretrained(ruta), AutoConfig.from_pretrained(ruta).label2id)
 
-def clasificar_texto(text: str) -> str:
-    if not MODEL_LOADED or classifier is None:
-        return clasificar_con_palabras_clave(text)
-    
+    def descripcion(self) -> str:
+        if not self.activo:
+            return "PALABRAS CLAVE"
+        if self._intentado and not self.cargado:
+            return "PALABRAS CLAVE (modelo no disponible)"
+        descripcion = self.model_name if self.backend == "torch" else f"{self.model_name} ({self.backend})"
+        return f"{descripcion} vía servidor de inferencia" if self.socket else descripcion
+
+class ZeroShotONNX:
+    """
+    Misma interfaz y puntuaciones que el pipeline zero-shot de transformers sobre una sesión de ONNX Runtime.
+    - Sin multi_label: softmax de los logits de "entailment" entre las categorías de cada texto.
+    - Con multi_label: softmax entre "contradiction" y "entailment" de cada par.
+    """
+    ENTRADAS = ("input_ids", "attention_mask", "token_type_ids")
+
+    def __init__(self, sesion, tokenizer, label2id: dict):
+        self.sesion = sesion
+        self.tokenizer = tokenizer
+        self.entradas = [entrada.name for entrada in sesion.get_inputs()]
+        ids = {etiqueta.lower(): i for etiqueta, i in label2id.items()}
+        self.entailment_id = next(i for etiqueta, i in ids.items() if etiqueta.startswith("entail"))
+        self.contradiction_id = next(i for etiqueta, i in ids.items() if etiqueta.startswith("contra"))
+
+    def logits(self, premisas: list, hipotesis: list) -> np.ndarray:
+        codificado = self.tokenizer(premisas, hipotesis, padding=True, truncation="only_first", return_tensors="np")
+        return self.sesion.run(None, {n: codificado[n].astype(np.int64) for n in self.entradas})[0]
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template="{}", multi_label=False, batch_size=8):
+        individual = isinstance(sequences, str)
+        sequences = [sequences] if individual else list(sequences)
+        candidate_labels = list(candidate_labels)
+        hipotesis = [hypothesis_template.format(label) for label in candidate_labels]
+        premisas = [texto for texto in sequences for _ in candidate_labels]
+        pares = hipotesis * len(sequences)
+        logits = np.concatenate([
+            self.logits(premisas[i:i + batch_size], pares[i:i + batch_size])
+            for i in range(0, len(premisas), batch_size)
+        ]).reshape(len(sequences), len(candidate_labels), -1)
+        if multi_label:
+            elegidos = logits[..., [self.contradiction_id, self.entailment_id]]
+            scores = np.exp(elegidos - elegidos.max(-1, keepdims=True))
+            scores = scores[..., 1] / scores.sum(-1)
+        else:
+            entailment = logits[..., self.entailment_id]
+            scores = np.exp(entailment - entailment.max(-1, keepdims=True))
+            scores = scores / scores.sum(-1, keepdims=True)
+        resultados = []
+        for texto, puntuaciones in zip(sequences, scores):
+            orden = np.argsort(puntuaciones, kind="stable")[::-1]  # como el pipeline en caso de empate
+            resultados.append({
+                "sequence": texto,
+                "labels": [candidate_labels[i] for i in orden],
+                "scores": puntuaciones[orden].tolist()
+            })
+        return resultados[0] if individual else resultados
+
+def rss_pico_mb() -> float:
+    """Pico de memoria residente del proceso (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    import resource
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+def rss_mb() -> float:
+    """
+    Memoria residente actual del proceso. En Linux se lee de /proc: el pico de ru_maxrss
+    se hereda del proceso padre a través de exec y no sirve para medir un worker recién lanzado.
+    """
     try:
-        # Usar plantillas específicas por categoría para mejor precisión
-        hypothesis_templates = [
-            f"Este ticket trata sobre {cat}." for cat in CATEGORIAS
-        ]
-        
-        result = classifier(
-            text, 
-            candidate_labels=CATEGORIAS,
-            hypothesis_template=hypothesis_templates,
-            multi_label=False
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return rss_pico_mb()
+
+class ServidorInferencia:
+    """
+    Proceso dueño del modelo zero-shot para varios procesos web (python app.py --servidor-inferencia).
+    - Escucha en un socket Unix con multiprocessing.connection y atiende cada conexión en un hilo.
+    - Cada petición trae el lote con las etiquetas y la plantilla del cliente, así que se respetan
+      las reglas vigentes en cada proceso web.
+    - Las inferencias se ejecutan de una en una: torch ya reparte cada lote entre los núcleos.
+    - El socket se crea con permisos 0600; con `authkey` se exige además autenticación HMAC.
+    """
+    def __init__(self, ruta: str, proveedor: ClassifierProvider, authkey: bytes = None):
+        self.ruta = ruta
+        self.proveedor = proveedor
+        self.authkey = authkey
+        self._listener = None
+        self._cerrado = False
+        self._conexiones = set()
+        self._lock = threading.Lock()
+
+    def iniciar(self) -> threading.Thread:
+        """Carga el modelo y acepta conexiones en un hilo; devuelve ese hilo cuando el servidor está listo."""
+        if self.proveedor.get() is None:
+            raise RuntimeError("El servidor de inferencia necesita el modelo y no se pudo cargar")
+        if os.path.exists(self.ruta):
+            try:
+                ClienteInferencia(self.ruta, self.authkey, timeout=1).info()
+            except Exception:
+                os.remove(self.ruta)  # socket huérfano de una ejecución anterior
+            else:
+                raise RuntimeError(f"Ya hay un servidor de inferencia escuchando en {self.ruta}")
+        mascara = os.umask(0o177)
+        try:
+            self._listener = Listener(self.ruta, "AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(mascara)
+        hilo = threading.Thread(target=self._aceptar, name="servidor-inferencia", daemon=True)
+        hilo.start()
+        logger.info(f"Servidor de inferencia escuchando en {self.ruta} ({self.proveedor.descripcion()})")
+        return hilo
+
+    def _aceptar(self):
+        while True:
+            try:
+                conexion = self._listener.accept()
+            except multiprocessing.AuthenticationError as e:
+                logger.warning(f"⚠️ Conexión rechazada por el servidor de inferencia: {e}")
+                continue
+            except OSError:
+                return
+            if self._cerrado:
+                conexion.close()
+                return
+            threading.Thread(target=self._atender, args=(conexion,), name="inferencia-cliente", daemon=True).start()
+
+    def _atender(self, conexion):
+        self._conexiones.add(conexion)
+        with conexion:
+            while True:
+                try:
+                    operacion, *argumentos = conexion.recv()
+                except (EOFError, OSError):
+                    self._conexiones.discard(conexion)
+                    return
+                try:
+                    respuesta = ("ok", self._ejecutar(operacion, argumentos))
+                except Exception as e:
+                    respuesta = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conexion.send(respuesta)
+                except OSError:
+                    self._conexiones.discard(conexion)
+                    return
+
+    def _ejecutar(self, operacion: str, argumentos: list):
+        if operacion == "info":
+            return self.info()
+        if operacion == "clasificar":
+            textos, opciones = argumentos
+            with self._lock:
+                return self.proveedor.get()(textos, **opciones)
+        raise ValueError(f"Operación desconocida: {operacion}")
+
+    def info(self) -> dict:
+        return {
+            "modelo": self.proveedor.model_name,
+            "backend": self.proveedor.backend,
+            "pid": os.getpid(),
+            "carga_s": self.proveedor.tiempo_carga,
+            "rss_mb": rss_mb()
+        }
+
+    def cerrar(self):
+        if self._listener is None:
+            return
+        self._cerrado = True
+        # accept() no se interrumpe al cerrar el socket desde otro hilo: se despierta con una conexión
+        with contextlib.suppress(Exception):
+            Client(self.ruta, "AF_UNIX", authkey=self.authkey).close()
+        self._listener.close()
+        self._listener = None
+        # Los clientes conectados reciben EOF, como si el proceso del servidor hubiera terminado
+        for conexion in list(self._conexiones):
+            with contextlib.suppress(OSError), socket.fromfd(conexion.fileno(), socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.shutdown(socket.SHUT_RDWR)
+
+class ClienteInferencia:
+    """
+    Clasificador con la interfaz del pipeline zero-shot que delega en un ServidorInferencia.
+    Cada hilo usa su propia conexión; si el servidor se reinició, la petición se reintenta una vez.
+    """
+    def __init__(self, ruta: str, authkey: bytes = None, timeout: float = INFERENCE_TIMEOUT):
+        self.ruta = ruta
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _descartar(self):
+        conexion = getattr(self._local, "conexion", None)
+        self._local.conexion = None
+        if conexion is not None:
+            with contextlib.suppress(OSError):
+                conexion.close()
+
+    def _llamar(self, *mensaje):
+        for intento in (1, 2):
+            try:
+                if getattr(self._local, "conexion", None) is None:
+                    self._local.conexion = Client(self.ruta, "AF_UNIX", authkey=self.authkey)
+                self._local.conexion.send(mensaje)
+                if not self._local.conexion.poll(self.timeout):
+                    self._descartar()
+                    raise TimeoutError(f"El servidor de inferencia no respondió en {self.timeout}s")
+                estado, valor = self._local.conexion.recv()
+                break
+            except TimeoutError:
+                raise
+            except (OSError, EOFError) as e:
+                self._descartar()
+                if intento == 2:
+                    raise ConnectionError(f"{self.ruta}: {e or type(e).__name__}") from e
+        if estado == "error":
+            raise RuntimeError(f"Servidor de inferencia: {valor}")
+        return valor
+
+    def info(self) -> dict:
+        return self._llamar("info")
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template="{}", multi_label=False, batch_size=8):
+        opciones = {"candidate_labels": list(candidate_labels), "hypothesis_template": hypothesis_template,
+                    "multi_label": multi_label, "batch_size": batch_size}
+        return self._llamar("clasificar", sequences, opciones)
+
+proveedor_modelo = ClassifierProvider(MODELOS, TICKET_CLASSIFIER_MODE, TICKET_INFERENCE_BACKEND, MODEL_CACHE_DIR,
+                                      INFERENCE_SOCKET)
+
+class EmbeddingClassifier:
+    """
+    Motor rápido por similitud de embeddings.
+    - Las descripciones de categoría se codifican una sola vez por conjunto de reglas y se guardan en `cache_dir`.
+    - Cada ticket necesita una pasada del encoder y un producto matricial, sin importar
+      cuántas categorías haya.
+    - Devuelve puntuaciones tipo probabilidad (softmax de similitudes) para poder aplicar
+      los umbrales, y el margen entre las dos mejores similitudes para detectar casos ambiguos.
+    """
+    def __init__(self, model_name: str, descripciones: dict, cache_dir: str = ".cache_embeddings",
+                 temperatura: float = 0.05):
+        self.model_name = model_name
+        self.descripciones = descripciones
+        self.cache_dir = cache_dir
+        self.temperatura = temperatura
+        self.etiquetas = list(descripciones)
+        self._tokenizer = None
+        self._model = None
+        self._embeddings_etiquetas = {}
+        self._intentado = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Carga el encoder en el primer uso; devuelve None si no está disponible."""
+        if not self._intentado:
+            with self._lock:
+                if not self._intentado:
+                    try:
+                        from transformers import AutoTokenizer, AutoModel
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                        self._model = AutoModel.from_pretrained(self.model_name).eval()
+                        logger.info(f"✅ Encoder {self.model_name} cargado exitosamente")
+                    except Exception as e:
+                        logger.error(f"⚠️ Error cargando encoder {self.model_name}: {e}")
+                    self._intentado = True
+        return self._model
+
+    def codificar(self, textos: list, batch_size: int = 32) -> np.ndarray:
+        """Embeddings normalizados (mean pooling) de los textos."""
+        import torch
+        vectores = []
+        for inicio in range(0, len(textos), batch_size):
+            entradas = self._tokenizer(textos[inicio:inicio + batch_size], padding=True, truncation=True,
+                                       max_length=128, return_tensors="pt")
+            with torch.inference_mode():
+                salida = self._model(**entradas).last_hidden_state
+            mascara = entradas["attention_mask"].unsqueeze(-1).to(salida.dtype)
+            media = (salida * mascara).sum(1) / mascara.sum(1).clamp(min=1e-9)
+            vectores.append(torch.nn.functional.normalize(media, dim=1).numpy())
+        return np.concatenate(vectores) if vectores else np.zeros((0, 0), dtype=np.float32)
+
+    def embeddings_etiquetas(self, descripciones: dict = None) -> np.ndarray:
+        descripciones = descripciones or self.descripciones
+        clave = hashlib.sha256(
+            json.dumps([self.model_name, descripciones], sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        if clave not in self._embeddings_etiquetas:
+            ruta = os.path.join(self.cache_dir, f"etiquetas_{clave}.npy")
+            if os.path.exists(ruta):
+                self._embeddings_etiquetas[clave] = np.load(ruta)
+            else:
+                self._embeddings_etiquetas[clave] = self.codificar(list(descripciones.values()))
+                os.makedirs(self.cache_dir, exist_ok=True)
+                np.save(ruta, self._embeddings_etiquetas[clave])
+        return self._embeddings_etiquetas[clave]
+
+    def clasificar(self, textos: list, batch_size: int = 32, descripciones: dict = None):
+        """Devuelve (etiquetas, puntuaciones, márgenes) para cada texto (`descripciones` por categoría)."""
+        descripciones = descripciones or self.descripciones
+        etiquetas = list(descripciones)
+        similitudes = self.codificar(textos, batch_size) @ self.embeddings_etiquetas(descripciones).T
+        orden = np.argsort(-similitudes, axis=1)
+        filas = np.arange(len(textos))
+        mejores = similitudes[filas, orden[:, 0]]
+        # Con una sola categoría (posible en un archivo de reglas) no hay segunda: el margen es la similitud
+        margenes = mejores - similitudes[filas, orden[:, 1]] if len(etiquetas) > 1 else mejores.copy()
+        exponentes = np.exp((similitudes - mejores[:, None]) / self.temperatura)
+        puntuaciones = 1.0 / exponentes.sum(axis=1)
+        return [etiquetas[i] for i in orden[:, 0]], puntuaciones, margenes
+
+proveedor_embeddings = EmbeddingClassifier(EMBEDDING_MODEL_NAME, DESCRIPCIONES_CATEGORIAS, EMBEDDING_CACHE_DIR)
+
+def __getattr__(name):
+    """Compatibilidad con los nombres globales anteriores (carga diferida)."""
+    if name == "classifier":
+        return proveedor_modelo.get()
+    if name == "matcher_palabras_clave":
+        return proveedor_reglas.actual().matcher
+    if name == "MODEL_LOADED":
+        return proveedor_modelo.get() is not None
+    if name == "MODEL_NAME":
+        return proveedor_modelo.model_name
+    if name == "demo":
+        globals()["demo"] = crear_interfaz()
+        return globals()["demo"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 7. Caché de clasificación
+class ClasificacionCache:
+    """
+    Caché LRU de resultados de clasificación.
+    - La clave es un hash del texto normalizado, el modelo y la versión de las reglas.
+    - Si se indica `ruta`, los resultados también se guardan en SQLite y sobreviven a reinicios.
+      Cada lote se consulta con un SELECT y se guarda con un solo commit (`get_muchos` / `set_muchos`);
+      el modo WAL permite que varios procesos (--workers) compartan el archivo. Si SQLite falla
+      (por ejemplo, bloqueado por otro proceso), se sigue solo con la memoria.
+    """
+    def __init__(self, max_entradas: int = 10000, ruta: str = None):
+        self.max_entradas = max_entradas
+        self.ruta = ruta
+        self.aciertos = 0
+        self.fallos = 0
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if ruta:
+            self._conn = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (clave TEXT PRIMARY KEY, valor TEXT)")
+            self._conn.commit()
+
+    @staticmethod
+    def normalizar(texto: str) -> str:
+        return " ".join(str(texto).lower().split())
+
+    def clave(self, tipo: str, texto: str, motor: str = "") -> str:
+        """`motor` identifica el modelo que produce el resultado (vacío si no depende de él)."""
+        return self.claves(tipo, [texto], motor)[0]
+
+    def claves(self, tipo: str, textos: list, motor: str = "") -> list:
+        """Claves de varios textos; la configuración se serializa una sola vez por lote."""
+        config = json.dumps([tipo, motor, proveedor_reglas.actual().version], sort_keys=True, ensure_ascii=False)
+        return [hashlib.sha256(f"{config}\n{self.normalizar(texto)}".encode("utf-8")).hexdigest() for texto in textos]
+
+    def get(self, clave: str):
+        return self.get_muchos([clave]).get(clave)
+
+    def get_muchos(self, claves: list) -> dict:
+        """
+        Resultados guardados de `claves` (sin repetidas), como dict clave -> valor. Las que no
+        están en memoria se buscan en SQLite con una consulta por cada tramo de 500 claves.
+        """
+        encontrados = {}
+        with self._lock:
+            faltan = []
+            for clave in claves:
+                if clave in self._memoria:
+                    self._memoria.move_to_end(clave)
+                    encontrados[clave] = self._memoria[clave]
+                else:
+                    faltan.append(clave)
+            if faltan and self._conn is not None:
+                try:
+                    for inicio in range(0, len(faltan), 500):
+                        tramo = faltan[inicio:inicio + 500]
+                        filas = self._conn.execute(
+                            f"SELECT clave, valor FROM cache WHERE clave IN ({', '.join('?' * len(tramo))})", tramo
+                        ).fetchall()
+                        for clave, valor in filas:
+                            encontrados[clave] = json.loads(valor)
+                            self._guardar_en_memoria(clave, encontrados[clave])
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ No se pudo leer la caché persistente: {e}")
+            aciertos, fallos = len(encontrados), len(claves) - len(encontrados)
+            self.aciertos += aciertos
+            self.fallos += fallos
+        self._contar(aciertos, fallos)
+        return encontrados
+
+    def set(self, clave: str, valor):
+        self.set_muchos([(clave, valor)])
+
+    def set_muchos(self, pares: list):
+        """Guarda pares (clave, valor); en SQLite, con un solo executemany y un commit."""
+        with self._lock:
+            for clave, valor in pares:
+                self._guardar_en_memoria(clave, valor)
+            if self._conn is None or not pares:
+                return
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (clave, valor) VALUES (?, ?)",
+                    [(clave, json.dumps(valor, ensure_ascii=False)) for clave, valor in pares]
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                # La persistencia es una optimización: un archivo bloqueado no debe detener la clasificación
+                with contextlib.suppress(sqlite3.Error):
+                    self._conn.rollback()
+                logger.warning(f"⚠️ No se pudo guardar en la caché persistente: {e}")
+
+    def registrar_acierto(self, n: int = 1):
+        """Cuenta como aciertos los duplicados resueltos dentro de un mismo lote."""
+        with self._lock:
+            self.aciertos += n
+        self._contar(n, 0)
+
+    @staticmethod
+    def _contar(aciertos: int, fallos: int):
+        if aciertos:
+            METRICA_CACHE.inc(aciertos, resultado="acierto")
+        if fallos:
+            METRICA_CACHE.inc(fallos, resultado="fallo")
+        contadores_clasificacion.sumar_medidas(cache_aciertos=aciertos, cache_fallos=fallos)
+
+    def _guardar_en_memoria(self, clave: str, valor):
+        if self.max_entradas <= 0:
+            return
+        self._memoria[clave] = valor
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._memoria.clear()
+            self.aciertos = 0
+            self.fallos = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM cache")
+                self._conn.commit()
+
+    def estadisticas(self) -> dict:
+        consultas = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+            "entradas": len(self._memoria)
+        }
+
+cache_clasificacion = ClasificacionCache(
+    max_entradas=int(os.getenv("TICKET_CACHE_SIZE", "10000")),
+    ruta=os.getenv("TICKET_CACHE_PATH")
+)
+
+# 8. Reglas de clasificación
+def _compilar_minusculas(patron: str, partes: list = None) -> re.Pattern:
+    """
+    Compila un patrón que se buscará en texto ya pasado a minúsculas. Si el patrón (o las `partes`
+    con que se construyó) no tiene mayúsculas no hace falta IGNORECASE, que desactiva la búsqueda
+    rápida de literales de `re` (con él, el mismo patrón es varias veces más lento).
+    """
+    minusculas = all(parte == parte.lower() for parte in (partes if partes is not None else [patron]))
+    return re.compile(patron) if minusculas else re.compile(patron, re.IGNORECASE)
+
+class MatcherPalabrasClave:
+    """
+    Palabras clave por categoría y patrones de urgencia, precompilados una sola vez.
+    - Las categorías forman una sola alternación de grupos con nombre, en orden de prioridad.
+      `categoria` recorre el texto con ella: en cada posición con coincidencia gana la categoría
+      más prioritaria, y la búsqueda sigue desde la posición siguiente (así no se pierden
+      coincidencias solapadas) hasta encontrar la primera categoría o llegar al final.
+      El resultado es el del recorrido original: la primera categoría que aparece en el texto.
+    - La urgencia es un regex aparte, que solo se evalúa cuando se pide.
+    """
+    def __init__(self, categorias: dict, patrones_urgencia: list):
+        self.nombres = list(categorias)
+        self.grupos = [f"c{i}" for i in range(len(self.nombres))]
+        self._prioridad = {grupo: i for i, grupo in enumerate(self.grupos)}
+        patrones = [pattern.pattern for pattern in categorias.values()]
+        self.patrones = [_compilar_minusculas(patron) for patron in patrones]
+        self.regex = _compilar_minusculas(
+            "|".join(f"(?P<{grupo}>{patron})" for grupo, patron in zip(self.grupos, patrones)), patrones
         )
-        
-        # Umbral de confianza ajustable por categoría
-        umbrales = {
-            "logística": 0.4,  # Umbral más bajo por la ambigüedad natural
-            "otros": 0.3,
-            "default": 0.5
+        self.regex_urgencia = _compilar_minusculas("|".join(f"(?:{patron})" for patron in patrones_urgencia),
+                                                   patrones_urgencia)
+
+    def categoria(self, texto: str) -> str:
+        """La categoría de mayor prioridad cuyas palabras clave aparecen en el texto, u "otros"."""
+        texto = texto.lower()
+        mejor, posicion = len(self.nombres), 0
+        while mejor:
+            match = self.regex.search(texto, posicion)
+            if match is None:
+                break
+            mejor = min(mejor, self._prioridad[match.lastgroup])
+            posicion = match.start() + 1
+        return self.nombres[mejor] if mejor < len(self.nombres) else "otros"
+
+    def coincidencias(self, texto: str) -> list:
+        """Todas las categorías cuyas palabras clave aparecen en el texto, en orden de prioridad."""
+        texto = texto.lower()
+        return [nombre for nombre, pattern in zip(self.nombres, self.patrones) if pattern.search(texto)]
+
+    def analizar(self, texto: str) -> tuple:
+        """Devuelve (categoría, urgente)."""
+        return self.categoria(texto), self.es_urgente(texto)
+
+    def es_urgente(self, texto: str) -> bool:
+        return self.regex_urgencia.search(texto.lower()) is not None
+
+    def analizar_serie(self, textos: pd.Series) -> pd.DataFrame:
+        """Columnas `categoria` y `urgente` para una Serie de textos."""
+        textos = textos.astype(str)
+        return pd.DataFrame({
+            "categoria": pd.Series([self.categoria(texto) for texto in textos], index=textos.index, dtype=object),
+            "urgente": pd.Series([self.es_urgente(texto) for texto in textos], index=textos.index, dtype=bool)
+        }, index=textos.index)
+
+class ReglasClasificacion:
+    """
+    Conjunto inmutable de reglas: palabras clave por categoría, patrones de urgencia, umbrales,
+    plantilla de hipótesis y descripciones para el motor de embeddings.
+    Se compila una sola vez; `version` identifica el contenido y acompaña a cada resultado.
+    """
+    def __init__(self, categorias: dict, urgencia: list, umbrales: dict, plantilla: str, descripciones: dict = None):
+        if not categorias or not urgencia:
+            raise ValueError("Las reglas necesitan al menos una categoría y un patrón de urgencia")
+        if "default" not in umbrales:
+            raise ValueError("Los umbrales deben incluir la clave 'default'")
+        if "{}" not in plantilla:
+            raise ValueError("La plantilla de hipótesis debe contener '{}'")
+        try:
+            self.categorias = {nombre: re.compile(patron, re.IGNORECASE) for nombre, patron in categorias.items()}
+            self.matcher = MatcherPalabrasClave(self.categorias, list(urgencia))
+        except re.error as e:
+            raise ValueError(f"Expresión regular no válida en las reglas: {e}") from e
+        descripciones = descripciones or {}
+        self.datos = {
+            "categorias": dict(categorias),
+            "urgencia": list(urgencia),
+            "umbrales": {clave: float(valor) for clave, valor in umbrales.items()},
+            "plantilla": plantilla,
+            "descripciones": {nombre: descripciones.get(nombre, DESCRIPCIONES_CATEGORIAS.get(nombre, nombre))
+                              for nombre in categorias}
         }
-        
-        top_label = result['labels'][0]
-        top_score = result['scores'][0]
-        umbral = umbrales.get(top_label, umbrales["default"])
-        
-        if top_score >= umbral:
-            return top_label
-        
-        # Si confianza baja, usar sistema de palabras clave
-        return clasificar_con_palabras_clave(text)
+        self.nombres = list(categorias)
+        self.urgencia = self.datos["urgencia"]
+        self.umbrales = self.datos["umbrales"]
+        self.plantilla = plantilla
+        self.descripciones = self.datos["descripciones"]
+        contenido = json.dumps(self.datos, sort_keys=True, ensure_ascii=False)
+        self.version = hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:12]
+
+    def __reduce__(self):
+        # Los workers reciben solo los datos y compilan cada versión una vez por proceso
+        return _reglas_compiladas, (self.version, self.datos)
+
+    @classmethod
+    def desde_archivo(cls, ruta: str) -> "ReglasClasificacion":
+        """Lee las reglas de un archivo JSON o YAML (las claves ausentes toman los valores por defecto)."""
+        with open(ruta, encoding="utf-8") as f:
+            if os.path.splitext(ruta)[1].lower() in (".yaml", ".yml"):
+                try:
+                    import yaml
+                except ImportError as e:
+                    raise ImportError("Para reglas en YAML instale PyYAML (pip install pyyaml)") from e
+                datos = yaml.safe_load(f)
+            else:
+                datos = json.load(f)
+        if not isinstance(datos, dict):
+            raise ValueError(f"{ruta}: se esperaba un objeto con las claves {sorted(REGLAS_POR_DEFECTO.datos)}")
+        desconocidas = set(datos) - set(REGLAS_POR_DEFECTO.datos)
+        if desconocidas:
+            raise ValueError(f"{ruta}: claves desconocidas {sorted(desconocidas)}")
+        return cls(**{**REGLAS_POR_DEFECTO.datos, **datos})
+
+_cache_reglas = {}
+
+def _reglas_compiladas(version: str, datos: dict) -> ReglasClasificacion:
+    if version not in _cache_reglas:
+        _cache_reglas[version] = ReglasClasificacion(**datos)
+    return _cache_reglas[version]
+
+REGLAS_POR_DEFECTO = ReglasClasificacion(
+    {categoria: pattern.pattern for categoria, pattern in CATEGORIAS.items()},
+    URGENCY_PATTERNS, UMBRALES, HYPOTHESIS_TEMPLATE, DESCRIPCIONES_CATEGORIAS
+)
+
+class ProveedorReglas:
+    """
+    Reglas vigentes, recargadas en caliente cuando cambia el archivo `ruta` (JSON o YAML).
+    - El archivo se revisa como mucho cada `intervalo` segundos (fecha de modificación y tamaño).
+    - Las reglas nuevas se compilan antes del cambio y se publican con una sola asignación,
+      sin reiniciar el servidor ni recargar el modelo.
+    - Si el archivo modificado no es válido se registra el error y siguen las reglas anteriores.
+    - `fijar()` mantiene las mismas reglas en el hilo actual durante un lote o un archivo completo.
+    """
+    def __init__(self, ruta: str = None, intervalo: float = 2.0):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self._reglas = REGLAS_POR_DEFECTO
+        self._firma_archivo = None
+        self._revisado = 0.0
+        self._lock = threading.Lock()
+        self._fijadas = contextvars.ContextVar(f"reglas_fijadas_{id(self)}", default=None)
+        if ruta:
+            # Al arrancar, un archivo inválido es un error de configuración
+            self._reglas = ReglasClasificacion.desde_archivo(ruta)
+            self._firma_archivo = self._firma()
+            logger.info(f"Reglas {self._reglas.version} cargadas de {ruta}")
+
+    def _firma(self):
+        estado = os.stat(self.ruta)
+        return estado.st_mtime_ns, estado.st_size
+
+    def actual(self) -> ReglasClasificacion:
+        fijadas = self._fijadas.get()
+        if fijadas is not None:
+            return fijadas
+        if self.ruta and time.monotonic() - self._revisado >= self.intervalo:
+            self.recargar()
+        return self._reglas
+
+    def recargar(self) -> bool:
+        """Vuelve a leer el archivo si cambió; devuelve True si se publicaron reglas nuevas."""
+        with self._lock:
+            self._revisado = time.monotonic()
+            try:
+                firma = self._firma()
+                if firma == self._firma_archivo:
+                    return False
+                reglas = ReglasClasificacion.desde_archivo(self.ruta)
+            except Exception as e:
+                logger.error(f"⚠️ No se pudieron recargar las reglas de {self.ruta}: {e}. "
+                             f"Se mantienen las reglas {self._reglas.version}")
+                return False
+            self._firma_archivo = firma
+            if reglas.version == self._reglas.version:
+                return False
+            self._reglas = reglas
+            logger.info(f"Reglas {reglas.version} recargadas de {self.ruta}")
+            return True
+
+    @contextlib.contextmanager
+    def fijar(self, reglas: ReglasClasificacion = None):
+        reglas = reglas or self.actual()
+        token = self._fijadas.set(reglas)
+        try:
+            yield reglas
+        finally:
+            self._fijadas.reset(token)
+
+proveedor_reglas = ProveedorReglas(RULES_PATH, RULES_CHECK_INTERVAL)
+
+# 9. Funciones de clasificación
+def es_urgente(text: str) -> bool:
+    # Sin caché: el regex de urgencia cuesta menos que calcular la clave y consultarla
+    return proveedor_reglas.actual().matcher.es_urgente(text)
+
+def clasificar_con_palabras_clave(text: str) -> str:
+    return proveedor_reglas.actual().matcher.categoria(text)
+
+def clasificar_con_palabras_clave_serie(textos: pd.Series) -> pd.Series:
+    """clasificar_con_palabras_clave para columnas completas (sin evaluar la urgencia)."""
+    categoria = proveedor_reglas.actual().matcher.categoria
+    return pd.Series([categoria(t) for t in textos.astype(str)], index=textos.index, dtype=object)
+
+class ContadoresClasificacion:
+    """
+    Contadores acumulados de cómo se resolvió cada ticket clasificado (sin contar la caché):
+    - palabras_clave: reglas (cascada decisiva o sin modelo disponible)
+    - modelo: el modelo superó el umbral de su categoría
+    - respaldo: el modelo no superó el umbral y se usaron palabras clave
+    - muestras_cascada / acuerdos_cascada: tickets decisivos también evaluados por el modelo
+    Los totales son de todo el proceso. Para contar solo una llamada (un archivo, un trabajo)
+    se usa `medir()`, que no mezcla lo que clasifican a la vez otros hilos o peticiones.
+    """
+    CAMPOS = ("palabras_clave", "modelo", "respaldo", "muestras_cascada", "acuerdos_cascada")
+    # Solo en las medidas: la caché ya lleva sus propios totales
+    CAMPOS_CACHE = ("cache_aciertos", "cache_fallos")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = dict.fromkeys(self.CAMPOS, 0)
+        self._medidas = contextvars.ContextVar(f"medidas_{id(self)}", default=())
+
+    def sumar(self, **valores):
+        with self._lock:
+            for campo, valor in valores.items():
+                self._valores[campo] += int(valor)
+        self.sumar_medidas(**valores)
+
+    def sumar_medidas(self, **valores):
+        """Suma a las medidas abiertas con `medir()` en el contexto actual."""
+        medidas = self._medidas.get()
+        if medidas:
+            with self._lock:
+                for medida in medidas:
+                    for campo, valor in valores.items():
+                        medida[campo] += int(valor)
+
+    @contextlib.contextmanager
+    def medir(self):
+        """
+        Devuelve un dict con los contadores (CAMPOS y CAMPOS_CACHE) de lo clasificado dentro
+        del bloque en este hilo o contexto; las medidas anidadas se suman todas.
+        """
+        medida = dict.fromkeys(self.CAMPOS + self.CAMPOS_CACHE, 0)
+        token = self._medidas.set(self._medidas.get() + (medida,))
+        try:
+            yield medida
+        finally:
+            self._medidas.reset(token)
+
+    def instantanea(self) -> dict:
+        with self._lock:
+            return dict(self._valores)
+
+contadores_clasificacion = ContadoresClasificacion()
+
+def _registrar_nivel(nivel: str, n: int, segundos: float):
+    """Suma `n` tickets resueltos por `nivel`, con `segundos` de latencia media por ticket."""
+    if n:
+        contadores_clasificacion.sumar(**{nivel: n})
+        METRICA_LATENCIA.observar(segundos, n, nivel=nivel)
+
+def _aplicar_umbrales(textos: pd.Series, etiquetas: list, puntuaciones: list, inicio: float = None) -> tuple:
+    """
+    Aplica los umbrales por categoría y usa palabras clave en los tickets de baja confianza.
+    Devuelve (categorias, puntuaciones); la puntuación es None si la categoría sale de las palabras clave.
+    `inicio` es el instante en que empezó la inferencia del lote (para la latencia por ticket).
+    """
+    umbrales = proveedor_reglas.actual().umbrales
+    etiquetas = pd.Series(etiquetas, index=textos.index, dtype=object)
+    umbral = etiquetas.map(umbrales).fillna(umbrales["default"])
+    baja_confianza = pd.Series(puntuaciones, index=textos.index) < umbral
+    puntuaciones = [None if baja else float(p) for baja, p in zip(baja_confianza, puntuaciones)]
+    if baja_confianza.any():
+        etiquetas[baja_confianza] = clasificar_con_palabras_clave_serie(textos[baja_confianza])
+    respaldo = int(baja_confianza.sum())
+    segundos = (time.perf_counter() - inicio) / len(textos) if inicio is not None and len(textos) else 0.0
+    _registrar_nivel("modelo", len(textos) - respaldo, segundos)
+    _registrar_nivel("respaldo", respaldo, segundos)
+    return etiquetas.tolist(), puntuaciones
+
+def _usar_embeddings() -> bool:
+    return TICKET_CLASSIFIER_ENGINE == "embeddings" and proveedor_modelo.activo and proveedor_embeddings.get() is not None
+
+def _motor_activo() -> str:
+    """Identifica el motor que produce las categorías (forma parte de la clave de caché)."""
+    if _usar_embeddings():
+        motor = f"embeddings:{proveedor_embeddings.model_name}:{EMBEDDING_MARGIN}"
+    elif proveedor_modelo.get() is not None:
+        motor = proveedor_modelo.model_name
+        if proveedor_modelo.backend != "torch":
+            motor += f":{proveedor_modelo.backend}"
+    else:
+        return "palabras_clave"
+    return f"cascada:{motor}" if TICKET_CASCADE else motor
+
+def _inferir_nli(classifier, textos: list, batch_size: int = None):
+    """Devuelve (etiquetas, puntuaciones) del modelo zero-shot."""
+    reglas = proveedor_reglas.actual()
+    resultados = classifier(
+        textos,
+        candidate_labels=reglas.nombres,
+        hypothesis_template=reglas.plantilla,
+        multi_label=False,
+        batch_size=batch_size or BATCH_SIZE
+    )
+    if isinstance(resultados, dict):
+        resultados = [resultados]
+    return [r['labels'][0] for r in resultados], [r['scores'][0] for r in resultados]
+
+def _inferir_modelo(textos: pd.Series, batch_size: int = None) -> tuple:
+    """Devuelve (etiquetas, puntuaciones) del motor configurado (embeddings o NLI), sin umbrales."""
+    if _usar_embeddings():
+        etiquetas, puntuaciones, margenes = proveedor_embeddings.clasificar(
+            textos.tolist(), batch_size or BATCH_SIZE, proveedor_reglas.actual().descripciones
+        )
+        ambiguos = np.flatnonzero(margenes < EMBEDDING_MARGIN)
+        classifier = proveedor_modelo.get() if len(ambiguos) else None
+        if classifier is not None:
+            etiquetas_nli, puntuaciones_nli = _inferir_nli(classifier, textos.iloc[ambiguos].tolist(), batch_size)
+            for i, etiqueta, puntuacion in zip(ambiguos, etiquetas_nli, puntuaciones_nli):
+                etiquetas[i], puntuaciones[i] = etiqueta, puntuacion
+        return list(etiquetas), list(puntuaciones)
+    return _inferir_nli(proveedor_modelo.get(), textos.tolist(), batch_size)
+
+def _clasificar_con_modelo(textos: pd.Series, batch_size: int = None) -> tuple:
+    """Clasifica con el motor configurado (embeddings o NLI) y aplica los umbrales."""
+    inicio = time.perf_counter()
+    etiquetas, puntuaciones = _inferir_modelo(textos, batch_size)
+    return _aplicar_umbrales(textos, etiquetas, puntuaciones, inicio)
+
+def _en_muestra_cascada(texto: str) -> bool:
+    """Muestreo determinista por hash: el mismo texto cae siempre en la misma decisión."""
+    return zlib.crc32(texto.encode("utf-8")) % 10000 < CASCADE_SAMPLE_RATE * 10000
+
+def _clasificar_en_cascada(textos: pd.Series, batch_size: int = None) -> tuple:
+    """
+    Los tickets con exactamente una categoría por palabras clave se resuelven con las reglas;
+    los que no coinciden con ninguna o con varias van al modelo. Una muestra de los decisivos
+    también pasa por el modelo para medir el acuerdo entre ambos niveles.
+    """
+    inicio = time.perf_counter()
+    matcher = proveedor_reglas.actual().matcher
+    coincidencias = [matcher.coincidencias(texto) for texto in textos]
+    decisivos = np.array([len(c) == 1 for c in coincidencias], dtype=bool)
+    categorias = [c[0] if len(c) == 1 else None for c in coincidencias]
+    puntuaciones = [None] * len(textos)
+    muestra = np.flatnonzero(decisivos & np.array([_en_muestra_cascada(t) for t in textos], dtype=bool))
+    al_modelo = np.flatnonzero(~decisivos)
+    _registrar_nivel("palabras_clave", int(decisivos.sum()), (time.perf_counter() - inicio) / len(textos))
+
+    if len(al_modelo) or len(muestra):
+        # Un solo paso por el modelo; los umbrales y el respaldo solo se aplican a los no decisivos
+        inicio_modelo = time.perf_counter()
+        etiquetas, puntuaciones_modelo = _inferir_modelo(textos.iloc[np.concatenate([al_modelo, muestra])], batch_size)
+        n = len(al_modelo)
+        if n:
+            finales = _aplicar_umbrales(textos.iloc[al_modelo], etiquetas[:n], puntuaciones_modelo[:n], inicio_modelo)
+            for i, categoria, puntuacion in zip(al_modelo, *finales):
+                categorias[i], puntuaciones[i] = categoria, puntuacion
+        # El acuerdo se mide con la etiqueta del modelo antes del umbral: tras el respaldo, una
+        # respuesta de baja confianza ya sería la categoría de las palabras clave y contaría como acuerdo
+        acuerdos = sum(etiqueta == categorias[i] for i, etiqueta in zip(muestra, etiquetas[n:]))
+        contadores_clasificacion.sumar(muestras_cascada=len(muestra), acuerdos_cascada=acuerdos)
+    return categorias, puntuaciones
+
+def _clasificar_lote_modelo(textos: pd.Series, batch_size: int = None) -> tuple:
+    """Ejecuta el modelo sobre el lote y devuelve (categorias, puntuaciones); las excepciones se propagan."""
+    if not _usar_embeddings() and proveedor_modelo.get() is None:
+        inicio = time.perf_counter()
+        categorias = clasificar_con_palabras_clave_serie(textos).tolist()
+        _registrar_nivel("palabras_clave", len(textos), (time.perf_counter() - inicio) / len(textos))
+        return categorias, [None] * len(textos)
+    if TICKET_CASCADE:
+        return _clasificar_en_cascada(textos, batch_size)
+    return _clasificar_con_modelo(textos, batch_size)
+
+def clasificar_lote_con_puntuacion(texts, batch_size: int = None) -> list:
+    """
+    Clasifica una lista de textos en lote y devuelve pares (categoria, puntuacion).
+    - Los textos ya vistos (normalizados) se resuelven desde la caché.
+    - El modelo procesa `batch_size` pares premisa/hipótesis por pasada.
+    - Los umbrales y el respaldo por palabras clave se aplican de forma vectorizada.
+    - La puntuación es la confianza del modelo, o None si decidieron las palabras clave.
+    - Todo el lote se clasifica con las mismas reglas aunque se recarguen mientras tanto.
+    """
+    with proveedor_reglas.fijar():
+        return _clasificar_lote_con_puntuacion(texts, batch_size)
+
+def _clasificar_lote_con_puntuacion(texts, batch_size: int = None) -> list:
+    textos = [str(t) for t in texts]
+    if not textos:
+        return []
+
+    resultados = [None] * len(textos)
+    posiciones = OrderedDict()  # clave -> posiciones del lote con ese texto
+    for i, clave in enumerate(cache_clasificacion.claves("clasificacion", textos, _motor_activo())):
+        posiciones.setdefault(clave, []).append(i)
+    if len(posiciones) < len(textos):
+        # Los repetidos dentro del lote se resuelven con el primero
+        cache_clasificacion.registrar_acierto(len(textos) - len(posiciones))
+    guardados = cache_clasificacion.get_muchos(list(posiciones))
+    pendientes = OrderedDict()  # clave -> posiciones que esperan el resultado
+    for clave, lista in posiciones.items():
+        if clave in guardados:
+            for i in lista:
+                resultados[i] = tuple(guardados[clave])
+        else:
+            pendientes[clave] = lista
+    if not pendientes:
+        return resultados
+
+    unicos = pd.Series([textos[posiciones[0]] for posiciones in pendientes.values()], dtype=object)
+    try:
+        categorias, puntuaciones = _clasificar_lote_modelo(unicos, batch_size)
+        guardar = True
     except Exception as e:
         logger.error(f"⚠️ Error en clasificación: {e}")
-        return clasificar_con_palabras_clave(text)
+        categorias, puntuaciones = clasificar_con_palabras_clave_serie(unicos).tolist(), [None] * len(unicos)
+        guardar = False
+    for lista, resultado in zip(pendientes.values(), zip(categorias, puntuaciones)):
+        for i in lista:
+            resultados[i] = resultado
+    if guardar:
+        cache_clasificacion.set_muchos([(clave, list(resultado)) for clave, resultado in
+                                        zip(pendientes, zip(categorias, puntuaciones))])
+    return resultados
+
+def clasificar_lote(texts, batch_size: int = None) -> list:
+    """Clasifica una lista de textos en lote (solo las categorías)."""
+    return [categoria for categoria, _ in clasificar_lote_con_puntuacion(texts, batch_size)]
+
+def clasificar_texto(text: str) -> str:
+    return clasificar_lote([text])[0]
+
+# 10. Función para procesar archivos CSV
+class ConjuntoHashes:
+    """
+    Conjunto compacto de hashes de 64 bits para contar duplicados en streaming.
+    Guarda 8 bytes por descripción única en arrays ordenados de numpy que se
+    fusionan por niveles, de modo que las búsquedas son O(log n) por nivel.
+    """
+    def __init__(self):
+        self._niveles = []
+
+    def __len__(self):
+        return sum(len(nivel) for nivel in self._niveles)
+
+    def agregar(self, hashes) -> np.ndarray:
+        """Agrega los hashes y devuelve una máscara con los que ya se habían visto."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        _, primeros = np.unique(hashes, return_index=True)
+        repetidos = np.ones(len(hashes), dtype=bool)
+        repetidos[primeros] = False
+        for nivel in self._niveles:
+            posiciones = np.minimum(np.searchsorted(nivel, hashes), len(nivel) - 1)
+            repetidos |= nivel[posiciones] == hashes
+        nuevos = np.unique(hashes[~repetidos])
+        if len(nuevos):
+            self._niveles.append(nuevos)
+        while len(self._niveles) > 1 and len(self._niveles[-2]) <= 2 * len(self._niveles[-1]):
+            ultimo = self._niveles.pop()
+            self._niveles[-1] = np.sort(np.concatenate([self._niveles[-1], ultimo]))
+        return repetidos
+
+def _mezclar_hash(x: np.ndarray) -> np.ndarray:
+    """Mezcla splitmix64: hashes de 64 bits bien distribuidos a partir de enteros cualesquiera."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+class AgrupadorDuplicados:
+    """
+    Agrupa tickets casi duplicados con MinHash y LSH.
+    - Normaliza el texto: minúsculas, sin tildes ni puntuación, números como "0" (pedidos,
+      importes) y sin marcas de urgencia, que se evalúan aparte para cada fila. Las marcas son
+      los patrones de urgencia de `reglas` (por defecto las vigentes al crear el agrupador),
+      salvo las que también son palabras clave de una categoría, porque cambian la clasificación.
+    - Las categorías cuyas palabras clave aparecen en el ticket forman parte de la clave de
+      agrupación: dos tickets casi iguales que solo difieren en la palabra clave nunca comparten
+      grupo, porque heredarían una categoría equivocada.
+    - La firma son `permutaciones` mínimos de los hashes de los k-gramas de caracteres;
+      la fracción de mínimos iguales estima la similitud de Jaccard.
+    - Las firmas se dividen en `bandas`: dos textos son candidatos si coinciden en una banda
+      completa, y entran en el mismo grupo si su similitud con el representante (el primer
+      ticket del grupo) alcanza `umbral`. Los grupos viven durante toda la ejecución, así que
+      se agrupan también tickets de fragmentos distintos.
+    """
+    _NUMEROS = re.compile(r"\d+")
+    _SEPARADORES = re.compile(r"[\W_]+")
+
+    def __init__(self, umbral: float = CLUSTER_THRESHOLD, permutaciones: int = 64, bandas: int = 16, k: int = 5,
+                 reglas: ReglasClasificacion = None):
+        if permutaciones % bandas:
+            raise ValueError("`permutaciones` debe ser múltiplo de `bandas`")
+        reglas = reglas or proveedor_reglas.actual()
+        self._matcher = reglas.matcher
+        self._urgencia = reglas.matcher.regex_urgencia
+        self._palabras_clave = re.compile("|".join(f"(?:{p.pattern})" for p in reglas.categorias.values()), re.IGNORECASE)
+        self.umbral = umbral
+        self.bandas = bandas
+        self.k = k
+        semillas = _mezclar_hash(np.arange(1, 2 * permutaciones + 1, dtype=np.uint64))
+        self._multiplicadores = semillas[:permutaciones] | np.uint64(1)
+        self._sumandos = semillas[permutaciones:]
+        self._cubetas = [{} for _ in range(bandas)]
+        self._firmas = []  # firma del representante de cada grupo
+        self._marcas = []  # palabras clave del representante de cada grupo
+        self._ids_marcas = {}
+        self._categorias = {}
+
+    def __len__(self):
+        return len(self._firmas)
+
+    def _quitar_urgencia(self, match) -> str:
+        return match.group(0) if self._palabras_clave.search(match.group(0)) else " "
+
+    def normalizar(self, texto: str) -> str:
+        texto = self._urgencia.sub(self._quitar_urgencia, str(texto).lower())
+        if not texto.isascii():
+            texto = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+        return " ".join(self._SEPARADORES.sub(" ", self._NUMEROS.sub("0", texto)).split())
+
+    def firmas(self, descripciones: list) -> np.ndarray:
+        """Firmas MinHash (n, permutaciones) de las descripciones, calculadas en bloque."""
+        textos = [self.normalizar(d).ljust(self.k).encode("utf-8") for d in descripciones]
+        longitudes = np.array([len(t) for t in textos], dtype=np.int64)
+        inicios = np.concatenate([[0], np.cumsum(longitudes + 1)[:-1]])
+        datos = np.frombuffer(b"\n".join(textos), dtype=np.uint8)
+        # Cada k-grama de bytes cabe entero en 64 bits; los que cruzan de un texto al siguiente se descartan
+        ventanas = np.lib.stride_tricks.sliding_window_view(datos, self.k).astype(np.uint64)
+        kgramas = (ventanas << (np.uint64(8) * np.arange(self.k, dtype=np.uint64))).sum(axis=1, dtype=np.uint64)
+        conteos = longitudes - self.k + 1
+        desplazamientos = np.concatenate([[0], np.cumsum(conteos)[:-1]])
+        posiciones = np.repeat(inicios - desplazamientos, conteos) + np.arange(conteos.sum())
+        hashes = _mezclar_hash(kgramas[posiciones])
+        firmas = np.empty((len(textos), len(self._multiplicadores)), dtype=np.uint32)
+        # Cada permutación es una función multiplicar-sumar módulo 2^64 sobre el hash del k-grama
+        for j, (a, b) in enumerate(zip(self._multiplicadores, self._sumandos)):
+            firmas[:, j] = np.minimum.reduceat(hashes * a + b, desplazamientos) >> np.uint64(32)
+        return firmas
+
+    def marca(self, texto: str) -> int:
+        """Identificador de las categorías cuyas palabras clave aparecen en el texto."""
+        return self._ids_marcas.setdefault(tuple(self._matcher.coincidencias(str(texto))), len(self._ids_marcas))
+
+    def asignar(self, descripciones: list) -> tuple:
+        """Devuelve (grupos, nuevos): el grupo de cada descripción y si esta abre un grupo nuevo."""
+        if not descripciones:
+            return [], []
+        firmas = self.firmas(descripciones)
+        marcas = [self.marca(d) for d in descripciones]
+        claves = np.zeros((len(firmas), self.bandas), dtype=np.uint64)
+        for columna in firmas.reshape(len(firmas), self.bandas, -1).transpose(2, 0, 1):
+            claves = _mezclar_hash(claves + columna.astype(np.uint64))
+        claves = _mezclar_hash(claves + np.array(marcas, dtype=np.uint64)[:, None])
+        grupos, nuevos = [], []
+        for firma, marca, claves_fila in zip(firmas, marcas, claves.tolist()):
+            candidatos = {self._cubetas[b].get(clave) for b, clave in enumerate(claves_fila)}
+            candidatos.discard(None)
+            candidatos = {g for g in candidatos if self._marcas[g] == marca}
+            similitudes = {g: np.count_nonzero(self._firmas[g] == firma) / len(firma) for g in candidatos}
+            grupo = max(similitudes, key=similitudes.get, default=None)
+            nuevo = bool(grupo is None or similitudes[grupo] < self.umbral)
+            if nuevo:
+                grupo = len(self._firmas)
+                self._firmas.append(firma)
+                self._marcas.append(marca)
+                for cubeta, clave in zip(self._cubetas, claves_fila):
+                    cubeta.setdefault(clave, grupo)
+            grupos.append(grupo)
+            nuevos.append(nuevo)
+        return grupos, nuevos
+
+    def propagar(self, grupos: list, categorias: list) -> list:
+        """Cada fila toma la categoría del primer ticket clasificado de su grupo."""
+        return [self._categorias.setdefault(grupo, categoria) for grupo, categoria in zip(grupos, categorias)]
+
+def _buscar_columna_descripcion(columnas) -> str:
+    # Buscar columna 'descripcion' de forma flexible
+    for col in columnas:
+        if col.strip().lower() == 'descripcion':
+            return col
+    raise ValueError("El CSV debe contener una columna llamada 'descripcion' (no se encontró, revise el encabezado)")
+
+def _clasificar_descripciones(descripciones: list, batch_size=None):
+    """Clasifica y evalúa la urgencia de un fragmento de descripciones."""
+    categorias = clasificar_lote(descripciones, batch_size=batch_size)
+    urgencias = [es_urgente(descripcion) for descripcion in descripciones]
+    return categorias, urgencias
+
+def _inicializar_worker(hilos_torch: int):
+    """Carga el modelo una sola vez por proceso y fija sus hilos de torch."""
+    if proveedor_modelo.activo:
+        try:
+            import torch
+            torch.set_num_threads(hilos_torch)
+        except ImportError:
+            pass
+    _motor_activo()
+
+def _clasificar_fragmento_worker(descripciones: list, batch_size=None, reglas: ReglasClasificacion = None):
+    with proveedor_reglas.fijar(reglas), contadores_clasificacion.medir() as metricas:
+        categorias, urgencias = _clasificar_descripciones(descripciones, batch_size)
+    return categorias, urgencias, metricas
+
+_pools = {}
+
+def _obtener_pool(workers: int) -> ProcessPoolExecutor:
+    """Reutiliza el pool entre ejecuciones para no recargar el modelo en cada archivo."""
+    if workers not in _pools:
+        hilos_torch = max(1, (os.cpu_count() or 1) // workers)
+        _pools[workers] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_worker,
+            initargs=(hilos_torch,)
+        )
+        logger.info(f"Pool de {workers} procesos iniciado ({hilos_torch} hilos de torch por proceso)")
+    return _pools[workers]
+
+def _clasificar_fragmentos(fragmentos, desc_col_fn, batch_size=None, workers=1, metricas_workers=None,
+                           previos_fn=None, reglas: ReglasClasificacion = None):
+    """
+    Genera (fragmento, descripciones, categorias, urgencias) en el orden de lectura.
+    Con varios workers los fragmentos se reparten entre procesos, con a lo sumo
+    2 * workers fragmentos en vuelo para mantener acotada la memoria. Los procesos
+    usan `reglas` (por defecto las vigentes al empezar) aunque el archivo se recargue.
+    `previos_fn(fragmento, descripciones)` puede devolver (categorias, urgencias) ya conocidas,
+    con None en las filas que hay que clasificar; solo esas se envían al modelo.
+    """
+    def preparar(fragmento):
+        descripciones = fragmento[desc_col_fn(fragmento)].astype(str).tolist()
+        previos = previos_fn(fragmento, descripciones) if previos_fn else ([None] * len(descripciones),) * 2
+        pendientes = [i for i, categoria in enumerate(previos[0]) if categoria is None]
+        return descripciones, previos, pendientes
+
+    if workers <= 1:
+        for fragmento in fragmentos:
+            descripciones, previos, pendientes = preparar(fragmento)
+            nuevos = _clasificar_descripciones([descripciones[i] for i in pendientes], batch_size)
+            yield (fragmento, descripciones, *_combinar_previos(previos, pendientes, nuevos))
+        return
+
+    pool = _obtener_pool(workers)
+    reglas = reglas or proveedor_reglas.actual()
+    en_vuelo = []
+    for fragmento in fragmentos:
+        descripciones, previos, pendientes = preparar(fragmento)
+        futuro = pool.submit(_clasificar_fragmento_worker, [descripciones[i] for i in pendientes], batch_size, reglas)
+        en_vuelo.append((fragmento, descripciones, previos, pendientes, futuro))
+        if len(en_vuelo) >= 2 * workers:
+            yield _resultado_worker(en_vuelo.pop(0), metricas_workers)
+    while en_vuelo:
+        yield _resultado_worker(en_vuelo.pop(0), metricas_workers)
+
+def _combinar_previos(previos: tuple, pendientes: list, nuevos: tuple) -> tuple:
+    """Completa las filas pendientes de `previos` con las categorías y urgencias recién calculadas."""
+    if not pendientes:
+        return previos
+    if len(pendientes) == len(previos[0]):
+        return nuevos
+    categorias, urgencias = list(previos[0]), list(previos[1])
+    for i, categoria, urgencia in zip(pendientes, *nuevos):
+        categorias[i], urgencias[i] = categoria, urgencia
+    return categorias, urgencias
+
+def _resultado_worker(pendiente, metricas_workers):
+    """Acumula en `metricas_workers` los contadores de cada proceso, que el padre no ve."""
+    fragmento, descripciones, previos, pendientes, futuro = pendiente
+    categorias, urgencias, delta = futuro.result()
+    if metricas_workers is not None:
+        for clave, valor in delta.items():
+            metricas_workers[clave] = metricas_workers.get(clave, 0) + valor
+    return (fragmento, descripciones, *_combinar_previos(previos, pendientes, (categorias, urgencias)))
+
+# Formatos columnares por extensión; el resto se trata como CSV
+FORMATOS_COLUMNARES = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+def formato_archivo(ruta: str) -> str:
+    return FORMATOS_COLUMNARES.get(os.path.splitext(str(ruta))[1].lower(), "csv")
+
+def _importar_pyarrow():
+    """pyarrow es opcional: solo se necesita para Parquet y Arrow IPC."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Para leer o escribir Parquet/Arrow instale pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+def leer_fragmentos(ruta: str, chunksize: int = None, como_texto: bool = False):
+    """
+    Iterador de DataFrames del archivo de entrada (CSV, Parquet o Arrow IPC según la extensión).
+    Con `chunksize` los fragmentos tienen como mucho ese número de filas; sin él, un único fragmento.
+    Con `como_texto` las columnas de un CSV se leen como texto, sin inferir tipos: así el tipo de una
+    columna no cambia de un fragmento a otro (por ejemplo, vacía en uno y con texto en el siguiente).
+    """
+    formato = formato_archivo(ruta)
+    if formato == "csv":
+        dtype = str if como_texto else None
+        if chunksize:
+            return pd.read_csv(ruta, chunksize=chunksize, dtype=dtype)
+        return iter([pd.read_csv(ruta, dtype=dtype)])
+    pa = _importar_pyarrow()
+    if formato == "parquet":
+        archivo = pa.parquet.ParquetFile(ruta)
+        if not chunksize:
+            return iter([archivo.read().to_pandas()])
+        return (pa.Table.from_batches([lote]).to_pandas() for lote in archivo.iter_batches(batch_size=chunksize))
+    # Arrow IPC: la tabla se mapea en memoria, sin copiarla, y se convierte por tramos
+    tabla = pa.ipc.open_file(pa.memory_map(ruta)).read_all()
+    if not chunksize:
+        return iter([tabla.to_pandas()])
+    return (tabla.slice(inicio, chunksize).to_pandas() for inicio in range(0, tabla.num_rows, chunksize))
+
+class EscritorResultados:
+    """
+    Escribe los fragmentos clasificados a medida que llegan, en el formato que indica la extensión.
+    - CSV: se agregan al archivo y los urgentes se copian además a `ruta_urgentes`.
+    - Parquet / Arrow IPC: cada fragmento es un row group / record batch del mismo archivo. Los
+      urgentes no se copian: se obtienen filtrando la columna `urgente` (ver `leer_urgentes`).
+      El esquema se fija con el primer fragmento; sus columnas sin ningún valor se escriben como texto.
+    - Si el bloque `with` termina con una excepción, se borran los archivos a medio escribir.
+    """
+    def __init__(self, ruta: str, ruta_urgentes: str = None):
+        self.ruta = ruta
+        self.formato = formato_archivo(ruta)
+        self.ruta_urgentes = ruta_urgentes if self.formato == "csv" else None
+        self.filas = 0
+        self.urgentes = 0
+        self._escritor = None
+        self._esquema = None
+        if self.formato != "csv":
+            _importar_pyarrow()
+
+    def escribir(self, fragmento: pd.DataFrame):
+        urgentes = int(fragmento["urgente"].sum())
+        if self.formato == "csv":
+            fragmento.to_csv(self.ruta, mode="a" if self.filas else "w", header=not self.filas, index=False)
+            if urgentes and self.ruta_urgentes:
+                fragmento[fragmento["urgente"]].to_csv(
+                    self.ruta_urgentes, mode="a" if self.urgentes else "w", header=not self.urgentes, index=False
+                )
+        else:
+            self._escribir_columnar(fragmento)
+        self.filas += len(fragmento)
+        self.urgentes += urgentes
+
+    def _escribir_columnar(self, fragmento: pd.DataFrame):
+        pa = _importar_pyarrow()
+        if self._escritor is None:
+            tabla = pa.Table.from_pandas(fragmento, preserve_index=False)
+            esquema = tabla.schema
+            for i, campo in enumerate(esquema):
+                # Una columna vacía en el primer fragmento no tiene tipo: se asume texto
+                if pa.types.is_null(campo.type):
+                    esquema = esquema.set(i, campo.with_type(pa.string()))
+            if not esquema.equals(tabla.schema):
+                tabla = tabla.cast(esquema)
+            self._esquema = esquema
+            if self.formato == "parquet":
+                self._escritor = pa.parquet.ParquetWriter(self.ruta, self._esquema)
+            else:
+                self._escritor = pa.ipc.new_file(self.ruta, self._esquema)
+        else:
+            tabla = pa.Table.from_pandas(fragmento, schema=self._esquema, preserve_index=False)
+        self._escritor.write_table(tabla)
+
+    def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        self.cerrar()
+        if tipo is not None:
+            for ruta in (self.ruta, self.ruta_urgentes):
+                if ruta and os.path.exists(ruta):
+                    os.remove(ruta)
+
+def leer_urgentes(ruta: str) -> pd.DataFrame:
+    """Tickets urgentes de un archivo de resultados; en Parquet el filtro usa las estadísticas de cada row group."""
+    formato = formato_archivo(ruta)
+    if formato == "csv":
+        df = pd.read_csv(ruta)
+        return df[df["urgente"]].reset_index(drop=True)
+    pa = _importar_pyarrow()
+    if formato == "parquet":
+        return pa.parquet.read_table(ruta, filters=[("urgente", "==", True)]).to_pandas()
+    tabla = pa.ipc.open_file(pa.memory_map(ruta)).read_all()
+    return tabla.filter(tabla.column("urgente")).to_pandas()
+
+def _contar_filas(ruta) -> int:
+    """Cuenta las filas del CSV (sin encabezado); es una estimación si hay saltos de línea entre comillas."""
+    formato = formato_archivo(ruta)
+    if formato != "csv":
+        pa = _importar_pyarrow()
+        if formato == "parquet":
+            return pa.parquet.ParquetFile(ruta).metadata.num_rows
+        return pa.ipc.open_file(pa.memory_map(ruta)).read_all().num_rows
+    lineas = 0
+    ultimo = b"\n"
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            lineas += bloque.count(b"\n")
+            ultimo = bloque[-1:]
+    if ultimo != b"\n":
+        lineas += 1
+    return max(lineas - 1, 0)
+
+def _buscar_columna_id(columnas):
+    """Columna con el identificador de fila ('id' o 'ticket_id'), o None si el CSV no la tiene."""
+    for col in columnas:
+        if col.strip().lower() in ("id", "ticket_id"):
+            return col
+    return None
+
+def version_configuracion(motor: str, reglas: ReglasClasificacion = None) -> str:
+    """Identifica el motor y las reglas que producen los resultados; si cambian, el manifiesto se invalida."""
+    reglas = reglas or proveedor_reglas.actual()
+    config = json.dumps([motor, reglas.version], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+
+class ManifiestoIncremental:
+    """
+    Resultados de la ejecución anterior de un CSV recurrente, en SQLite.
+    - Cada fila se identifica por su id (o por el hash de la descripción si no hay columna id).
+    - Se reutiliza el resultado si la descripción (por hash) y la versión de configuración coinciden.
+    """
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS filas (
+                clave TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                urgente INTEGER NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def claves(fragmento: pd.DataFrame, descripciones: list) -> tuple:
+        """(claves de fila, hashes de descripción) del fragmento."""
+        hashes = pd.util.hash_pandas_object(pd.Series(descripciones, dtype=object), index=False).astype(str).tolist()
+        id_col = _buscar_columna_id(fragmento.columns)
+        if id_col is None:
+            return [f"h:{h}" for h in hashes], hashes
+        return [f"id:{valor}" for valor in fragmento[id_col].astype(str)], hashes
+
+    def buscar(self, claves: list, hashes: list, version: str) -> tuple:
+        """(categorias, urgencias) reutilizables, con None en las filas nuevas o modificadas."""
+        conocidos = {}
+        for inicio in range(0, len(claves), 500):
+            bloque = claves[inicio:inicio + 500]
+            conocidos.update(
+                (clave, (hash_, version_, categoria, bool(urgente)))
+                for clave, hash_, version_, categoria, urgente in self._conn.execute(
+                    f"SELECT clave, hash, version, categoria, urgente FROM filas WHERE clave IN ({','.join('?' * len(bloque))})",
+                    bloque
+                )
+            )
+        categorias, urgencias = [None] * len(claves), [None] * len(claves)
+        for i, (clave, hash_) in enumerate(zip(claves, hashes)):
+            previo = conocidos.get(clave)
+            if previo is not None and previo[0] == hash_ and previo[1] == version:
+                categorias[i], urgencias[i] = previo[2], previo[3]
+        return categorias, urgencias
+
+    def guardar(self, claves: list, hashes: list, version: str, categorias: list, urgencias: list):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO filas (clave, hash, version, categoria, urgente) VALUES (?, ?, ?, ?, ?)",
+            [(c, h, version, categoria, int(bool(u))) for c, h, categoria, u in zip(claves, hashes, categorias, urgencias)]
+        )
+        self._conn.commit()
+
+    def cerrar(self):
+        self._conn.close()
 
-# 5. Función para procesar archivos CSV
-def procesar_tickets(input_csv, output_csv=None):
+def procesar_tickets(input_csv, output_csv=None, batch_size=None, chunksize=None, estadisticas=None, workers=None,
+                     progreso=None, manifiesto=None, agrupar=None, urgentes_csv=None):
     """
     Procesa un archivo CSV con tickets y genera resultados clasificados.
-    - Permite nombres únicos para archivos de salida.
+    - Permite nombres únicos para archivos de salida; `output_csv` y `urgentes_csv` fijan las rutas
+      (por defecto, archivos con fecha y hora en el directorio actual).
     - Valida la existencia de la columna 'descripcion' (case-insensitive).
+    - Lee y escribe CSV, Parquet o Arrow IPC según la extensión. En los formatos columnares
+      los urgentes no se copian a otro archivo: se filtran por la columna `urgente`.
+    - Clasifica en lotes de `batch_size` (por defecto TICKET_BATCH_SIZE).
+    - Con `chunksize` lee y escribe por fragmentos: la memoria no crece con el
+      tamaño del archivo y no se devuelve el DataFrame completo (None).
+    - Con `workers` > 1 los fragmentos se clasifican en procesos separados y se
+      escriben en el orden original.
+    - Si se pasa `estadisticas` (dict), se completa con las métricas de la ejecución.
+    - Si se pasa `progreso`, se llama con (filas procesadas, filas totales estimadas)
+      después de cada fragmento.
+    - Con `manifiesto` (ruta SQLite) solo se clasifican las filas nuevas o modificadas desde
+      la ejecución anterior; el resto reutiliza su resultado y la salida sigue siendo completa.
+    - Con `agrupar` (por defecto TICKET_CLUSTERING) los casi duplicados se agrupan: solo se
+      clasifica el primer ticket de cada grupo, los demás heredan su categoría y la salida
+      incluye la columna `cluster_id`. La urgencia se evalúa siempre fila a fila.
+    - Todo el archivo se clasifica con las reglas vigentes al empezar; su versión queda en la
+      columna `version_reglas` de cada fila.
     """
     try:
-        df = pd.read_csv(input_csv)
-        # Buscar columna 'descripcion' de forma flexible
-        desc_col = None
-        for col in df.columns:
-            if col.strip().lower() == 'descripcion':
-                desc_col = col
-                break
-        if not desc_col:
-            raise ValueError("El CSV debe contener una columna llamada 'descripcion' (no se encontró, revise el encabezado)")
-
-        # Validar duplicados
-        num_duplicados = df.duplicated(subset=[desc_col]).sum()
-        if num_duplicados > 0:
-            logger.warning(f"Se encontraron {num_duplicados} tickets duplicados (por descripción) en el archivo CSV.")
-        # Nombres únicos para archivos de salida
+        estadisticas = {} if estadisticas is None else estadisticas
+        workers = workers or WORKERS
+        total_estimado = _contar_filas(input_csv) if progreso else None
+        inicio = time.perf_counter()
+        # Nombres únicos para archivos de salida; por defecto en el mismo formato que la entrada
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         if not output_csv:
-            output_csv = f"tickets_clasificados_{timestamp}.csv"
-        urgentes_csv = f"tickets_urgentes_{timestamp}.csv"
+            extension = os.path.splitext(input_csv)[1] if formato_archivo(input_csv) != "csv" else ".csv"
+            output_csv = f"tickets_clasificados_{timestamp}{extension}"
+        urgentes_csv = urgentes_csv or f"tickets_urgentes_{timestamp}.csv"
+        # De CSV a un formato columnar las columnas se copian como texto: el esquema del archivo
+        # de salida se fija con el primer fragmento y los tipos inferidos por pandas podrían variar
+        lector = leer_fragmentos(input_csv, chunksize or (FRAGMENTO_WORKERS if workers > 1 else None),
+                                 como_texto=formato_archivo(output_csv) != "csv")
 
-        categorias_pred = []
-        urgencias = []
         logger.info("Iniciando procesamiento de tickets...")
-        for i, descripcion in enumerate(df[desc_col]):
-            descripcion_str = str(descripcion)
-            categoria = clasificar_texto(descripcion_str)
-            categorias_pred.append(categoria)
-            urgencia = es_urgente(descripcion_str)
-            urgencias.append(urgencia)
-            logger.info(f"Ticket {i+1}: '{descripcion_str[:30]}...' -> Categoría: {categoria}, Urgente: {urgencia}")
-        df['categoria'] = categorias_pred
-        df['urgente'] = urgencias
-        df.to_csv(output_csv, index=False)
+        reglas = proveedor_reglas.actual()
+        desc_col = None
+        vistos = ConjuntoHashes()
+        fragmentos = []
+        escritor = EscritorResultados(output_csv, urgentes_csv)
+        total = num_urgentes = num_duplicados = 0
+        metricas_workers = {}
+
+        def columna_descripcion(fragmento):
+            nonlocal desc_col
+            if desc_col is None:
+                desc_col = _buscar_columna_descripcion(fragmento.columns)
+            return desc_col
+
+        agrupar = TICKET_CLUSTERING if agrupar is None else agrupar
+        reutilizadas = heredadas = 0
+        if manifiesto:
+            registro = ManifiestoIncremental(manifiesto)
+            # Con workers, el motor activo lo informa un proceso del pool (el padre no carga el modelo)
+            motor = _obtener_pool(workers).submit(_motor_activo).result() if workers > 1 else _motor_activo()
+            version = version_configuracion(motor, reglas)
+            claves_por_fragmento = {}
+        if agrupar:
+            agrupador = AgrupadorDuplicados(reglas=reglas)
+            grupos_por_fragmento = {}
+
+        def previos_fn(fragmento, descripciones):
+            nonlocal reutilizadas, heredadas
+            previos = ([None] * len(descripciones), [None] * len(descripciones))
+            if manifiesto:
+                claves = claves_por_fragmento[id(fragmento)] = ManifiestoIncremental.claves(fragmento, descripciones)
+                previos = registro.buscar(*claves, version)
+                reutilizadas += sum(categoria is not None for categoria in previos[0])
+            if agrupar:
+                grupos, nuevos = agrupador.asignar(descripciones)
+                grupos_por_fragmento[id(fragmento)] = grupos
+                categorias, urgencias = list(previos[0]), list(previos[1])
+                for i, (descripcion, nuevo) in enumerate(zip(descripciones, nuevos)):
+                    if categorias[i] is None and not nuevo:
+                        # La categoría definitiva la asigna `propagar` al escribir, en orden de lectura
+                        categorias[i], urgencias[i] = "", es_urgente(descripcion)
+                        heredadas += 1
+                previos = (categorias, urgencias)
+            return previos
+
+        resultados = _clasificar_fragmentos(lector, columna_descripcion, batch_size, workers, metricas_workers,
+                                            previos_fn if manifiesto or agrupar else None, reglas)
+        # Contadores de este archivo: otros trabajos o peticiones del mismo proceso no se mezclan
+        with escritor, proveedor_reglas.fijar(reglas), contadores_clasificacion.medir() as metricas:
+            for fragmento, descripciones, categorias_pred, urgencias in resultados:
+                if agrupar:
+                    grupos = grupos_por_fragmento.pop(id(fragmento))
+                    categorias_pred = agrupador.propagar(grupos, categorias_pred)
+                if manifiesto:
+                    registro.guardar(*claves_por_fragmento.pop(id(fragmento)), version, categorias_pred, urgencias)
+                # Validar duplicados
+                num_duplicados += int(vistos.agregar(pd.util.hash_pandas_object(pd.Series(descripciones), index=False)).sum())
+                if logger.isEnabledFor(logging.DEBUG):
+                    for i, (descripcion, categoria, urgencia) in enumerate(zip(descripciones, categorias_pred, urgencias), start=total):
+                        logger.debug(f"Ticket {i+1}: '{descripcion[:30]}...' -> Categoría: {categoria}, Urgente: {urgencia}")
+                fragmento['categoria'] = categorias_pred
+                fragmento['urgente'] = urgencias
+                if agrupar:
+                    fragmento['cluster_id'] = grupos
+                fragmento['version_reglas'] = reglas.version
+
+                urgentes_antes = escritor.urgentes
+                escritor.escribir(fragmento)
+                total = escritor.filas
+                num_urgentes = escritor.urgentes
+                METRICA_TICKETS.inc(len(fragmento), origen="csv")
+                METRICA_URGENTES.inc(num_urgentes - urgentes_antes, origen="csv")
+                if not chunksize:
+                    fragmentos.append(fragmento)
+                if progreso:
+                    progreso(total, max(total, total_estimado))
+        if desc_col is None:
+            raise ValueError("El CSV está vacío")
+        segundos = time.perf_counter() - inicio
+        estadisticas["rendimiento"] = {
+            "filas": total,
+            "segundos": segundos,
+            "filas_por_segundo": total / segundos if segundos else 0.0,
+            "workers": workers
+        }
+        logger.info(f"Rendimiento: {total} tickets en {segundos:.2f}s "
+                    f"({estadisticas['rendimiento']['filas_por_segundo']:.1f} tickets/s, {workers} proceso(s))")
+
+        if num_duplicados > 0:
+            logger.warning(f"Se encontraron {num_duplicados} tickets duplicados (por descripción) en el archivo CSV.")
+        for clave, valor in metricas_workers.items():
+            metricas[clave] += valor
+        aciertos = metricas["cache_aciertos"]
+        consultas = aciertos + metricas["cache_fallos"]
+        estadisticas["cache"] = {
+            "aciertos": aciertos,
+            "consultas": consultas,
+            "tasa_aciertos": aciertos / consultas if consultas else 0.0
+        }
+        logger.info(f"Caché: {aciertos}/{consultas} aciertos ({estadisticas['cache']['tasa_aciertos']:.1%})")
+        muestras = metricas["muestras_cascada"]
+        estadisticas["niveles"] = {
+            "palabras_clave": metricas["palabras_clave"],
+            "modelo": metricas["modelo"],
+            "respaldo": metricas["respaldo"],
+            "muestras_cascada": muestras,
+            "acuerdo_cascada": metricas["acuerdos_cascada"] / muestras if muestras else None
+        }
+        logger.info("Niveles: " + _describir_niveles(estadisticas["niveles"]))
+        estadisticas["version_reglas"] = reglas.version
+        if manifiesto:
+            registro.cerrar()
+            estadisticas["incremental"] = {"reutilizadas": reutilizadas, "recalculadas": total - reutilizadas}
+            logger.info(f"Incremental: {reutilizadas} filas reutilizadas, {total - reutilizadas} recalculadas")
+        if agrupar:
+            estadisticas["agrupacion"] = {
+                "grupos": len(agrupador),
+                "heredadas": heredadas,
+                "trabajo_evitado": heredadas / total if total else 0.0
+            }
+            logger.info(f"Agrupación: {len(agrupador)} grupos de casi duplicados; {heredadas} filas heredan la "
+                        f"categoría de su grupo ({estadisticas['agrupacion']['trabajo_evitado']:.1%} menos "
+                        f"clasificaciones del modelo)")
         logger.info(f"Resultados guardados en {output_csv}")
-        urgentes = df[df['urgente']]
-        if not urgentes.empty:
-            urgentes.to_csv(urgentes_csv, index=False)
-            logger.info(f"⚠️ {len(urgentes)} tickets urgentes guardados en '{urgentes_csv}'")
-            return df, urgentes_csv, output_csv, len(df), len(urgentes), num_duplicados
+
+        df = None
+        if fragmentos:
+            df = fragmentos[0] if len(fragmentos) == 1 else pd.concat(fragmentos, ignore_index=True)
+            df.attrs.update(estadisticas)
+        if num_urgentes and escritor.ruta_urgentes:
+            logger.info(f"⚠️ {num_urgentes} tickets urgentes guardados en '{urgentes_csv}'")
+            return df, urgentes_csv, output_csv, total, num_urgentes, num_duplicados
+        elif num_urgentes:
+            logger.info(f"⚠️ {num_urgentes} tickets urgentes (columna 'urgente' de '{output_csv}')")
+            return df, None, output_csv, total, num_urgentes, num_duplicados
         else:
             logger.info("No se encontraron tickets urgentes")
-            return df, None, output_csv, len(df), 0, num_duplicados
+            return df, None, output_csv, total, 0, num_duplicados
     except Exception as e:
         logger.error(f"❌ Error procesando CSV: {e}")
         raise
 
 
-# 6. Inicializar sistema de tickets para la interfaz web
+def _describir_niveles(niveles: dict) -> str:
+    texto = (f"{niveles['palabras_clave']} por palabras clave, {niveles['modelo']} por el modelo, "
+             f"{niveles['respaldo']} por respaldo de baja confianza")
+    if niveles["acuerdo_cascada"] is not None:
+        texto += f" (acuerdo en la muestra de la cascada: {niveles['acuerdo_cascada']:.1%} de {niveles['muestras_cascada']})"
+    return texto
+
+def resumen_procesamiento(total, duplicados, urgentes_count, estadisticas) -> str:
+    resumen = f"Total tickets procesados: {total}. "
+    if duplicados > 0:
+        resumen += f"Duplicados detectados: {duplicados}. "
+    resumen += f"Aciertos de caché: {estadisticas['cache']['tasa_aciertos']:.1%}. "
+    if "niveles" in estadisticas:
+        resumen += f"Clasificación: {_describir_niveles(estadisticas['niveles'])}. "
+    if "incremental" in estadisticas:
+        resumen += (f"Filas reutilizadas: {estadisticas['incremental']['reutilizadas']}, "
+                    f"recalculadas: {estadisticas['incremental']['recalculadas']}. ")
+    if "agrupacion" in estadisticas:
+        resumen += (f"Grupos de casi duplicados: {estadisticas['agrupacion']['grupos']} "
+                    f"({estadisticas['agrupacion']['heredadas']} filas sin pasar por el modelo). ")
+    if urgentes_count > 0:
+        resumen += f"Tickets urgentes: {urgentes_count}. "
+    else:
+        resumen += "No se encontraron tickets urgentes. "
+    return resumen
+
+# 11. Cola de trabajos para la interfaz web
+class ColaTrabajos:
+    """
+    Cola local de trabajos de procesamiento de CSV.
+    - Ejecuta hasta `max_concurrentes` trabajos a la vez en hilos de fondo.
+    - Copia cada archivo subido a `directorio` y guarda el estado en SQLite, de modo
+      que tras un reinicio se puede consultar o reanudar lo que quedó pendiente.
+    """
+    ESTADOS_PENDIENTES = ("en_cola", "procesando")
+
+    def __init__(self, directorio: str = "trabajos", max_concurrentes: int = 2, reanudar: bool = False,
+                 chunksize: int = 5000):
+        self.directorio = directorio
+        self.chunksize = chunksize
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrentes, thread_name_prefix="trabajo")
+        self._conn = sqlite3.connect(os.path.join(directorio, "trabajos.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                archivo TEXT,
+                nombre TEXT,
+                estado TEXT,
+                filas INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                creado REAL,
+                inicio REAL,
+                fin REAL,
+                salida TEXT,
+                urgentes TEXT,
+                mensaje TEXT
+            )"""
+        )
+        self._conn.commit()
+        self._recuperar(reanudar)
+
+    def _recuperar(self, reanudar: bool):
+        for trabajo in self.listar():
+            if trabajo["estado"] not in self.ESTADOS_PENDIENTES:
+                continue
+            if reanudar and os.path.exists(trabajo["archivo"]):
+                logger.info(f"Reanudando trabajo {trabajo['id']}")
+                self._actualizar(trabajo["id"], estado="en_cola", filas=0)
+                self._executor.submit(self._ejecutar, trabajo["id"])
+            else:
+                logger.warning(f"Trabajo {trabajo['id']} ({trabajo['nombre']}) interrumpido en "
+                               f"{trabajo['filas'] or 0}/{trabajo['total'] or '?'} tickets")
+                self._actualizar(trabajo["id"], estado="interrumpido",
+                                 mensaje="El servidor se reinició antes de terminar el trabajo")
+
+    def _actualizar(self, trabajo_id: str, **campos):
+        asignaciones = ", ".join(f"{campo} = ?" for campo in campos)
+        with self._lock:
+            self._conn.execute(f"UPDATE trabajos SET {asignaciones} WHERE id = ?", (*campos.values(), trabajo_id))
+            self._conn.commit()
+
+    def enviar(self, ruta_csv: str) -> str:
+        """Copia el archivo (CSV, Parquet o Arrow) a la cola y devuelve el id del trabajo."""
+        trabajo_id = uuid.uuid4().hex[:12]
+        extension = os.path.splitext(ruta_csv)[1].lower() if formato_archivo(ruta_csv) != "csv" else ".csv"
+        archivo = os.path.join(self.directorio, f"{trabajo_id}{extension}")
+        shutil.copyfile(ruta_csv, archivo)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO trabajos (id, archivo, nombre, estado, creado) VALUES (?, ?, ?, 'en_cola', ?)",
+                (trabajo_id, archivo, os.path.basename(ruta_csv), time.time())
+            )
+            self._conn.commit()
+        self._executor.submit(self._ejecutar, trabajo_id)
+        return trabajo_id
+
+    def _ejecutar(self, trabajo_id: str):
+        trabajo = self.estado(trabajo_id)
+        inicio = time.time()
+        self._actualizar(trabajo_id, estado="procesando", inicio=inicio)
+        try:
+            estadisticas = {}
+            # Los resultados se escriben en el mismo formato que el archivo subido
+            extension = os.path.splitext(trabajo["archivo"])[1]
+            salida = os.path.join(self.directorio, f"tickets_clasificados_{trabajo_id}{extension}")
+            # Cada trabajo escribe directamente en su propio archivo de urgentes: con varios trabajos
+            # simultáneos, los nombres por fecha y hora del directorio actual coincidirían
+            _, urgentes_file, output_file, total, urgentes_count, duplicados = procesar_tickets(
+                trabajo["archivo"], output_csv=salida, chunksize=self.chunksize, estadisticas=estadisticas,
+                progreso=lambda filas, total: self._actualizar(trabajo_id, filas=filas, total=total),
+                urgentes_csv=os.path.join(self.directorio, f"tickets_urgentes_{trabajo_id}.csv")
+            )
+            self._actualizar(trabajo_id, estado="completado", fin=time.time(), filas=total, total=total,
+                             salida=output_file, urgentes=urgentes_file,
+                             mensaje=resumen_procesamiento(total, duplicados, urgentes_count, estadisticas))
+        except Exception as e:
+            self._actualizar(trabajo_id, estado="error", fin=time.time(), mensaje=str(e))
+
+    def estado(self, trabajo_id: str) -> dict:
+        """Estado del trabajo con velocidad (filas/s) y tiempo restante estimado (s)."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,))
+            fila = cursor.fetchone()
+            columnas = [d[0] for d in cursor.description]
+        if fila is None:
+            return None
+        trabajo = dict(zip(columnas, fila))
+        trabajo["filas_por_segundo"] = 0.0
+        trabajo["eta"] = None
+        if trabajo["inicio"]:
+            transcurrido = (trabajo["fin"] or time.time()) - trabajo["inicio"]
+            if transcurrido > 0 and trabajo["filas"]:
+                trabajo["filas_por_segundo"] = trabajo["filas"] / transcurrido
+                if trabajo["estado"] == "procesando":
+                    trabajo["eta"] = max(trabajo["total"] - trabajo["filas"], 0) / trabajo["filas_por_segundo"]
+        return trabajo
+
+    def listar(self) -> list:
+        with self._lock:
+            ids = [fila[0] for fila in self._conn.execute("SELECT id FROM trabajos ORDER BY creado DESC")]
+        return [self.estado(trabajo_id) for trabajo_id in ids]
+
+_cola_trabajos = None
+
+def obtener_cola_trabajos() -> ColaTrabajos:
+    """La cola se crea al iniciar la interfaz, no al importar el módulo."""
+    global _cola_trabajos
+    if _cola_trabajos is None:
+        _cola_trabajos = ColaTrabajos(TICKET_JOBS_PATH, TICKET_JOBS_CONCURRENCY, TICKET_JOBS_RESUME,
+                                      CHUNKSIZE or 5000)
+    return _cola_trabajos
+
+def describir_trabajo(trabajo: dict) -> str:
+    if trabajo is None:
+        return "❌ Trabajo no encontrado"
+    if trabajo["estado"] == "en_cola":
+        return f"⏳ Trabajo {trabajo['id']} en cola"
+    if trabajo["estado"] == "procesando":
+        texto = f"⚙️ Trabajo {trabajo['id']}: {trabajo['filas']}/{trabajo['total']} tickets"
+        if trabajo["filas_por_segundo"]:
+            texto += f" ({trabajo['filas_por_segundo']:.1f} tickets/s"
+            texto += f", faltan ~{trabajo['eta']:.0f}s)" if trabajo["eta"] is not None else ")"
+        return texto
+    if trabajo["estado"] == "completado":
+        return f"✅ Procesamiento completado. {trabajo['mensaje']}Resultados: {os.path.basename(trabajo['salida'])}"
+    if trabajo["estado"] == "interrumpido":
+        return f"⚠️ Trabajo {trabajo['id']} interrumpido: {trabajo['mensaje']}"
+    return f"❌ Error: {trabajo['mensaje']}"
+
+COLUMNAS_TRABAJOS = ["id", "archivo", "estado", "progreso", "resultados", "urgentes"]
+
+def tabla_trabajos(cola: ColaTrabajos = None) -> pd.DataFrame:
+    """Lista de trabajos de la cola (los más recientes primero), incluidos los interrumpidos por un reinicio."""
+    filas = []
+    for trabajo in (cola or obtener_cola_trabajos()).listar():
+        progreso = f"{trabajo['filas'] or 0}/{trabajo['total']}" if trabajo["total"] else "-"
+        filas.append((trabajo["id"], trabajo["nombre"], trabajo["estado"], progreso,
+                      os.path.basename(trabajo["salida"] or ""), os.path.basename(trabajo["urgentes"] or "")))
+    return pd.DataFrame(filas, columns=COLUMNAS_TRABAJOS)
+
+# 12. Inicializar sistema de tickets para la interfaz web
 ticket_system = TicketSystem()
 
-# 7. Función para procesar tickets individuales
+# 13. Función para procesar tickets individuales
 def procesar_ticket_individual(text):
     if not text.strip():
         return "", "", ""
     
     categoria = clasificar_texto(text)
     urgente = es_urgente(text)
+    METRICA_TICKETS.inc(origen="interfaz")
+    METRICA_URGENTES.inc(int(urgente), origen="interfaz")
     
     # Crear ticket en el sistema
     ticket = ticket_system.create_ticket(text, categoria, urgente)
@@ -282,151 +2681,464 @@ def procesar_ticket_individual(text):
     
     return categoria, "SÍ" if urgente else "NO", status
 
-# 8. Interfaz de usuario con Gradio
-with gr.Blocks(title="Sistema de Soporte Inteligente", theme=gr.themes.Soft()) as demo:
-    gr.Markdown("# 🚀 Sistema Clasificador de Tickets")
-    gr.Markdown(f"**Modo actual:** `{ticket_system.mode.upper()}` | **Modelo:** `{MODEL_NAME if MODEL_LOADED else 'ALEATORIO'}`")
+# 14. Interfaz de usuario con Gradio
+COLUMNAS_BASE_TICKETS = ["id", "created_at", "category", "urgent", "status", "assigned_to", "source", "description"]
+TODOS = "Todos"
+
+def pagina_base_tickets(categoria=TODOS, urgencia=TODOS, estado=TODOS, pagina=1, por_pagina=20):
+    """
+    Una página de la base de tickets para la interfaz: (tabla, resumen, conteos por categoría, página mostrada).
+    Los filtros y la paginación los resuelve el almacén con sus índices, sin cargar todo el historial.
+    """
+    filtros = {
+        "categoria": None if categoria == TODOS else categoria,
+        "urgente": None if urgencia == TODOS else urgencia == "Sí",
+        "estado": None if estado == TODOS else estado
+    }
+    resultado = ticket_system.consultar_tickets(pagina=max(1, int(pagina or 1)), por_pagina=por_pagina, **filtros)
+    if resultado["pagina"] > resultado["paginas"]:
+        resultado = ticket_system.consultar_tickets(pagina=resultado["paginas"], por_pagina=por_pagina, **filtros)
+    tabla = pd.DataFrame(resultado["tickets"], columns=COLUMNAS_BASE_TICKETS)
+    resumen = f"Página {resultado['pagina']} de {resultado['paginas']} ({resultado['total']} tickets)"
+    conteos = ticket_system.conteos_tickets()
+    tabla_conteos = pd.DataFrame(
+        [(categoria, c["total"], c["urgentes"]) for categoria, c in sorted(conteos["por_categoria"].items(), key=lambda x: str(x[0]))],
+        columns=["categoría", "tickets", "urgentes"]
+    )
+    return tabla, resumen, tabla_conteos, resultado["pagina"]
+
+def crear_interfaz():
+    """Construye la interfaz Gradio; se importa gradio solo cuando se necesita."""
+    import gradio as gr
+
+    with gr.Blocks(title="Sistema de Soporte Inteligente", theme=gr.themes.Soft()) as demo:
+        gr.Markdown("# 🚀 Sistema Clasificador de Tickets")
+        gr.Markdown(f"**Modo actual:** `{ticket_system.mode.upper()}` | **Modelo:** `{proveedor_modelo.descripcion()}`")
     
-    # Pestañas para diferentes funcionalidades
-    """
-    with gr.Tab("Clasificación Individual"):
-        with gr.Row():
-            with gr.Column():
-                input_text = gr.Textbox(
-                    label="Descripción del problema",
-                    placeholder="Escribe aquí el problema del cliente...",
-                    lines=4
-                )
-                submit_btn = gr.Button("Procesar Ticket", variant="primary")
-                
-                with gr.Accordion("Ejemplos Rápidos", open=False):
-                    gr.Examples(
-                        examples=[
-                            ["Mi paquete no llegó a tiempo, ¡es urgente!"],
-                            ["Error 500 al procesar mi tarjeta de crédito"],
-                            ["El producto llegó con la pantalla rota"],
-                            ["No puedo acceder a mi cuenta premium"],
-                            ["Factura con impuestos incorrectos"]
-                        ],
-                        inputs=[input_text]
+        # Pestañas para diferentes funcionalidades
+        """
+        with gr.Tab("Clasificación Individual"):
+            with gr.Row():
+                with gr.Column():
+                    input_text = gr.Textbox(
+                        label="Descripción del problema",
+                        placeholder="Escribe aquí el problema del cliente...",
+                        lines=4
                     )
+                    submit_btn = gr.Button("Procesar Ticket", variant="primary")
+                
+                    with gr.Accordion("Ejemplos Rápidos", open=False):
+                        gr.Examples(
+                            examples=[
+                                ["Mi paquete no llegó a tiempo, ¡es urgente!"],
+                                ["Error 500 al procesar mi tarjeta de crédito"],
+                                ["El producto llegó con la pantalla rota"],
+                                ["No puedo acceder a mi cuenta premium"],
+                                ["Factura con impuestos incorrectos"]
+                            ],
+                            inputs=[input_text]
+                        )
             
-            with gr.Column():
-                categoria_out = gr.Textbox(label="Categoría")
-                urgencia_out = gr.Textbox(label="¿Urgente?")
-                status_out = gr.Textbox(label="Estado del Ticket")
+                with gr.Column():
+                    categoria_out = gr.Textbox(label="Categoría")
+                    urgencia_out = gr.Textbox(label="¿Urgente?")
+                    status_out = gr.Textbox(label="Estado del Ticket")
                 
-                with gr.Accordion("Base de Tickets", open=False):
-                    ticket_db = gr.JSON(label="Tickets Registrados")
-                    update_btn = gr.Button("Actualizar Base de Datos")
-    """
+                    with gr.Accordion("Base de Tickets", open=False):
+                        ticket_db = gr.JSON(label="Tickets Registrados")
+                        update_btn = gr.Button("Actualizar Base de Datos")
+        """
     
-    with gr.Tab("Procesar Archivo CSV"):
-        with gr.Row():
-            with gr.Column():
-                file_input = gr.File(label="Subir CSV de tickets", file_types=[".csv"])
-                process_btn = gr.Button("Procesar Archivo", variant="primary")
+        with gr.Tab("Procesar Archivo CSV"):
+            with gr.Row():
+                with gr.Column():
+                    file_input = gr.File(label="Subir tickets (CSV, Parquet o Arrow)", file_types=[".csv", *FORMATOS_COLUMNARES])
+                    process_btn = gr.Button("Procesar Archivo", variant="primary")
                 
-            with gr.Column():
-                output_status = gr.Textbox(label="Estado de Procesamiento")
-                output_download = gr.File(label="Descargar Resultados")
-                urgent_download = gr.File(label="Descargar Tickets Urgentes", visible=False)
+                with gr.Column():
+                    output_status = gr.Textbox(label="Estado de Procesamiento")
+                    output_download = gr.File(label="Descargar Resultados")
+                    urgent_download = gr.File(label="Descargar Tickets Urgentes", visible=False)
                 
-                with gr.Accordion("Instrucciones", open=False):
-                    gr.Markdown("""
-                    **Formato CSV requerido:**
-                    - Debe contener columna 'descripcion'
-                    - Ejemplo:
-                    ```
-                    id,descripcion
-                    1,Mi pedido no llegó
-                    2,Error en mi pago
-                    ```
-                    """)
-
-    # Event handlers
-    """
-    submit_btn.click(
-        fn=procesar_ticket_individual,
-        inputs=input_text,
-        outputs=[categoria_out, urgencia_out, status_out]
-    )
-    
-    update_btn.click(
-        fn=lambda: ticket_system.get_tickets(),
-        inputs=[],
-        outputs=ticket_db
-    )
-    """
+                    with gr.Accordion("Instrucciones", open=False):
+                        gr.Markdown("""
+                        **Formato CSV requerido:**
+                        - Debe contener columna 'descripcion'
+                        - Ejemplo:
+                        ```
+                        id,descripcion
+                        1,Mi pedido no llegó
+                        2,Error en mi pago
+                        ```
+                        """)
+
+            # Trabajos guardados en la cola: sobreviven a un reinicio del servidor
+            with gr.Row():
+                trabajo_id_input = gr.Textbox(label="Id del trabajo", scale=3)
+                abrir_trabajo_btn = gr.Button("Ver trabajo y descargas", scale=1)
+            tabla_trabajos_out = gr.Dataframe(headers=COLUMNAS_TRABAJOS, interactive=False, label="Trabajos")
 
-    # Función wrapper para procesar CSV
-    def procesar_csv_wrapper(archivo):
+        with gr.Tab("Base de Tickets"):
+            with gr.Row():
+                filtro_categoria = gr.Dropdown([TODOS, *proveedor_reglas.actual().nombres, "otros"], value=TODOS,
+                                               label="Categoría")
+                filtro_urgencia = gr.Dropdown([TODOS, "Sí", "No"], value=TODOS, label="¿Urgente?")
+                filtro_estado = gr.Dropdown([TODOS, "open", "pending", "solved", "closed"], value=TODOS, label="Estado")
+            with gr.Row():
+                anterior_btn = gr.Button("◀ Anterior")
+                pagina_actual = gr.Number(value=1, precision=0, minimum=1, label="Página")
+                siguiente_btn = gr.Button("Siguiente ▶")
+                actualizar_btn = gr.Button("Actualizar", variant="primary")
+            resumen_pagina = gr.Markdown()
+            tabla_tickets = gr.Dataframe(headers=COLUMNAS_BASE_TICKETS, interactive=False, wrap=True)
+            with gr.Accordion("Tickets por categoría", open=False):
+                tabla_conteos = gr.Dataframe(headers=["categoría", "tickets", "urgentes"], interactive=False)
+
+        # Event handlers
         """
-        Procesa el archivo CSV subido y retorna mensajes y archivos de salida únicos.
+        submit_btn.click(
+            fn=procesar_ticket_individual,
+            inputs=input_text,
+            outputs=[categoria_out, urgencia_out, status_out]
+        )
+    
+        update_btn.click(
+            fn=lambda: ticket_system.get_tickets(),
+            inputs=[],
+            outputs=ticket_db
+        )
         """
-        if archivo is None:
-            return "❌ No se subió ningún archivo", None, None, gr.update(visible=False)
-        try:
-            file_path = archivo.name
-            result, urgentes_file, output_file, total, urgentes_count, duplicados = procesar_tickets(file_path)
-            resumen = f"Total tickets procesados: {total}. "
-            if duplicados > 0:
-                resumen += f"Duplicados detectados: {duplicados}. "
-            if urgentes_count > 0:
-                resumen += f"Tickets urgentes: {urgentes_count}. "
-            else:
-                resumen += "No se encontraron tickets urgentes. "
-            if result is not None:
-                if urgentes_file:
-                    return (
-                        f"✅ Procesamiento completado con éxito. {resumen}Resultados: {output_file}",
-                        output_file,
-                        urgentes_file,
-                        gr.update(visible=True)
-                    )
+
+        # Función wrapper para procesar CSV: el archivo se envía a la cola de trabajos
+        def procesar_csv_wrapper(archivo):
+            """
+            Envía el archivo CSV subido como trabajo en segundo plano y retorna su id.
+            """
+            if archivo is None:
+                return "❌ No se subió ningún archivo", None, None, gr.update(visible=False), None
+            try:
+                trabajo_id = obtener_cola_trabajos().enviar(archivo.name)
+                return f"⏳ Trabajo {trabajo_id} en cola", None, None, gr.update(visible=False), trabajo_id
+            except Exception as e:
+                return f"❌ Error: {str(e)}", None, None, gr.update(visible=False), None
+
+        def consultar_trabajo_wrapper(trabajo_id):
+            """
+            Consulta periódica del trabajo en curso; al terminar entrega los archivos de salida.
+            """
+            if not trabajo_id:
+                return gr.skip(), gr.skip(), gr.skip(), gr.skip(), gr.skip()
+            trabajo = obtener_cola_trabajos().estado(trabajo_id)
+            mensaje = describir_trabajo(trabajo)
+            if trabajo is None or trabajo["estado"] in ("error", "interrumpido"):
+                return mensaje, None, None, gr.update(visible=False), None
+            if trabajo["estado"] != "completado":
+                return mensaje, gr.skip(), gr.skip(), gr.skip(), trabajo_id
+            urgentes_file = trabajo["urgentes"]
+            return mensaje, trabajo["salida"], urgentes_file, gr.update(visible=bool(urgentes_file)), None
+
+        trabajo_actual = gr.State(None)
+        temporizador = gr.Timer(2.0)
+        process_btn.click(
+            fn=procesar_csv_wrapper,
+            inputs=file_input,
+            outputs=[output_status, output_download, urgent_download, urgent_download, trabajo_actual]
+        )
+        temporizador.tick(
+            fn=consultar_trabajo_wrapper,
+            inputs=trabajo_actual,
+            outputs=[output_status, output_download, urgent_download, urgent_download, trabajo_actual]
+        )
+        abrir_trabajo_btn.click(
+            fn=lambda trabajo_id: consultar_trabajo_wrapper((trabajo_id or "").strip()),
+            inputs=trabajo_id_input,
+            outputs=[output_status, output_download, urgent_download, urgent_download, trabajo_actual]
+        )
+        def elegir_trabajo(evento: gr.SelectData):
+            """Al pulsar una fila de la lista se copia su id para abrir el trabajo."""
+            return evento.row_value[0] if evento.row_value else gr.skip()
+
+        tabla_trabajos_out.select(fn=elegir_trabajo, inputs=None, outputs=trabajo_id_input)
+        temporizador.tick(fn=lambda: tabla_trabajos(), inputs=None, outputs=tabla_trabajos_out)
+        demo.load(fn=lambda: tabla_trabajos(), inputs=None, outputs=tabla_trabajos_out)
+
+        # Base de tickets: cada cambio de filtro vuelve a la primera página
+        filtros_base = [filtro_categoria, filtro_urgencia, filtro_estado]
+        salidas_base = [tabla_tickets, resumen_pagina, tabla_conteos, pagina_actual]
+        for filtro in filtros_base:
+            filtro.change(fn=lambda c, u, e: pagina_base_tickets(c, u, e, 1), inputs=filtros_base, outputs=salidas_base)
+        actualizar_btn.click(fn=pagina_base_tickets, inputs=[*filtros_base, pagina_actual], outputs=salidas_base)
+        anterior_btn.click(fn=lambda c, u, e, p: pagina_base_tickets(c, u, e, (p or 1) - 1),
+                           inputs=[*filtros_base, pagina_actual], outputs=salidas_base)
+        siguiente_btn.click(fn=lambda c, u, e, p: pagina_base_tickets(c, u, e, (p or 1) + 1),
+                            inputs=[*filtros_base, pagina_actual], outputs=salidas_base)
+        demo.load(fn=pagina_base_tickets, inputs=[*filtros_base, pagina_actual], outputs=salidas_base)
+    return demo
+
+# 15. API HTTP de clasificación
+class ColaLlena(Exception):
+    """La cola del micro-batcher no admite más textos (se responde 429)."""
+
+class MicroBatcher:
+    """
+    Agrupa las peticiones concurrentes en micro-lotes antes de llamar al modelo.
+    - Un hilo despachador envía el lote cuando reúne `max_lote` textos o cuando el más
+      antiguo lleva `max_espera_ms` esperando.
+    - Admite como mucho `max_cola` textos pendientes; por encima, `enviar` lanza ColaLlena.
+    - `funcion` recibe una lista de textos y devuelve una lista de resultados del mismo tamaño.
+    """
+    def __init__(self, funcion, max_lote: int = 32, max_espera_ms: float = 10, max_cola: int = 1000):
+        self.funcion = funcion
+        self.max_lote = max_lote
+        self.max_espera = max_espera_ms / 1000
+        self.max_cola = max_cola
+        self.lotes = 0
+        self._pendientes = []  # (textos, futuro, instante de llegada)
+        self._en_cola = 0
+        self._condicion = threading.Condition()
+        self._cerrado = False
+        self._hilo = threading.Thread(target=self._despachar, name="micro-batcher", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, textos: list) -> Future:
+        """Encola los textos; el futuro se resuelve con sus resultados en el mismo orden."""
+        futuro = Future()
+        with self._condicion:
+            if self._cerrado:
+                raise RuntimeError("El micro-batcher está cerrado")
+            if self._en_cola + len(textos) > self.max_cola:
+                raise ColaLlena(f"{self._en_cola} textos en cola (máximo {self.max_cola})")
+            self._pendientes.append((textos, futuro, time.monotonic()))
+            self._en_cola += len(textos)
+            self._condicion.notify()
+        return futuro
+
+    def _tomar_lote(self) -> list:
+        """Siguiente lote de peticiones, o None si está cerrado y no queda nada pendiente."""
+        with self._condicion:
+            while not self._cerrado:
+                if self._pendientes:
+                    espera = self._pendientes[0][2] + self.max_espera - time.monotonic()
+                    if self._en_cola >= self.max_lote or espera <= 0:
+                        break
+                    self._condicion.wait(espera)
                 else:
-                    return (
-                        f"✅ Procesamiento completado. {resumen}Resultados: {output_file}",
-                        output_file,
-                        None,
-                        gr.update(visible=False)
-                    )
-            else:
-                return "❌ Error procesando el archivo", None, None, gr.update(visible=False)
+                    self._condicion.wait()
+            if not self._pendientes:
+                return None
+            lote, textos = [], 0
+            # Siempre entra al menos una petición, aunque por sí sola supere max_lote
+            while self._pendientes and (not lote or textos + len(self._pendientes[0][0]) <= self.max_lote):
+                peticion = self._pendientes.pop(0)
+                self._en_cola -= len(peticion[0])
+                # A partir de aquí el futuro ya no se puede cancelar; se descartan los que canceló
+                # el cliente (desconexión, timeout) para no resolverlos después
+                if peticion[1].set_running_or_notify_cancel():
+                    lote.append(peticion)
+                    textos += len(peticion[0])
+            return lote
+
+    def _despachar(self):
+        while True:
+            lote = self._tomar_lote()
+            if lote is None:
+                return
+            try:
+                self._resolver(lote)
+            except Exception as e:
+                # Un fallo inesperado no puede detener el hilo: el resto de peticiones quedaría sin respuesta
+                logger.error(f"⚠️ Error despachando un micro-lote de la API: {e}")
+                for _, futuro, _ in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+
+    def _resolver(self, lote: list):
+        if not lote:
+            return
+        textos = [texto for peticion in lote for texto in peticion[0]]
+        self.lotes += 1
+        try:
+            resultados = self.funcion(textos)
         except Exception as e:
-            return f"❌ Error: {str(e)}", None, None, gr.update(visible=False)
+            logger.error(f"⚠️ Error en micro-lote de la API: {e}")
+            for _, futuro, _ in lote:
+                futuro.set_exception(e)
+            return
+        inicio = 0
+        for peticion, futuro, _ in lote:
+            futuro.set_result(resultados[inicio:inicio + len(peticion)])
+            inicio += len(peticion)
 
-    process_btn.click(
-        fn=procesar_csv_wrapper,
-        inputs=file_input,
-        outputs=[output_status, output_download, urgent_download, urgent_download]
-    )
+    def cerrar(self):
+        """Deja de aceptar peticiones; las pendientes se despachan antes de terminar."""
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify()
+        self._hilo.join()
+
+def clasificar_para_api(textos: list) -> list:
+    """
+    Categoría, urgencia, puntuación y versión de las reglas de cada texto
+    (la puntuación es None si decidieron las palabras clave).
+    """
+    with proveedor_reglas.fijar() as reglas:
+        resultados = [
+            {"category": categoria, "urgent": es_urgente(texto), "score": puntuacion, "rules_version": reglas.version}
+            for texto, (categoria, puntuacion) in zip(textos, clasificar_lote_con_puntuacion(textos))
+        ]
+    METRICA_TICKETS.inc(len(resultados), origen="api")
+    METRICA_URGENTES.inc(sum(r["urgent"] for r in resultados), origen="api")
+    return resultados
+
+def crear_api(batcher: MicroBatcher = None):
+    """
+    API JSON junto a la interfaz de Gradio:
+    - POST /classify {"text": "..."} -> {"category", "urgent", "score", "rules_version"}
+    - POST /classify/batch {"texts": [...]} -> {"results": [...]}
+    - GET /tickets?category=&urgent=&status=&since=&until=&page=&per_page= -> página de la base de tickets
+    - GET /tickets/counts -> tickets y urgentes por categoría
+    Las peticiones concurrentes comparten micro-lotes del modelo; con la cola llena se responde 429.
+    """
+    import asyncio
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import PlainTextResponse
+    from pydantic import BaseModel, Field
+
+    class Ticket(BaseModel):
+        text: str = Field(min_length=1)
+
+    class Lote(BaseModel):
+        texts: list[str] = Field(min_length=1)
+
+    batcher = batcher or MicroBatcher(clasificar_para_api, API_MAX_BATCH, API_MAX_WAIT_MS, API_MAX_QUEUE)
+    api = FastAPI(title="Clasificador de tickets")
+    api.state.batcher = batcher
+
+    async def clasificar(textos: list) -> list:
+        if len(textos) > batcher.max_cola:
+            raise HTTPException(413, f"Máximo {batcher.max_cola} textos por petición")
+        try:
+            futuro = batcher.enviar(textos)
+        except ColaLlena as e:
+            raise HTTPException(429, f"Cola de clasificación llena: {e}", headers={"Retry-After": "1"})
+        return await asyncio.wrap_future(futuro)
 
-# 9. Ejecutar la aplicación
+    @api.post("/classify")
+    async def classify(ticket: Ticket):
+        return (await clasificar([ticket.text]))[0]
+
+    @api.post("/classify/batch")
+    async def classify_batch(lote: Lote):
+        return {"results": await clasificar(lote.texts)}
+
+    @api.get("/tickets")
+    def tickets(category: str = None, urgent: bool = None, status: str = None, since: str = None,
+                until: str = None, page: int = 1, per_page: int = 20):
+        try:
+            return ticket_system.consultar_tickets(categoria=category, urgente=urgent, estado=status, desde=since,
+                                                   hasta=until, pagina=page, por_pagina=per_page)
+        except ValueError as e:
+            raise HTTPException(422, str(e))
+
+    @api.get("/tickets/counts")
+    def tickets_counts():
+        return ticket_system.conteos_tickets()
+
+    @api.get("/metrics")
+    def metrics():
+        return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return api
+
+# 16. Ejecutar la aplicación
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sistema clasificador de tickets")
+    parser.add_argument("archivo", nargs="?", help="CSV a procesar en modo batch (sin interfaz web)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Pares premisa/hipótesis por pasada del modelo")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE,
+                        help="Filas por fragmento en modo streaming (0 = todo en memoria)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Procesos de clasificación en paralelo (cada uno carga su modelo)")
+    parser.add_argument("--incremental", nargs="?", const="", default=None, metavar="MANIFIESTO",
+                        help="Solo clasifica filas nuevas o modificadas desde la ejecución anterior "
+                             "(por defecto el manifiesto es <archivo>.manifiesto.db)")
+    parser.add_argument("--salida", default=None, help="CSV de resultados (por defecto uno nuevo con fecha y hora)")
+    parser.add_argument("--agrupar", action="store_true", default=TICKET_CLUSTERING,
+                        help="Agrupa los casi duplicados y clasifica un solo ticket por grupo (columna cluster_id)")
+    parser.add_argument("--servidor-inferencia", nargs="?", const="", default=None, metavar="SOCKET",
+                        help="Carga el modelo y lo sirve a otros procesos por un socket Unix "
+                             "(por defecto TICKET_INFERENCE_SOCKET)")
+    parser.add_argument("--puerto", type=int, default=int(os.getenv("TICKET_PORT", "7860")),
+                        help="Puerto de la interfaz web y la API")
+    args = parser.parse_args()
+
+    if args.servidor_inferencia is not None:
+        # Un solo proceso con el modelo; los procesos web se conectan con TICKET_INFERENCE_SOCKET
+        ruta_socket = args.servidor_inferencia or INFERENCE_SOCKET
+        if not ruta_socket:
+            parser.error("Indique la ruta del socket o defina TICKET_INFERENCE_SOCKET")
+        servidor = ServidorInferencia(
+            ruta_socket, ClassifierProvider(MODELOS, "model", TICKET_INFERENCE_BACKEND, MODEL_CACHE_DIR), INFERENCE_AUTHKEY
+        )
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            servidor.iniciar().join()
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as e:
+            logger.error(f"❌ {e}")
+            sys.exit(1)
+        finally:
+            servidor.cerrar()
     # Si se pasa un archivo CSV como argumento, procesar en modo batch
-    if len(sys.argv) > 1:
-        input_csv = sys.argv[1]
+    elif args.archivo:
+        input_csv = args.archivo
         logger.info(f"Procesando archivo: {input_csv}")
 
         try:
-            result, urgentes, salida, total, urgentes_count, duplicados = procesar_tickets(input_csv)
+            estadisticas = {}
+            manifiesto = None
+            if args.incremental is not None:
+                manifiesto = args.incremental or f"{os.path.splitext(input_csv)[0]}.manifiesto.db"
+            result, urgentes, salida, total, urgentes_count, duplicados = procesar_tickets(
+                input_csv, output_csv=args.salida, batch_size=args.batch_size, chunksize=args.chunksize or None,
+                estadisticas=estadisticas, workers=args.workers, manifiesto=manifiesto, agrupar=args.agrupar
+            )
             logger.info(f"Total tickets procesados: {total}")
             logger.info(f"Duplicados detectados: {duplicados}")
+            logger.info(f"Tasa de aciertos de caché: {estadisticas['cache']['tasa_aciertos']:.1%}")
+            logger.info(f"Rendimiento: {estadisticas['rendimiento']['filas_por_segundo']:.1f} tickets/s "
+                        f"con {estadisticas['rendimiento']['workers']} proceso(s)")
+            if "incremental" in estadisticas:
+                logger.info(f"Filas reutilizadas: {estadisticas['incremental']['reutilizadas']}, "
+                            f"recalculadas: {estadisticas['incremental']['recalculadas']}")
+            if "agrupacion" in estadisticas:
+                logger.info(f"Grupos de casi duplicados: {estadisticas['agrupacion']['grupos']}, clasificaciones "
+                            f"evitadas: {estadisticas['agrupacion']['heredadas']} "
+                            f"({estadisticas['agrupacion']['trabajo_evitado']:.1%})")
             logger.info(f"Tickets urgentes: {urgentes_count}")
             logger.info(f"Archivo de resultados: {salida}")
 
             if urgentes:
                 logger.info(f"Archivo de tickets urgentes: {urgentes}")
+            elif urgentes_count:
+                # Salida Parquet/Arrow: los urgentes no se copian aparte, se marcan en el propio archivo
+                logger.info(f"Los tickets urgentes están marcados en la columna 'urgente' de {salida}")
             else:
                 logger.info("No se encontraron tickets urgentes.")
         except Exception as e:
             logger.error(f"Error procesando el archivo: {e}")
             sys.exit(1)
     else:
-        # Modo interfaz web
-        demo.launch(
-            server_name="0.0.0.0",
-            server_port=7860,
-            show_error=True
-        )
+        # Modo interfaz web: el modelo se carga en segundo plano mientras arranca Gradio
+        if TICKET_CLASSIFIER_ENGINE == "embeddings":
+            threading.Thread(target=proveedor_embeddings.get, name="carga-encoder", daemon=True).start()
+        else:
+            proveedor_modelo.warmup()
+        # La API JSON (/classify) y la interfaz (/) se sirven desde el mismo servidor
+        import uvicorn
+        import gradio as gr
+        demo = crear_interfaz()
+        servidor = gr.mount_gradio_app(crear_api(), demo, path="/", show_error=True)
+        uvicorn.run(servidor, host="0.0.0.0", port=args.puerto)
@@ -0,0 +1,444 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import threading
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+import pandas as pd
+
+import app
+
+# 1. Corpus sintético de tickets en español
+PLANTILLAS = [
+    "Mi {kw} no llegó a tiempo",
+    "Tengo un problema con el {kw}",
+    "Quisiera información sobre mi {kw}",
+    "Hay un inconveniente con {kw} desde ayer",
+    "Necesito revisar el {kw} de mi compra",
+]
+NEUTRAS = [
+    "Consulta general",
+    "Quisiera hablar con un asesor",
+    "Gracias por la atención",
+    "¿Cuál es el horario de atención?",
+]
+URGENCIAS = ["¡Es urgente!", "Necesito ayuda ya", "prioridad 1", "!!", "es crítico"]
+
+def vocabulario_categorias() -> dict:
+    """Extrae las palabras clave de CATEGORIAS (en `env[íi]o` toma la primera opción: `envío`)."""
+    return {
+        categoria: [re.sub(r"\[(.)[^\]]*\]", r"\1", palabra) for palabra in pattern.pattern.split("|")]
+        for categoria, pattern in app.CATEGORIAS.items()
+    }
+
+def generar_corpus(filas: int, ratio_duplicados: float = 0.0, ratio_urgentes: float = 0.2,
+                   semilla: int = 42) -> list:
+    """Genera `filas` descripciones; `ratio_duplicados` de ellas repiten una anterior."""
+    rnd = random.Random(semilla)
+    vocabulario = [palabra for palabras in vocabulario_categorias().values() for palabra in palabras]
+    corpus = []
+    for i in range(filas):
+        if corpus and rnd.random() < ratio_duplicados:
+            corpus.append(rnd.choice(corpus))
+            continue
+        if rnd.random() < 0.15:
+            texto = rnd.choice(NEUTRAS)
+        else:
+            texto = rnd.choice(PLANTILLAS).format(kw=rnd.choice(vocabulario))
+        texto += f" (ref. {i})"  # Garantiza que solo se repitan las filas duplicadas a propósito
+        if rnd.random() < ratio_urgentes:
+            texto += f" {rnd.choice(URGENCIAS)}"
+        corpus.append(texto)
+    return corpus
+
+# 2. Modelo de prueba (sin red ni pesos)
+class StubZeroShot:
+    """
+    Imita la interfaz del pipeline zero-shot de transformers.
+    - La etiqueta sale de las palabras clave (0.8) o de un hash del texto (0.35, bajo el umbral).
+    - `latencia_par_ms` simula el coste de cada par premisa/hipótesis.
+    """
+    def __init__(self, latencia_par_ms: float = 0.0):
+        self.latencia_par_ms = latencia_par_ms
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template="{}", multi_label=False, batch_size=1):
+        individual = isinstance(sequences, str)
+        sequences = [sequences] if individual else list(sequences)
+        candidate_labels = list(candidate_labels)
+        if self.latencia_par_ms:
+            time.sleep(self.latencia_par_ms * len(sequences) * len(candidate_labels) / 1000)
+        resultados = []
+        for texto in sequences:
+            categoria = app.clasificar_con_palabras_clave(texto)
+            if categoria in candidate_labels:
+                etiqueta, score = categoria, 0.8
+            else:
+                etiqueta, score = candidate_labels[zlib.crc32(texto.encode()) % len(candidate_labels)], 0.35
+            resto = [label for label in candidate_labels if label != etiqueta]
+            resultados.append({
+                "sequence": texto,
+                "labels": [etiqueta] + resto,
+                "scores": [score] + [(1 - score) / len(resto)] * len(resto)
+            })
+        return resultados[0] if individual else resultados
+
+def proveedor_para_modo(modo: str, latencia_par_ms: float = 0.0):
+    if modo == "keywords":
+        return app.ClassifierProvider(app.MODELOS, modo="keywords")
+    if modo == "stub":
+        proveedor = app.ClassifierProvider(["stub"])
+        proveedor.classifier = StubZeroShot(latencia_par_ms)
+        proveedor._intentado = True
+        return proveedor
+    if modo == "modelo":
+        return app.ClassifierProvider(app.MODELOS)
+    raise ValueError(f"Modo desconocido: '{modo}' (opciones: {', '.join(MODOS)})")
+
+MODOS = ("keywords", "stub", "modelo")
+
+@contextlib.contextmanager
+def entorno_benchmark(proveedor):
+    """Sustituye el modelo y usa una caché vacía durante la medición."""
+    anteriores = app.proveedor_modelo, app.cache_clasificacion
+    app.proveedor_modelo = proveedor
+    app.cache_clasificacion = app.ClasificacionCache()
+    try:
+        yield
+    finally:
+        app.proveedor_modelo, app.cache_clasificacion = anteriores
+
+# 3. Mediciones
+rss_mb = app.rss_mb
+
+class MuestreoRSS:
+    """
+    Pico de memoria residente de una sola medición: mientras dura el bloque `with`, un hilo lee
+    el RSS cada `intervalo` segundos. El pico del proceso (ru_maxrss) no sirve porque es acumulado
+    y sería el mismo en todas las mediciones posteriores a la más costosa.
+    - `rss_pico_incremento_mb`: pico durante la medición menos el RSS al empezar.
+    - `rss_retenido_mb`: memoria que la medición deja ocupada al terminar.
+    """
+    def __init__(self, intervalo: float = 0.005):
+        self.intervalo = intervalo
+        self.inicial = self.pico = self.final = 0.0
+
+    def __enter__(self):
+        self.inicial = self.pico = rss_mb()
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def _muestrear(self):
+        while not self._fin.wait(self.intervalo):
+            self.pico = max(self.pico, rss_mb())
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
+        self.final = rss_mb()
+        self.pico = max(self.pico, self.final)
+
+    def resumen(self) -> dict:
+        return {
+            "rss_pico_incremento_mb": self.pico - self.inicial,
+            "rss_retenido_mb": self.final - self.inicial
+        }
+
+def resumen_latencias(latencias: list, segundos: float, filas: int, memoria: MuestreoRSS) -> dict:
+    resultado = {
+        "filas": filas,
+        "segundos": segundos,
+        "filas_por_segundo": filas / segundos if segundos else 0.0,
+        **memoria.resumen()
+    }
+    if latencias:
+        p50, p95, p99 = np.percentile(np.array(latencias) * 1000, [50, 95, 99])
+        resultado["latencia_ms"] = {"p50": p50, "p95": p95, "p99": p99}
+    return resultado
+
+def medir_por_ticket(fn, corpus: list) -> dict:
+    latencias = []
+    with MuestreoRSS() as memoria:
+        inicio = time.perf_counter()
+        for texto in corpus:
+            t0 = time.perf_counter()
+            fn(texto)
+            latencias.append(time.perf_counter() - t0)
+        segundos = time.perf_counter() - inicio
+    return resumen_latencias(latencias, segundos, len(corpus), memoria)
+
+def medir_procesar_tickets(corpus: list, directorio: str, batch_size: int = None) -> dict:
+    entrada = os.path.join(directorio, "corpus.csv")
+    pd.DataFrame({"id": range(len(corpus)), "descripcion": corpus}).to_csv(entrada, index=False)
+    estadisticas = {}
+    with MuestreoRSS() as memoria:
+        inicio = time.perf_counter()
+        _, urgentes, *_ = app.procesar_tickets(
+            entrada, output_csv=os.path.join(directorio, "salida.csv"), batch_size=batch_size,
+            estadisticas=estadisticas
+        )
+        segundos = time.perf_counter() - inicio
+    if urgentes:
+        os.remove(urgentes)
+    resultado = resumen_latencias([], segundos, len(corpus), memoria)
+    resultado["tasa_aciertos_cache"] = estadisticas["cache"]["tasa_aciertos"]
+    resultado["niveles"] = estadisticas["niveles"]
+    return resultado
+
+def medir_create_ticket(corpus: list, directorio: str) -> dict:
+    ts = app.TicketSystem(store=app.crear_ticket_store("jsonl", os.path.join(directorio, "tickets.jsonl")))
+    ts.mode = "simulated"
+    categorias = app.clasificar_lote(corpus)
+    pares = iter(zip(corpus, categorias))
+    return medir_por_ticket(lambda _: ts.create_ticket(*next(pares), False), corpus)
+
+def _categoria_recorrido(texto: str) -> str:
+    """Recorrido original de las palabras clave (una búsqueda por categoría), como referencia."""
+    texto = texto.lower()
+    for categoria, pattern in app.CATEGORIAS.items():
+        if pattern.search(texto):
+            return categoria
+    return "otros"
+
+def _urgencia_recorrido(texto: str) -> bool:
+    texto = texto.lower()
+    return any(re.search(pattern, texto, flags=re.IGNORECASE) for pattern in app.URGENCY_PATTERNS)
+
+def comparar_palabras_clave(corpus: list, repeticiones: int = 3) -> dict:
+    """
+    Micro-benchmark del matcher de palabras clave frente al recorrido original por categoría:
+    mejor tiempo de `repeticiones` pasadas sobre el corpus, solo categoría y categoría + urgencia.
+    """
+    matcher = app.REGLAS_POR_DEFECTO.matcher
+    variantes = {
+        "categoria": (_categoria_recorrido, matcher.categoria),
+        "categoria_y_urgencia": (lambda t: (_categoria_recorrido(t), _urgencia_recorrido(t)), matcher.analizar),
+    }
+    resultado = {}
+    for nombre, (original, nuevo) in variantes.items():
+        tiempos = {}
+        for clave, fn in (("original", original), ("matcher", nuevo)):
+            mejor = float("inf")
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                salida = [fn(texto) for texto in corpus]
+                mejor = min(mejor, time.perf_counter() - inicio)
+            tiempos[clave] = (mejor, salida)
+        resultado[nombre] = {
+            "original_s": tiempos["original"][0],
+            "matcher_s": tiempos["matcher"][0],
+            "aceleracion": tiempos["original"][0] / tiempos["matcher"][0] if tiempos["matcher"][0] else 0.0,
+            "acuerdo": float(np.mean([a == b for a, b in zip(tiempos["original"][1], tiempos["matcher"][1])])) if corpus else 1.0
+        }
+        app.logger.info(f"Palabras clave ({nombre}): x{resultado[nombre]['aceleracion']:.2f} frente al recorrido original")
+    return resultado
+
+def comparar_backends(corpus: list, modelos: list, backends=("torch", "int8", "onnx"),
+                      batch_size: int = None, cache_dir: str = None) -> list:
+    """
+    Velocidad de cada backend de inferencia y acuerdo de sus etiquetas con torch fp32,
+    que siempre se ejecuta primero como referencia. Se mide el modelo sin caché ni umbrales.
+    """
+    backends = ["torch"] + [backend for backend in backends if backend != "torch"]
+    referencia = None
+    resultados = []
+    for backend in backends:
+        with MuestreoRSS() as memoria:
+            proveedor = app.ClassifierProvider(modelos, backend=backend, cache_dir=cache_dir or app.MODEL_CACHE_DIR)
+            classifier = proveedor.get()
+            if classifier is not None:
+                inicio = time.perf_counter()
+                etiquetas, _ = app._inferir_nli(classifier, corpus, batch_size)
+                segundos = time.perf_counter() - inicio
+        if classifier is None:
+            app.logger.warning(f"Backend {backend}: no se pudo cargar ningún modelo")
+            continue
+        resultado = {
+            "backend": backend,
+            "backend_efectivo": proveedor.backend,
+            "modelo": proveedor.model_name,
+            "carga_s": proveedor.tiempo_carga,
+            **resumen_latencias([], segundos, len(corpus), memoria)
+        }
+        if referencia is None:
+            referencia = resultado["filas_por_segundo"], etiquetas
+        resultado["aceleracion"] = resultado["filas_por_segundo"] / referencia[0] if referencia[0] else 0.0
+        resultado["acuerdo_fp32"] = float(np.mean([a == b for a, b in zip(etiquetas, referencia[1])])) if etiquetas else 1.0
+        resultados.append(resultado)
+        app.logger.info(f"[{backend}] {resultado['filas_por_segundo']:.1f} tickets/s, "
+                        f"x{resultado['aceleracion']:.2f}, acuerdo {resultado['acuerdo_fp32']:.1%}")
+    return resultados
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+# Proceso web mínimo: importa la aplicación y clasifica su primer ticket
+CODIGO_WORKER = """
+import json, os, time
+import app
+app.clasificar_lote(["Mi pedido no llegó"])
+print(json.dumps({"arranque_s": time.time() - float(os.environ["BENCHMARK_T0"]),
+                  "rss_mb": app.rss_mb(), "motor": app._motor_activo()}))
+"""
+
+def _lanzar_workers(n: int, entorno: dict, timeout: float = 600) -> list:
+    """Arranca `n` procesos a la vez (como tras un despliegue) y devuelve la medición de cada uno."""
+    entorno = {**entorno, "BENCHMARK_T0": repr(time.time())}
+    procesos = [
+        subprocess.Popen([sys.executable, "-c", CODIGO_WORKER], env=entorno, cwd=DIRECTORIO,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(n)
+    ]
+    mediciones = []
+    for proceso in procesos:
+        salida, _ = proceso.communicate(timeout=timeout)
+        if proceso.returncode:
+            raise RuntimeError(f"Un worker del benchmark terminó con código {proceso.returncode}")
+        mediciones.append(json.loads(salida.strip().splitlines()[-1]))
+    return mediciones
+
+def _resumen_workers(mediciones: list) -> dict:
+    return {
+        "arranque_s_medio": float(np.mean([m["arranque_s"] for m in mediciones])),
+        "arranque_s_max": max(m["arranque_s"] for m in mediciones),
+        "rss_mb_por_worker": float(np.mean([m["rss_mb"] for m in mediciones])),
+        "rss_total_mb": sum(m["rss_mb"] for m in mediciones),
+        "motores": sorted({m["motor"] for m in mediciones})
+    }
+
+def medir_arranque(workers: int = 2, modelos: list = None, timeout: float = 600) -> dict:
+    """
+    Memoria y arranque en frío de `workers` procesos web hasta clasificar su primer ticket:
+    - independiente: cada proceso carga su propia copia del modelo.
+    - servidor: un solo proceso (--servidor-inferencia) tiene el modelo y los demás le envían
+      sus lotes por un socket Unix. Se mide también el arranque y la memoria del servidor.
+    """
+    entorno = {clave: valor for clave, valor in os.environ.items() if clave != "TICKET_INFERENCE_SOCKET"}
+    entorno["TICKET_CLASSIFIER_MODE"] = "model"
+    if modelos:
+        entorno["TICKET_MODELS"] = ",".join(modelos)
+    resultado = {"workers": workers, "independiente": _resumen_workers(_lanzar_workers(workers, entorno, timeout))}
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_socket = os.path.join(directorio, "inferencia.sock")
+        inicio = time.perf_counter()
+        servidor = subprocess.Popen([sys.executable, "app.py", "--servidor-inferencia", ruta_socket], env=entorno,
+                                    cwd=DIRECTORIO, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            cliente = app.ClienteInferencia(ruta_socket, app.INFERENCE_AUTHKEY)
+            while True:
+                try:
+                    cliente.info()
+                    break
+                except ConnectionError:
+                    if servidor.poll() is not None or time.perf_counter() - inicio > timeout:
+                        raise RuntimeError("El servidor de inferencia no arrancó (¿se puede cargar el modelo?)")
+                    time.sleep(0.1)
+            arranque_servidor = time.perf_counter() - inicio
+            medidas = _lanzar_workers(workers, {**entorno, "TICKET_INFERENCE_SOCKET": ruta_socket}, timeout)
+            info = cliente.info()
+        finally:
+            servidor.terminate()
+            servidor.wait()
+    resumen = _resumen_workers(medidas)
+    resultado["servidor"] = {
+        **resumen,
+        "servidor_arranque_s": arranque_servidor,
+        "servidor_rss_mb": info["rss_mb"],
+        "rss_total_mb": resumen["rss_total_mb"] + info["rss_mb"]
+    }
+    app.logger.info(f"Arranque con {workers} workers: independiente {resultado['independiente']['rss_total_mb']:.0f} MB, "
+                    f"con servidor {resultado['servidor']['rss_total_mb']:.0f} MB")
+    return resultado
+
+def ejecutar_benchmark(filas: int = 1000, ratio_duplicados: float = 0.3, modos=("keywords", "stub"),
+                       batch_size: int = None, latencia_par_ms: float = 0.0, semilla: int = 42,
+                       backends=(), modelos=None, workers_arranque: int = 0) -> dict:
+    """Ejecuta todas las mediciones y devuelve un dict serializable a JSON."""
+    corpus = generar_corpus(filas, ratio_duplicados, semilla=semilla)
+    resultados = []
+    with tempfile.TemporaryDirectory() as directorio:
+        for modo in modos:
+            mediciones = {
+                "clasificar_texto": lambda: medir_por_ticket(app.clasificar_texto, corpus),
+                "es_urgente": lambda: medir_por_ticket(app.es_urgente, corpus),
+                "procesar_tickets": lambda: medir_procesar_tickets(corpus, directorio, batch_size),
+                "TicketSystem.create_ticket": lambda: medir_create_ticket(corpus, directorio),
+            }
+            for funcion, medir in mediciones.items():
+                with entorno_benchmark(proveedor_para_modo(modo, latencia_par_ms)):
+                    resultado = medir()
+                resultados.append({"funcion": funcion, "modo": modo, **resultado})
+                app.logger.info(f"[{modo}] {funcion}: {resultado['filas_por_segundo']:.1f} tickets/s")
+    modelos = modelos or app.MODELOS
+    return {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "config": {
+            "filas": filas,
+            "ratio_duplicados": ratio_duplicados,
+            "modos": list(modos),
+            "batch_size": batch_size or app.BATCH_SIZE,
+            "latencia_par_ms": latencia_par_ms,
+            "semilla": semilla,
+            "backends": list(backends),
+            "modelos": modelos if backends or workers_arranque else [],
+            "workers_arranque": workers_arranque
+        },
+        "resultados": resultados,
+        "palabras_clave": comparar_palabras_clave(corpus),
+        "backends": comparar_backends(corpus, modelos, backends, batch_size) if backends else [],
+        "arranque": medir_arranque(workers_arranque, modelos) if workers_arranque else None
+    }
+
+# 4. Ejecución desde la línea de comandos
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de clasificación de tickets")
+    parser.add_argument("--filas", type=int, default=1000, help="Tamaño del corpus sintético")
+    parser.add_argument("--duplicados", type=float, default=0.3, help="Proporción de descripciones repetidas")
+    parser.add_argument("--modos", nargs="+", default=["keywords", "stub"], choices=MODOS,
+                        help="keywords: solo reglas; stub: modelo simulado sin red; modelo: modelo real")
+    parser.add_argument("--batch-size", type=int, default=None, help="Tamaño de lote para procesar_tickets")
+    parser.add_argument("--latencia-par-ms", type=float, default=0.0,
+                        help="Latencia simulada por par premisa/hipótesis en el modo stub")
+    parser.add_argument("--backends", nargs="*", default=[], choices=app.ClassifierProvider.BACKENDS,
+                        help="Compara la velocidad y el acuerdo con fp32 de estos backends (requiere el modelo real)")
+    parser.add_argument("--modelo", nargs="+", default=None,
+                        help="Modelo(s) para --backends y --arranque (por defecto MODELOS)")
+    parser.add_argument("--arranque", type=int, default=0, metavar="WORKERS",
+                        help="Compara memoria y arranque de WORKERS procesos con modelo propio o con servidor de inferencia")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    app.logger.setLevel("WARNING")
+    resultado = ejecutar_benchmark(args.filas, args.duplicados, args.modos, args.batch_size,
+                                   args.latencia_par_ms, args.semilla, args.backends, args.modelo, args.arranque)
+    salida = args.salida or f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    for r in resultado["resultados"]:
+        latencia = r.get("latencia_ms")
+        detalle = f" p50={latencia['p50']:.3f}ms p95={latencia['p95']:.3f}ms p99={latencia['p99']:.3f}ms" if latencia else ""
+        print(f"{r['modo']:>9} {r['funcion']:<28} {r['filas_por_segundo']:>10.1f} tickets/s{detalle} "
+              f"pico +{r['rss_pico_incremento_mb']:.1f} MB, retenido +{r['rss_retenido_mb']:.1f} MB")
+    for nombre, r in resultado["palabras_clave"].items():
+        print(f"palabras clave ({nombre}): {r['original_s']:.3f}s recorrido original, {r['matcher_s']:.3f}s matcher "
+              f"(x{r['aceleracion']:.2f}, acuerdo {r['acuerdo']:.1%})")
+    for r in resultado["backends"]:
+        print(f"{r['backend']:>9} {r['modelo']:<28} {r['filas_por_segundo']:>10.1f} tickets/s "
+              f"x{r['aceleracion']:.2f} acuerdo con fp32 {r['acuerdo_fp32']:.1%}")
+    if resultado["arranque"]:
+        for modo in ("independiente", "servidor"):
+            r = resultado["arranque"][modo]
+            print(f"{modo:>13} {resultado['arranque']['workers']} workers: {r['rss_mb_por_worker']:.0f} MB/worker, "
+                  f"{r['rss_total_mb']:.0f} MB en total, arranque {r['arranque_s_max']:.1f}s")
+    print(f"Resultados guardados en {salida}")
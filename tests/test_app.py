@@ -1,6 +1,34 @@
+import os
+import re
+import json
+import tempfile
+import threading
+import importlib.util
 import unittest
+from unittest import mock
 import pandas as pd
-from app import clasificar_texto, es_urgente, procesar_tickets, TicketSystem
+import app
+from app import (
+    clasificar_texto, clasificar_lote, es_urgente, procesar_tickets, TicketSystem, ClasificacionCache,
+    crear_ticket_store, ConjuntoHashes
+)
+
+class FakeClassifier:
+    """Simula el pipeline zero-shot devolviendo etiquetas y puntuaciones fijas."""
+    def __init__(self, respuestas):
+        self.respuestas = respuestas
+        self.llamadas = []
+
+    def __call__(self, sequences, **kwargs):
+        self.llamadas.append((sequences, kwargs))
+        return [
+            {"sequence": seq, "labels": [self.respuestas[seq][0]], "scores": [self.respuestas[seq][1]]}
+            for seq in sequences
+        ]
+
+def con_modelo(fake):
+    """Sustituye el modelo del proveedor por un clasificador simulado."""
+    return mock.patch.multiple(app.proveedor_modelo, classifier=fake, _intentado=True, modo="model")
 
 class TestClasificacion(unittest.TestCase):
     def test_clasificar_texto_keywords(self):
@@ -16,6 +44,357 @@ class TestClasificacion(unittest.TestCase):
         self.assertTrue(es_urgente("No funciona el producto"))
         self.assertFalse(es_urgente("Consulta sobre mi pedido"))
 
+    def test_matcher_respeta_prioridad_y_urgencia(self):
+        casos = {
+            "Impuesto mal calculado": ("facturación", True),
+            "Mi cuenta no recibe el pedido": ("logística", False),
+            "La pantalla del login falla": ("producto defectuoso", True),
+            "Cobro en tarjeta!!": ("pagos", True),
+            "Prioridad 2: sin acceso al perfil": ("cuenta", True),
+            "Consulta general": ("otros", False),
+            "": ("otros", False),
+        }
+        matcher = app.matcher_palabras_clave
+        for texto, esperado in casos.items():
+            with self.subTest(texto=texto):
+                self.assertEqual(matcher.analizar(texto), esperado)
+                self.assertEqual(app.clasificar_con_palabras_clave(texto), esperado[0])
+                self.assertEqual(es_urgente(texto), esperado[1])
+        resultado = matcher.analizar_serie(pd.Series(list(casos)))
+        self.assertEqual(list(zip(resultado["categoria"], resultado["urgente"])), list(casos.values()))
+
+    def test_matcher_coincidencias_solapadas_y_mayusculas(self):
+        # "recargo" (b) contiene "cargo" (a, más prioritaria), que empieza dentro de la coincidencia de b
+        matcher = app.MatcherPalabrasClave(
+            {"a": re.compile("cargo"), "b": re.compile("recargo|rec"), "c": re.compile("IVA")}, [r"\bya\b"]
+        )
+        self.assertEqual(matcher.categoria("Un recargo extra"), "a")
+        self.assertEqual(matcher.coincidencias("Un recargo extra"), ["a", "b"])
+        # Un patrón con mayúsculas se sigue buscando sin distinguir mayúsculas
+        self.assertEqual(matcher.categoria("El iva está mal"), "c")
+        self.assertEqual(matcher.analizar("Lo necesito YA"), ("otros", True))
+
+class TestClasificacionLote(unittest.TestCase):
+    def test_clasificar_lote_keywords(self):
+        textos = ["Mi pedido no llegó", "Pantalla rota", "Consulta general"]
+        self.assertEqual(clasificar_lote(textos), [clasificar_texto(t) for t in textos])
+        self.assertEqual(clasificar_lote([]), [])
+
+    def test_clasificar_lote_umbrales(self):
+        fake = FakeClassifier({
+            "Cobro duplicado": ("pagos", 0.9),
+            "Dónde está mi caja": ("logística", 0.45),  # supera el umbral de logística (0.4)
+            "Consulta sobre el recibo": ("cuenta", 0.45),  # no supera el umbral por defecto
+        })
+        with con_modelo(fake):
+            categorias = clasificar_lote(list(fake.respuestas), batch_size=8)
+        self.assertEqual(categorias, ["pagos", "logística", "facturación"])
+        self.assertEqual(len(fake.llamadas), 1)
+        self.assertEqual(fake.llamadas[0][1]["batch_size"], 8)
+
+    def test_clasificar_lote_duplicados_una_llamada(self):
+        fake = FakeClassifier({"Cobro repetido en tarjeta": ("pagos", 0.9)})
+        with con_modelo(fake), mock.patch.object(app, "cache_clasificacion", ClasificacionCache()):
+            categorias = clasificar_lote(["Cobro repetido en tarjeta", "cobro  repetido en TARJETA"])
+            self.assertEqual(categorias, ["pagos", "pagos"])
+            self.assertEqual(fake.llamadas[0][0], ["Cobro repetido en tarjeta"])
+            clasificar_lote(["Cobro repetido en tarjeta"])
+            self.assertEqual(len(fake.llamadas), 1)
+
+    def test_cascada_solo_envia_al_modelo_los_no_decisivos(self):
+        fake = FakeClassifier({
+            "Cobro de la factura": ("facturación", 0.9),  # coincide con pagos y facturación
+            "Consulta general": ("cuenta", 0.7),  # no coincide con ninguna
+            "Mi pedido no llegó": ("logística", 0.9),
+        })
+        with con_modelo(fake), mock.patch.object(app, "cache_clasificacion", ClasificacionCache()), \
+                mock.patch.object(app, "TICKET_CASCADE", True), mock.patch.object(app, "CASCADE_SAMPLE_RATE", 0.0):
+            antes = app.contadores_clasificacion.instantanea()
+            categorias = clasificar_lote(["Mi pedido no llegó", "Cobro de la factura", "Consulta general"])
+            despues = app.contadores_clasificacion.instantanea()
+        self.assertEqual(categorias, ["logística", "facturación", "cuenta"])
+        self.assertEqual(fake.llamadas[0][0], ["Cobro de la factura", "Consulta general"])
+        self.assertEqual(despues["palabras_clave"] - antes["palabras_clave"], 1)
+        self.assertEqual(despues["modelo"] - antes["modelo"], 2)
+
+    def test_cascada_muestra_mide_acuerdo(self):
+        fake = FakeClassifier({"Mi pedido no llegó": ("pagos", 0.9)})
+        with con_modelo(fake), mock.patch.object(app, "cache_clasificacion", ClasificacionCache()), \
+                mock.patch.object(app, "TICKET_CASCADE", True), mock.patch.object(app, "CASCADE_SAMPLE_RATE", 1.0):
+            antes = app.contadores_clasificacion.instantanea()
+            self.assertEqual(clasificar_lote(["Mi pedido no llegó"]), ["logística"])
+            despues = app.contadores_clasificacion.instantanea()
+        self.assertEqual(despues["muestras_cascada"] - antes["muestras_cascada"], 1)
+        self.assertEqual(despues["acuerdos_cascada"] - antes["acuerdos_cascada"], 0)
+        self.assertEqual(despues["modelo"] - antes["modelo"], 0)
+
+    def test_cascada_acuerdo_usa_la_etiqueta_sin_umbral(self):
+        # Una respuesta de baja confianza se sustituiría por las palabras clave: no cuenta como acuerdo
+        textos = ["Mi pedido no llegó", "El envío no llegó", "Envío retrasado"]
+        fake = FakeClassifier({texto: ("pagos", 0.2) for texto in textos})
+        with con_modelo(fake), mock.patch.object(app, "cache_clasificacion", ClasificacionCache()), \
+                mock.patch.object(app, "TICKET_CASCADE", True), mock.patch.object(app, "CASCADE_SAMPLE_RATE", 1.0):
+            antes = app.contadores_clasificacion.instantanea()
+            self.assertEqual(clasificar_lote(textos), ["logística"] * 3)
+            despues = app.contadores_clasificacion.instantanea()
+        self.assertEqual(despues["muestras_cascada"] - antes["muestras_cascada"], 3)
+        self.assertEqual(despues["acuerdos_cascada"] - antes["acuerdos_cascada"], 0)
+
+class TestClassifierProvider(unittest.TestCase):
+    def test_modo_keywords_no_carga_modelo(self):
+        proveedor = app.ClassifierProvider(app.MODELOS, modo="keywords")
+        with mock.patch.object(proveedor, "_cargar") as cargar:
+            self.assertIsNone(proveedor.get())
+            proveedor.warmup().join()
+        cargar.assert_not_called()
+        self.assertEqual(proveedor.descripcion(), "PALABRAS CLAVE")
+
+    def test_carga_una_sola_vez(self):
+        proveedor = app.ClassifierProvider(app.MODELOS)
+        def cargar():
+            proveedor.classifier = "modelo"
+            proveedor._intentado = True
+        with mock.patch.object(proveedor, "_cargar", side_effect=cargar) as mock_cargar:
+            hilo = proveedor.warmup()
+            hilo.join()
+            self.assertEqual(proveedor.get(), "modelo")
+        self.assertEqual(mock_cargar.call_count, 1)
+
+    def test_import_no_carga_modelo(self):
+        import subprocess, sys
+        codigo = "import sys, app; print('torch' in sys.modules, 'gradio' in sys.modules)"
+        salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(salida.stdout.strip(), "False False")
+
+def crear_modelo_nli_minimo(directorio: str) -> str:
+    """Modelo NLI diminuto con pesos aleatorios, creado sin red, con la estructura de un modelo real."""
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+    caracteres = list("abcdefghijklmnopqrstuvwxyzáéíóúñ.,¿?!")
+    vocabulario = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + caracteres + [f"##{c}" for c in caracteres]
+    config = BertConfig(
+        vocab_size=len(vocabulario), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, initializer_range=0.5, num_labels=3,
+        id2label={0: "contradiction", 1: "neutral", 2: "entailment"},
+        label2id={"contradiction": 0, "neutral": 1, "entailment": 2}
+    )
+    torch.manual_seed(0)
+    BertForSequenceClassification(config).save_pretrained(directorio)
+    BertTokenizerFast(vocab={token: i for i, token in enumerate(vocabulario)}).save_pretrained(directorio)
+    return directorio
+
+class TestBackendsInferencia(unittest.TestCase):
+    TEXTOS = ["Mi pedido no llegó", "Cobro duplicado en la tarjeta del mes pasado", "Pantalla rota", "Hola"]
+
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls.modelo = crear_modelo_nli_minimo(cls._tmp.name)
+        cls.referencia = cls.clasificar(app.ClassifierProvider([cls.modelo]))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tmp.cleanup()
+
+    @classmethod
+    def clasificar(cls, proveedor):
+        return proveedor.get()(cls.TEXTOS, candidate_labels=list(app.CATEGORIAS),
+                               hypothesis_template=app.HYPOTHESIS_TEMPLATE, batch_size=3)
+
+    def test_backend_desconocido(self):
+        with self.assertRaises(ValueError):
+            app.ClassifierProvider(app.MODELOS, backend="tensorrt")
+
+    def test_int8_se_cuantiza_una_vez(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            resultados = self.clasificar(app.ClassifierProvider([self.modelo], backend="int8", cache_dir=cache_dir))
+            # Con pesos aleatorios la cuantización puede cambiar etiquetas; el acuerdo real lo mide el benchmark
+            for r in resultados:
+                self.assertEqual(sorted(r["labels"]), sorted(app.CATEGORIAS))
+                self.assertAlmostEqual(sum(r["scores"]), 1.0, places=4)
+            with mock.patch("transformers.AutoModelForSequenceClassification.from_pretrained", side_effect=OSError):
+                proveedor = app.ClassifierProvider([self.modelo], backend="int8", cache_dir=cache_dir)
+                self.clasificar(proveedor)
+            self.assertEqual(proveedor.backend, "int8")
+
+    @unittest.skipUnless(importlib.util.find_spec("onnxruntime"), "onnxruntime no está instalado")
+    def test_onnx_replica_el_pipeline(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            proveedor = app.ClassifierProvider([self.modelo], backend="onnx", cache_dir=cache_dir)
+            for esperado, obtenido in zip(self.referencia, self.clasificar(proveedor)):
+                self.assertEqual(obtenido["labels"], esperado["labels"])
+                for a, b in zip(obtenido["scores"], esperado["scores"]):
+                    self.assertAlmostEqual(a, b, places=5)
+            self.assertEqual(proveedor.descripcion(), f"{self.modelo} (onnx)")
+            # La exportación queda en caché: no hace falta volver a cargar el modelo de PyTorch
+            with mock.patch("transformers.AutoModelForSequenceClassification.from_pretrained", side_effect=OSError):
+                proveedor = app.ClassifierProvider([self.modelo], backend="onnx", cache_dir=cache_dir)
+                self.clasificar(proveedor)
+            self.assertEqual(proveedor.backend, "onnx")
+
+def proveedor_con(classifier, nombre="fake-nli"):
+    proveedor = app.ClassifierProvider([nombre])
+    proveedor.classifier = classifier
+    proveedor._intentado = True
+    return proveedor
+
+class TestServidorInferencia(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.ruta = os.path.join(self._tmp.name, "inferencia.sock")
+        self.fake = FakeClassifier({"Mi pedido no llegó": ("logística", 0.9), "Cobro doble": ("pagos", 0.8)})
+
+    def iniciar(self, **opciones):
+        servidor = app.ServidorInferencia(self.ruta, proveedor_con(self.fake), **opciones)
+        servidor.iniciar()
+        self.addCleanup(servidor.cerrar)
+        return servidor
+
+    def test_clientes_comparten_el_modelo_del_servidor(self):
+        self.iniciar()
+        self.assertEqual(os.stat(self.ruta).st_mode & 0o777, 0o600)
+        remoto = app.ClassifierProvider(["otro-modelo"], socket=self.ruta)
+        with mock.patch.object(app, "proveedor_modelo", remoto), \
+                mock.patch.object(app, "cache_clasificacion", ClasificacionCache()):
+            self.assertEqual(clasificar_lote(["Mi pedido no llegó", "Cobro doble"]), ["logística", "pagos"])
+        # El nombre del modelo (parte de la clave de caché) es el del servidor
+        self.assertEqual(remoto.model_name, "fake-nli")
+        self.assertEqual(remoto.descripcion(), "fake-nli vía servidor de inferencia")
+        self.assertEqual(self.fake.llamadas[0][1]["candidate_labels"], app.proveedor_reglas.actual().nombres)
+        # Los errores del modelo llegan al cliente, que sigue conectado
+        with self.assertRaisesRegex(RuntimeError, "KeyError"):
+            remoto.get()(["desconocido"], candidate_labels=["pagos"])
+        self.assertEqual(remoto.get()(["Cobro doble"], candidate_labels=["pagos"])[0]["labels"], ["pagos"])
+
+    def test_reconecta_tras_reiniciar_el_servidor(self):
+        servidor = self.iniciar()
+        cliente = app.ClienteInferencia(self.ruta)
+        self.assertEqual(cliente.info()["pid"], os.getpid())
+        servidor.cerrar()
+        with self.assertRaises(ConnectionError):
+            cliente.info()
+        self.iniciar()
+        self.assertEqual(cliente(["Cobro doble"], candidate_labels=["pagos"])[0]["labels"], ["pagos"])
+
+    def test_autenticacion(self):
+        self.iniciar(authkey=b"secreto")
+        self.assertEqual(app.ClienteInferencia(self.ruta, b"secreto").info()["modelo"], "fake-nli")
+        with self.assertRaises(Exception):
+            app.ClienteInferencia(self.ruta, b"otra").info()
+
+    def test_sin_servidor_usa_palabras_clave(self):
+        remoto = app.ClassifierProvider(app.MODELOS, socket=self.ruta)
+        with mock.patch.object(app, "INFERENCE_CONNECT_TIMEOUT", 0), self.assertLogs(app.logger, "ERROR"):
+            self.assertIsNone(remoto.get())
+        self.assertEqual(remoto.descripcion(), "PALABRAS CLAVE (modelo no disponible)")
+
+    def test_servidor_sin_modelo_no_arranca(self):
+        with self.assertRaises(RuntimeError):
+            app.ServidorInferencia(self.ruta, app.ClassifierProvider(app.MODELOS, modo="keywords")).iniciar()
+        self.assertFalse(os.path.exists(self.ruta))
+
+class FakeEncoder(app.EmbeddingClassifier):
+    """Encoder simulado: cada texto se proyecta según sus palabras clave."""
+    VECTORES = {
+        "logística": [1.0, 0.0, 0.0, 0.0, 0.0], "pagos": [0.0, 1.0, 0.0, 0.0, 0.0],
+        "producto defectuoso": [0.0, 0.0, 1.0, 0.0, 0.0], "cuenta": [0.0, 0.0, 0.0, 1.0, 0.0],
+        "facturación": [0.0, 0.0, 0.0, 0.0, 1.0],
+    }
+
+    def __init__(self, cache_dir):
+        super().__init__("fake-encoder", app.DESCRIPCIONES_CATEGORIAS, cache_dir)
+        self.codificados = []
+        self._intentado = True
+        self._model = object()
+
+    def codificar(self, textos, batch_size=32):
+        self.codificados.extend(textos)
+        vectores = []
+        for texto in textos:
+            if texto in app.DESCRIPCIONES_CATEGORIAS.values():
+                categoria = next(c for c, d in app.DESCRIPCIONES_CATEGORIAS.items() if d == texto)
+                vectores.append(self.VECTORES[categoria])
+            elif "ambiguo" in texto:
+                vectores.append([0.7, 0.7, 0.0, 0.0, 0.0])
+            else:
+                vectores.append(self.VECTORES.get(app.clasificar_con_palabras_clave(texto), [0.45, 0.45, 0.45, 0.45, 0.45]))
+        return pd.DataFrame(vectores).to_numpy()
+
+class TestEmbeddingClassifier(unittest.TestCase):
+    def test_embeddings_de_etiquetas_en_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            encoder = FakeEncoder(tmp)
+            encoder.clasificar(["Mi pedido no llegó"])
+            encoder.clasificar(["Cobro duplicado"])
+            self.assertEqual(len(encoder.codificados), 5 + 2)
+            otro = FakeEncoder(tmp)
+            otro.clasificar(["Mi pedido no llegó"])
+            self.assertEqual(otro.codificados, ["Mi pedido no llegó"])
+
+    def test_una_sola_categoria(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            encoder = FakeEncoder(tmp)
+            descripciones = {"pagos": app.DESCRIPCIONES_CATEGORIAS["pagos"]}
+            etiquetas, puntuaciones, margenes = encoder.clasificar(["Cobro duplicado"], descripciones=descripciones)
+        self.assertEqual(etiquetas, ["pagos"])
+        self.assertAlmostEqual(float(puntuaciones[0]), 1.0)
+        self.assertGreater(float(margenes[0]), 0)
+
+    def test_motor_embeddings_con_nli_para_ambiguos(self):
+        fake_nli = FakeClassifier({"Caso ambiguo sin palabras": ("pagos", 0.9), "Consulta general": ("cuenta", 0.2)})
+        with tempfile.TemporaryDirectory() as tmp, con_modelo(fake_nli), \
+                mock.patch.object(app, "proveedor_embeddings", FakeEncoder(tmp)), \
+                mock.patch.object(app, "TICKET_CLASSIFIER_ENGINE", "embeddings"), \
+                mock.patch.object(app, "cache_clasificacion", ClasificacionCache()):
+            categorias = clasificar_lote(["Mi pedido no llegó", "Caso ambiguo sin palabras", "Consulta general"])
+        # Solo los textos con margen bajo pasan por NLI; el último no supera el umbral y usa palabras clave
+        self.assertEqual(categorias, ["logística", "pagos", "otros"])
+        self.assertEqual([llamada[0] for llamada in fake_nli.llamadas], [["Caso ambiguo sin palabras", "Consulta general"]])
+
+class TestClasificacionCache(unittest.TestCase):
+    def test_lru_expulsa_la_entrada_mas_antigua(self):
+        cache = ClasificacionCache(max_entradas=2)
+        cache.set("a", "pagos")
+        cache.set("b", "cuenta")
+        cache.get("a")
+        cache.set("c", "otros")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "pagos")
+        self.assertEqual(cache.estadisticas()["aciertos"], 2)
+
+    def test_persistencia_sqlite(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "cache.db")
+            cache = ClasificacionCache(ruta=ruta)
+            clave = cache.clave("categoria", "Mi pedido no llegó")
+            cache.set(clave, "logística")
+            cache._conn.close()
+            self.assertEqual(ClasificacionCache(ruta=ruta).get(clave), "logística")
+            self.assertEqual(clave, cache.clave("categoria", "  mi PEDIDO no llegó "))
+
+    def test_sqlite_por_lotes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "cache.db")
+            cache = ClasificacionCache(ruta=ruta)
+            claves = cache.claves("clasificacion", [f"Ticket {i}" for i in range(1200)])
+            cache.set_muchos([(clave, ["otros", None]) for clave in claves])
+            self.assertEqual(cache._conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            otra = ClasificacionCache(ruta=ruta)
+            encontrados = otra.get_muchos(claves + ["inexistente"])
+            self.assertEqual(len(encontrados), 1200)
+            self.assertEqual(otra.estadisticas()["fallos"], 1)
+
+    def test_sqlite_bloqueado_no_detiene_la_clasificacion(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ClasificacionCache(ruta=os.path.join(tmp, "cache.db"))
+            cache._conn.close()  # cualquier operación sobre SQLite falla
+            with mock.patch.object(app, "cache_clasificacion", cache):
+                self.assertEqual(clasificar_lote(["Mi pedido no llegó", "Mi pedido no llegó"]), ["logística"] * 2)
+                self.assertEqual(clasificar_lote(["Mi pedido no llegó"]), ["logística"])
+            self.assertEqual(cache.estadisticas()["aciertos"], 2)
+
 class TestProcesamientoCSV(unittest.TestCase):
     def test_procesar_tickets(self):
         data = {'descripcion': [
@@ -34,6 +413,361 @@ class TestProcesamientoCSV(unittest.TestCase):
         self.assertIn('categoria', result.columns)
         self.assertIn('urgente', result.columns)
 
+    def test_procesar_tickets_reporta_aciertos_de_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': ['Mi pedido no llegó'] * 3}).to_csv(entrada, index=False)
+            with mock.patch.object(app, "cache_clasificacion", ClasificacionCache()):
+                result = procesar_tickets(entrada, output_csv=os.path.join(tmp, 'salida.csv'),
+                                          urgentes_csv=os.path.join(tmp, 'urgentes.csv'))[0]
+        # La urgencia no pasa por la caché: solo cuentan las consultas de categoría
+        self.assertEqual(result.attrs["cache"]["consultas"], 3)
+        self.assertEqual(result.attrs["cache"]["aciertos"], 2)
+        # Solo la primera aparición se clasifica; sin modelo la resuelven las palabras clave
+        self.assertEqual(result.attrs["niveles"]["palabras_clave"], 1)
+
+    def test_estadisticas_no_mezclan_otros_hilos(self):
+        # Lo que se clasifica a la vez en otro hilo (otro trabajo, la API) no cuenta para este archivo
+        def clasificar_en_otro_hilo(*_):
+            hilo = threading.Thread(target=clasificar_lote, args=([f"Mi pedido {i} no llegó" for i in range(50)],))
+            hilo.start()
+            hilo.join()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': ['Mi pedido no llegó', 'Error en mi pago', 'Consulta general']}).to_csv(entrada, index=False)
+            estadisticas = {}
+            with mock.patch.object(app, "cache_clasificacion", ClasificacionCache()):
+                procesar_tickets(entrada, output_csv=os.path.join(tmp, 'salida.csv'), chunksize=1,
+                                 estadisticas=estadisticas, progreso=clasificar_en_otro_hilo)
+        self.assertEqual(estadisticas["niveles"]["palabras_clave"], 3)
+        self.assertEqual(estadisticas["cache"]["consultas"], 3)
+
+    def test_procesar_tickets_streaming(self):
+        descripciones = ['Mi pedido no llegó', 'Pantalla rota', 'Consulta general', 'Mi pedido no llegó', 'Pantalla rota']
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'id': range(5), 'descripcion': descripciones}).to_csv(entrada, index=False)
+            completo, urg_completo, salida_completa, *conteos = procesar_tickets(
+                entrada, output_csv=os.path.join(tmp, 'completo.csv'))
+            result, urg_stream, salida_stream, *conteos_stream = procesar_tickets(
+                entrada, output_csv=os.path.join(tmp, 'stream.csv'), chunksize=2)
+            self.assertIsNone(result)
+            self.assertEqual(conteos_stream, conteos)
+            self.assertEqual(conteos_stream, [5, 2, 2])
+            pd.testing.assert_frame_equal(pd.read_csv(salida_stream), pd.read_csv(salida_completa))
+            self.assertEqual(pd.read_csv(urg_stream)['id'].tolist(), [1, 4])
+            for archivo in {urg_completo, urg_stream}:
+                os.remove(archivo)
+
+    def test_procesar_tickets_workers_conserva_orden(self):
+        descripciones = ['Mi pedido no llegó', 'Error en mi pago', 'Pantalla rota', 'Consulta general'] * 3
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {"TICKET_CLASSIFIER_MODE": "keywords"}), \
+                mock.patch.object(app, "FRAGMENTO_WORKERS", 5):
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': descripciones}).to_csv(entrada, index=False)
+            estadisticas = {}
+            result, urgentes_file, *_ = procesar_tickets(
+                entrada, output_csv=os.path.join(tmp, 'salida.csv'), workers=2, estadisticas=estadisticas)
+            app._pools.pop(2).shutdown()
+        self.assertEqual(result['categoria'].tolist(), clasificar_lote(descripciones))
+        self.assertEqual(estadisticas["rendimiento"]["workers"], 2)
+        self.assertEqual(estadisticas["rendimiento"]["filas"], 12)
+        if urgentes_file:
+            os.remove(urgentes_file)
+
+    def test_procesar_tickets_incremental(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada, salida = os.path.join(tmp, 'export.csv'), os.path.join(tmp, 'salida.csv')
+            manifiesto = os.path.join(tmp, 'manifiesto.db')
+
+            def ejecutar(filas):
+                pd.DataFrame(filas, columns=['id', 'descripcion']).to_csv(entrada, index=False)
+                estadisticas = {}
+                result, urgentes_file, *_ = procesar_tickets(entrada, output_csv=salida, estadisticas=estadisticas,
+                                                             manifiesto=manifiesto)
+                if urgentes_file:
+                    os.remove(urgentes_file)
+                return result, estadisticas["incremental"]
+
+            ayer = [(1, 'Mi pedido no llegó'), (2, 'Error en mi pago'), (3, 'Pantalla rota'), (4, 'Consulta general')]
+            _, incremental = ejecutar(ayer)
+            self.assertEqual(incremental, {"reutilizadas": 0, "recalculadas": 4})
+
+            hoy = ayer[:1] + [(2, 'No puedo acceder a mi cuenta')] + ayer[2:] + [(5, 'Factura incorrecta, urgente')]
+            with mock.patch.object(app, "_clasificar_descripciones", wraps=app._clasificar_descripciones) as clasificar:
+                result, incremental = ejecutar(hoy)
+            self.assertEqual(incremental, {"reutilizadas": 3, "recalculadas": 2})
+            self.assertEqual(clasificar.call_args[0][0], ['No puedo acceder a mi cuenta', 'Factura incorrecta, urgente'])
+            self.assertEqual(result['categoria'].tolist(), clasificar_lote([d for _, d in hoy]))
+            self.assertEqual(result['urgente'].tolist(), [es_urgente(d) for _, d in hoy])
+            self.assertEqual(len(pd.read_csv(salida)), 5)
+
+            # Otras reglas (umbrales) invalidan los resultados guardados
+            ruta_reglas = os.path.join(tmp, 'reglas.json')
+            with open(ruta_reglas, 'w') as f:
+                json.dump({"umbrales": {"default": 0.9}}, f)
+            with mock.patch.object(app, "proveedor_reglas", app.ProveedorReglas(ruta_reglas)):
+                _, incremental = ejecutar(hoy)
+            self.assertEqual(incremental, {"reutilizadas": 0, "recalculadas": 5})
+
+    def test_procesar_tickets_agrupa_casi_duplicados(self):
+        descripciones = [
+            'Mi pedido 1234 no llegó a tiempo',
+            'Error en mi pago con tarjeta',
+            'mi pedido #98765 no llego a tiempo!!',
+            '¡Urgente! Mi pedido 55 no llegó a tiempo',
+            'Error en mi pago con tarjeta.',
+            'La pantalla llegó rota'
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': descripciones}).to_csv(entrada, index=False)
+            estadisticas = {}
+            with mock.patch.object(app, "_clasificar_descripciones", wraps=app._clasificar_descripciones) as clasificar:
+                _, urgentes_file, salida, *_ = procesar_tickets(
+                    entrada, output_csv=os.path.join(tmp, 'salida.csv'), chunksize=2, estadisticas=estadisticas,
+                    agrupar=True)
+            enviados = [d for llamada in clasificar.call_args_list for d in llamada[0][0]]
+            resultado = pd.read_csv(salida)
+        self.assertEqual(enviados, [descripciones[0], descripciones[1], descripciones[5]])
+        self.assertEqual(resultado['cluster_id'].tolist(), [0, 1, 0, 0, 1, 2])
+        self.assertEqual(resultado['categoria'].tolist(), clasificar_lote([descripciones[i] for i in (0, 1, 0, 0, 1, 5)]))
+        # La urgencia se evalúa en cada fila, no se hereda del representante
+        self.assertEqual(resultado['urgente'].tolist(), [es_urgente(d) for d in descripciones])
+        self.assertTrue(resultado['urgente'][3] and not resultado['urgente'][0])
+        self.assertEqual(estadisticas["agrupacion"], {"grupos": 3, "heredadas": 3, "trabajo_evitado": 0.5})
+        if urgentes_file:
+            os.remove(urgentes_file)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow no está instalado")
+    def test_procesar_tickets_parquet_y_arrow(self):
+        import pyarrow.parquet as pq
+        descripciones = ['Mi pedido no llegó', 'Pantalla rota, urgente', 'Error en mi pago', 'Consulta general'] * 3
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.parquet')
+            pd.DataFrame({'id': range(12), 'descripcion': descripciones}).to_parquet(entrada, index=False)
+            salida = os.path.join(tmp, 'salida.parquet')
+            _, urgentes_file, output_file, total, num_urgentes, _ = procesar_tickets(entrada, output_csv=salida, chunksize=5)
+            self.assertEqual(total, 12)
+            self.assertIsNone(urgentes_file)  # sin segunda copia de los urgentes
+            self.assertEqual(pq.ParquetFile(salida).metadata.num_row_groups, 3)
+            resultado = pd.read_parquet(salida)
+            self.assertEqual(resultado['categoria'].tolist(), clasificar_lote(descripciones))
+            urgentes = app.leer_urgentes(salida)
+            self.assertEqual(len(urgentes), num_urgentes)
+            self.assertEqual(urgentes['id'].tolist(), resultado[resultado['urgente']]['id'].tolist())
+
+            # Entrada CSV, salida Arrow IPC elegida por la extensión
+            entrada_csv = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': descripciones}).to_csv(entrada_csv, index=False)
+            salida_arrow = os.path.join(tmp, 'salida.arrow')
+            procesar_tickets(entrada_csv, output_csv=salida_arrow)
+            self.assertEqual(pd.read_feather(salida_arrow)['categoria'].tolist(), clasificar_lote(descripciones))
+            self.assertEqual(len(app.leer_urgentes(salida_arrow)), num_urgentes)
+            self.assertEqual(app._contar_filas(salida_arrow), 12)
+
+    def test_cli_parquet_no_dice_que_no_hay_urgentes(self):
+        import subprocess, sys
+        descripciones = ['Mi pedido no llegó', 'Pantalla rota, urgente', 'Error en mi pago']
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.parquet')
+            pd.DataFrame({'descripcion': descripciones}).to_parquet(entrada, index=False)
+            salida = os.path.join(tmp, 'salida.parquet')
+            proceso = subprocess.run(
+                [sys.executable, "app.py", entrada, "--salida", salida], capture_output=True, text=True,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                env={**os.environ, "TICKET_CLASSIFIER_MODE": "keywords", "TICKET_CACHE_PATH": ""}
+            )
+            self.assertEqual(proceso.returncode, 0, proceso.stderr)
+            self.assertIn(f"Tickets urgentes: {int(pd.read_parquet(salida)['urgente'].sum())}", proceso.stderr)
+            self.assertIn(f"columna 'urgente' de {salida}", proceso.stderr)
+            self.assertNotIn("No se encontraron tickets urgentes", proceso.stderr)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow no está instalado")
+    def test_csv_a_parquet_por_fragmentos_con_tipos_variables(self):
+        # 'nota' está vacía en el primer fragmento y tiene texto en el segundo; 'importe' pasa de entero a decimal
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({
+                'descripcion': ['Mi pedido no llegó', 'Error en mi pago', 'Pantalla rota', 'Consulta general'],
+                'nota': [None, None, 'revisar', 'cliente VIP'],
+                'importe': ['10', '20', '7.5', None],
+            }).to_csv(entrada, index=False)
+            for extension in ('.parquet', '.arrow'):
+                salida = os.path.join(tmp, f'salida{extension}')
+                total = procesar_tickets(entrada, output_csv=salida, chunksize=2)[3]
+                self.assertEqual(total, 4)
+                resultado = pd.read_parquet(salida) if extension == '.parquet' else pd.read_feather(salida)
+                self.assertEqual(resultado['nota'].fillna('').tolist(), ['', '', 'revisar', 'cliente VIP'])
+                self.assertEqual(resultado['importe'].fillna('').tolist(), ['10', '20', '7.5', ''])
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow no está instalado")
+    def test_fallo_borra_la_salida_parcial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': ['Mi pedido no llegó', 'Error en mi pago', 'Pantalla rota']}).to_csv(entrada, index=False)
+            salida = os.path.join(tmp, 'salida.parquet')
+            original = app.clasificar_lote
+            llamadas = []
+            def falla_en_el_segundo(textos, batch_size=None):
+                llamadas.append(textos)
+                if len(llamadas) > 1:
+                    raise RuntimeError("fallo de prueba")
+                return original(textos, batch_size)
+            with mock.patch.object(app, "clasificar_lote", falla_en_el_segundo), self.assertRaises(RuntimeError):
+                procesar_tickets(entrada, output_csv=salida, chunksize=2)
+            self.assertFalse(os.path.exists(salida))
+
+class TestReglas(unittest.TestCase):
+    modificaciones = 0
+
+    def escribir(self, ruta, datos):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+        # Fecha de modificación distinta en cada escritura, aunque el sistema de archivos tenga poca resolución
+        self.modificaciones += 1
+        os.utime(ruta, (1_700_000_000 + self.modificaciones,) * 2)
+
+    def test_recarga_en_caliente(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'reglas.json')
+            self.escribir(ruta, {"categorias": {"envíos": "paquete|pedido"}, "urgencia": ["urgente"]})
+            proveedor = app.ProveedorReglas(ruta, intervalo=0)
+            with mock.patch.object(app, "proveedor_reglas", proveedor), \
+                    mock.patch.object(app, "cache_clasificacion", ClasificacionCache()):
+                version = proveedor.actual().version
+                self.assertEqual(clasificar_lote(["Mi pedido no llegó", "Pantalla rota"]), ["envíos", "otros"])
+                self.assertTrue(es_urgente("Es urgente"))
+                self.assertEqual(app.clasificar_para_api(["Mi paquete"])[0]["rules_version"], version)
+
+                with proveedor.fijar() as fijadas:
+                    self.escribir(ruta, {"categorias": {"producto defectuoso": "pantalla"}, "urgencia": ["roto", "ya"]})
+                    # Dentro de fijar() se siguen usando las reglas anteriores
+                    self.assertIs(proveedor.actual(), fijadas)
+                self.assertNotEqual(proveedor.actual().version, version)
+                self.assertEqual(clasificar_lote(["Mi pedido no llegó", "Pantalla rota"]), ["otros", "producto defectuoso"])
+                self.assertFalse(es_urgente("Es urgente"))
+
+                # Un archivo inválido no reemplaza las reglas vigentes
+                vigente = proveedor.actual()
+                self.escribir(ruta, {"categorias": {"pagos": "(sin cerrar"}, "urgencia": ["x", "y", "z"]})
+                with self.assertLogs(app.logger, "ERROR"):
+                    self.assertFalse(proveedor.recargar())
+                self.assertIs(proveedor.actual(), vigente)
+
+    def test_archivo_invalido_al_arrancar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'reglas.json')
+            for datos in ({"categorias": {"pagos": "pago"}, "plantilla": "sin marcador"}, {"umbral": {"default": 1}}):
+                self.escribir(ruta, datos)
+                with self.subTest(datos=datos), self.assertRaises(ValueError):
+                    app.ProveedorReglas(ruta)
+
+    @unittest.skipUnless(importlib.util.find_spec("yaml"), "PyYAML no está instalado")
+    def test_yaml_y_columna_version(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, 'reglas.yaml')
+            with open(ruta, 'w', encoding='utf-8') as f:
+                f.write("categorias:\n  pagos: cobro|tarjeta\numbrales:\n  default: 0.6\n")
+            proveedor = app.ProveedorReglas(ruta)
+            self.assertEqual(proveedor.actual().nombres, ["pagos"])
+            self.assertEqual(proveedor.actual().urgencia, app.URGENCY_PATTERNS)
+            entrada = os.path.join(tmp, 'entrada.csv')
+            pd.DataFrame({'descripcion': ['Cobro doble en mi tarjeta', 'Mi pedido no llegó']}).to_csv(entrada, index=False)
+            with mock.patch.object(app, "proveedor_reglas", proveedor):
+                resultado, urgentes_file, *_ = procesar_tickets(entrada, output_csv=os.path.join(tmp, 'salida.csv'))
+            self.assertEqual(resultado['categoria'].tolist(), ['pagos', 'otros'])
+            self.assertEqual(set(resultado['version_reglas']), {proveedor.actual().version})
+            if urgentes_file:
+                os.remove(urgentes_file)
+
+class TestMetricas(unittest.TestCase):
+    def test_formato_prometheus(self):
+        registro = app.RegistroMetricas()
+        contador = registro.contador("prueba_total", "Contador de prueba", ("codigo",))
+        histograma = registro.histograma("prueba_segundos", "Histograma de prueba", ("nivel",), buckets=(0.1, 1))
+        contador.inc(codigo=429)
+        contador.inc(2, codigo=429)
+        histograma.observar(0.05, nivel="modelo")
+        histograma.observar(0.5, n=2, nivel="modelo")
+        histograma.observar(5, nivel="modelo")
+        with self.assertRaises(ValueError):
+            contador.inc(estado="x")
+        lineas = registro.exportar().splitlines()
+        self.assertIn("# TYPE prueba_total counter", lineas)
+        self.assertIn('prueba_total{codigo="429"} 3', lineas)
+        self.assertIn('prueba_segundos_bucket{nivel="modelo",le="0.1"} 1', lineas)
+        self.assertIn('prueba_segundos_bucket{nivel="modelo",le="1"} 3', lineas)
+        self.assertIn('prueba_segundos_bucket{nivel="modelo",le="+Inf"} 4', lineas)
+        self.assertIn('prueba_segundos_count{nivel="modelo"} 4', lineas)
+        self.assertIs(registro.contador("prueba_total", "Contador de prueba", ("codigo",)), contador)
+
+    def test_procesar_tickets_registra_metricas_sin_log_por_ticket(self):
+        pd.DataFrame({'descripcion': ['Mi pedido no llegó, urgente', 'Pantalla rota']}).to_csv('test_tickets.csv', index=False)
+        procesados = app.METRICA_TICKETS.valor(origen="csv")
+        urgentes = app.METRICA_URGENTES.valor(origen="csv")
+        latencias = app.METRICA_LATENCIA.conteo(nivel="palabras_clave")
+        with mock.patch.object(app, "cache_clasificacion", ClasificacionCache()), \
+                self.assertLogs(app.logger, "INFO") as registros:
+            procesar_tickets('test_tickets.csv')
+        self.assertFalse(any("Ticket 1:" in linea for linea in registros.output))
+        self.assertEqual(app.METRICA_TICKETS.valor(origen="csv") - procesados, 2)
+        self.assertGreaterEqual(app.METRICA_URGENTES.valor(origen="csv") - urgentes, 1)
+        self.assertEqual(app.METRICA_LATENCIA.conteo(nivel="palabras_clave") - latencias, 2)
+
+class TestConjuntoHashes(unittest.TestCase):
+    def test_detecta_repetidos_entre_lotes(self):
+        vistos = ConjuntoHashes()
+        self.assertEqual(vistos.agregar([5, 7, 5]).tolist(), [False, False, True])
+        for inicio in range(0, 100, 10):
+            vistos.agregar(range(inicio + 100, inicio + 110))
+        self.assertEqual(vistos.agregar([7, 150, 999]).tolist(), [True, True, False])
+        self.assertEqual(len(vistos), 103)
+
+class TestAgrupadorDuplicados(unittest.TestCase):
+    def test_normalizar(self):
+        agrupador = app.AgrupadorDuplicados()
+        self.assertEqual(agrupador.normalizar("¡URGENTE! Mi pedido #12345 no llegó..."), "mi pedido 0 no llego")
+        # Las marcas de urgencia que también son palabras clave de una categoría se mantienen
+        self.assertEqual(agrupador.normalizar("Error: pantalla rota"), "pantalla rota")
+
+    def test_usa_los_patrones_de_urgencia_de_las_reglas(self):
+        datos = app.REGLAS_POR_DEFECTO.datos
+        reglas = app.ReglasClasificacion(datos["categorias"], datos["urgencia"] + [r"\bsin servicio\b"],
+                                         datos["umbrales"], datos["plantilla"])
+        agrupador = app.AgrupadorDuplicados(umbral=0.8, reglas=reglas)
+        self.assertEqual(agrupador.normalizar("Sin servicio: mi pedido no llegó"), "mi pedido no llego")
+        grupos, _ = agrupador.asignar(["Mi pedido no llegó a tiempo", "Sin servicio, mi pedido no llegó a tiempo"])
+        self.assertEqual(grupos, [0, 0])
+
+    def test_agrupa_por_similitud(self):
+        agrupador = app.AgrupadorDuplicados(umbral=0.8)
+        grupos, nuevos = agrupador.asignar([
+            "Mi pedido no llegó a tiempo y nadie me responde",
+            "Mi pedido no llegó a tiempo, y nadie me responde.",
+            "Mi pedido aún no llegó a tiempo y nadie me responde",
+            "No puedo acceder a mi cuenta"
+        ])
+        self.assertEqual(grupos, [0, 0, 0, 1])
+        self.assertEqual(nuevos, [True, False, False, True])
+        # Los grupos se mantienen entre llamadas (fragmentos de la misma ejecución)
+        self.assertEqual(agrupador.asignar(["no puedo acceder a mi cuenta!!"]), ([1], [False]))
+        self.assertEqual(len(agrupador), 2)
+        self.assertEqual(agrupador.propagar([0, 1, 0], ["logística", "cuenta", "pagos"]), ["logística", "cuenta", "logística"])
+
+    def test_no_agrupa_tickets_que_solo_difieren_en_la_palabra_clave(self):
+        agrupador = app.AgrupadorDuplicados(umbral=0.8)
+        plantilla = ("Hola, les escribo porque desde hace varios días tengo un problema con mi {} y nadie del "
+                     "equipo de atención al cliente me ha dado una respuesta clara sobre lo que está ocurriendo")
+        textos = [plantilla.format("pedido"), plantilla.format("pago"), plantilla.format("pedido") + "."]
+        grupos, nuevos = agrupador.asignar(textos)
+        self.assertEqual(grupos, [0, 1, 0])
+        self.assertEqual(nuevos, [True, True, False])
+        categorias = agrupador.propagar(grupos, clasificar_lote([textos[0], textos[1], textos[0]]))
+        self.assertEqual(categorias, ["logística", "pagos", "logística"])
+
 class TestTicketSystem(unittest.TestCase):
     def test_ticket_system_simulado(self):
         ts = TicketSystem()
@@ -46,5 +780,113 @@ class TestTicketSystem(unittest.TestCase):
         self.assertEqual(ticket['source'], "Simulado")
         self.assertGreaterEqual(len(ts.get_tickets()), 1)
 
+class TestTicketStore(unittest.TestCase):
+    def _verificar_backend(self, backend):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, f"tickets.{backend}")
+            ts = TicketSystem(store=crear_ticket_store(backend, ruta))
+            ts.create_ticket("Mi pedido no llegó", "logística", False)
+            ts.create_ticket("Cobro duplicado", "pagos", True)
+
+            recargado = TicketSystem(store=crear_ticket_store(backend, ruta))
+            self.assertEqual([t["id"] for t in recargado.get_tickets()], [1000, 1001])
+            self.assertEqual(recargado.create_ticket("Otro", "otros", False)["id"], 1002)
+
+            recargado.limpiar_historial()
+            self.assertEqual(TicketSystem(store=crear_ticket_store(backend, ruta)).get_tickets(), [])
+
+    def test_backends(self):
+        for backend in ("json", "jsonl", "sqlite"):
+            with self.subTest(backend=backend):
+                self._verificar_backend(backend)
+
+    def test_jsonl_importa_el_historial_json_anterior(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            anterior = TicketSystem(store=crear_ticket_store("json", os.path.join(tmp, "tickets_db.json")))
+            anterior.create_ticket("Mi pedido no llegó", "logística", False)
+            anterior.create_ticket("Cobro duplicado", "pagos", True)
+
+            ts = TicketSystem(store=crear_ticket_store("jsonl", os.path.join(tmp, "tickets_db.jsonl")))
+            self.assertEqual([t["id"] for t in ts.get_tickets()], [1000, 1001])
+            self.assertEqual(ts.create_ticket("Otro", "otros", False)["id"], 1002)
+            self.assertFalse(os.path.exists(os.path.join(tmp, "tickets_db.json")))
+            self.assertTrue(os.path.exists(os.path.join(tmp, "tickets_db.json.migrado")))
+
+            ts.limpiar_historial()
+            self.assertEqual(TicketSystem(store=crear_ticket_store("jsonl", os.path.join(tmp, "tickets_db.jsonl"))).get_tickets(), [])
+
+    def _verificar_consultas(self, backend):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = crear_ticket_store(backend, os.path.join(tmp, f"tickets.{backend}"))
+            for i in range(7):
+                store.append({"id": 1000 + i, "category": ["pagos", "cuenta"][i % 2], "urgent": i % 3 == 0,
+                              "status": "open", "created_at": f"2026-01-0{i + 1} 10:00:00"})
+            self.assertEqual(store.conteos()["por_categoria"]["pagos"], {"total": 4, "urgentes": 2})
+
+            # Tras la primera consulta las altas deben reflejarse en los índices
+            store.append({"id": 1007, "category": "pagos", "urgent": False, "status": "solved",
+                          "created_at": "2026-01-08 10:00:00"})
+            pagina = store.consultar(categoria="pagos", pagina=1, por_pagina=2)
+            self.assertEqual(pagina["total"], 5)
+            self.assertEqual(pagina["paginas"], 3)
+            self.assertEqual([t["id"] for t in pagina["tickets"]], [1007, 1006])
+            self.assertEqual(store.consultar(categoria="pagos", pagina=3, por_pagina=2)["tickets"][0]["id"], 1000)
+            self.assertEqual([t["id"] for t in store.consultar(urgente=True, estado="open", por_pagina=10)["tickets"]],
+                             [1006, 1003, 1000])
+            rango = store.consultar(desde="2026-01-02", hasta="2026-01-04", por_pagina=10)
+            self.assertEqual([t["id"] for t in rango["tickets"]], [1002, 1001])
+            self.assertEqual(store.consultar(categoria="otros")["tickets"], [])
+            with self.assertRaises(ValueError):
+                store.consultar(pagina=0)
+
+            store.clear()
+            self.assertEqual(store.conteos(), {"total": 0, "por_categoria": {}})
+
+    def test_consultas_paginadas(self):
+        for backend in ("json", "jsonl", "sqlite"):
+            with self.subTest(backend=backend):
+                self._verificar_consultas(backend)
+
+    def test_indice_reemplaza_ids_repetidos(self):
+        indice = app.IndiceTickets([{"id": 1, "category": "pagos", "urgent": True, "status": "open", "created_at": "b"}])
+        indice.agregar({"id": 1, "category": "cuenta", "urgent": False, "status": "open", "created_at": "a"})
+        self.assertEqual(indice.consultar(categoria="pagos")["total"], 0)
+        self.assertEqual(indice.conteos(), {"total": 1, "por_categoria": {"cuenta": {"total": 1, "urgentes": 0}}})
+
+    def test_indices_sqlite(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = crear_ticket_store("sqlite", os.path.join(tmp, "tickets.sqlite"))
+            plan = store._conn.execute(
+                "EXPLAIN QUERY PLAN SELECT data FROM tickets WHERE category = ? ORDER BY created_at DESC", ("pagos",)
+            ).fetchall()
+            self.assertIn("idx_tickets_category", " ".join(str(fila) for fila in plan))
+
+    def test_pagina_base_tickets(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ts = TicketSystem(store=crear_ticket_store("sqlite", os.path.join(tmp, "tickets.sqlite")))
+            for i in range(3):
+                ts.create_ticket(f"Cobro {i}", "pagos", i == 0)
+            with mock.patch.object(app, "ticket_system", ts):
+                tabla, resumen, conteos, pagina = app.pagina_base_tickets("pagos", "No", app.TODOS, 5, por_pagina=1)
+            self.assertEqual(pagina, 2)
+            self.assertEqual(resumen, "Página 2 de 2 (2 tickets)")
+            self.assertEqual(list(tabla.columns), app.COLUMNAS_BASE_TICKETS)
+            self.assertEqual(conteos.to_dict("records"), [{"categoría": "pagos", "tickets": 3, "urgentes": 1}])
+
+    def test_jsonl_compacta_lineas_corruptas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = os.path.join(tmp, "tickets.jsonl")
+            store = crear_ticket_store("jsonl", ruta)
+            store.append({"id": 1000, "status": "open"})
+            with open(ruta, "a") as f:
+                f.write('{"id": 1001, "sta')
+            self.assertEqual(len(store.load()), 1)
+            with open(ruta) as f:
+                self.assertEqual(len(f.readlines()), 1)
+
+    def test_backend_desconocido(self):
+        with self.assertRaises(ValueError):
+            crear_ticket_store("csv")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+import importlib.util
+import app
+from benchmark import generar_corpus, ejecutar_benchmark, comparar_backends, medir_arranque, StubZeroShot, MuestreoRSS
+from test_app import crear_modelo_nli_minimo
+
+class TestBenchmark(unittest.TestCase):
+    def test_generar_corpus(self):
+        corpus = generar_corpus(200, ratio_duplicados=0.5, semilla=1)
+        self.assertEqual(len(corpus), 200)
+        self.assertLess(len(set(corpus)), 150)
+        self.assertEqual(corpus, generar_corpus(200, ratio_duplicados=0.5, semilla=1))
+        self.assertEqual(len(set(generar_corpus(200, ratio_duplicados=0.0))), 200)
+
+    def test_stub_respeta_interfaz_del_pipeline(self):
+        stub = StubZeroShot()
+        resultado = stub("Mi pedido no llegó", candidate_labels=list(app.CATEGORIAS))
+        self.assertEqual(resultado["labels"][0], "logística")
+        self.assertAlmostEqual(sum(resultado["scores"]), 1.0)
+        self.assertEqual(len(stub(["a", "b"], candidate_labels=list(app.CATEGORIAS))), 2)
+
+    def test_ejecutar_benchmark_offline(self):
+        proveedor, cache = app.proveedor_modelo, app.cache_clasificacion
+        resultado = ejecutar_benchmark(filas=40, modos=("keywords", "stub"))
+        json.dumps(resultado)
+        self.assertEqual(len(resultado["resultados"]), 8)
+        clasificar = next(r for r in resultado["resultados"] if r["funcion"] == "clasificar_texto")
+        self.assertEqual(clasificar["filas"], 40)
+        self.assertGreater(clasificar["filas_por_segundo"], 0)
+        self.assertEqual(set(resultado["palabras_clave"]), {"categoria", "categoria_y_urgencia"})
+        self.assertEqual(resultado["palabras_clave"]["categoria_y_urgencia"]["acuerdo"], 1.0)
+        self.assertLessEqual(clasificar["latencia_ms"]["p50"], clasificar["latencia_ms"]["p99"])
+        # La memoria se mide por medición (pico muestreado y memoria retenida), no con el pico acumulado del proceso
+        self.assertNotIn("rss_pico_mb", clasificar)
+        self.assertGreaterEqual(clasificar["rss_pico_incremento_mb"], clasificar["rss_retenido_mb"])
+        # El proveedor y la caché globales se restauran tras la medición
+        self.assertIs(app.proveedor_modelo, proveedor)
+        self.assertIs(app.cache_clasificacion, cache)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "requiere /proc para leer el RSS actual")
+    def test_muestreo_rss_captura_el_pico_de_cada_medicion(self):
+        with MuestreoRSS() as memoria:
+            temporal = b"x" * (64 * 1024 * 1024)
+            time.sleep(0.05)
+            del temporal
+        self.assertGreater(memoria.resumen()["rss_pico_incremento_mb"], 48)
+        self.assertLess(memoria.resumen()["rss_retenido_mb"], 16)
+        # Una medición posterior sin asignaciones no hereda el pico de la anterior
+        with MuestreoRSS() as memoria:
+            time.sleep(0.02)
+        self.assertLess(memoria.resumen()["rss_pico_incremento_mb"], 16)
+
+    @unittest.skipUnless(importlib.util.find_spec("onnxruntime"), "onnxruntime no está instalado")
+    def test_comparar_backends(self):
+        with tempfile.TemporaryDirectory() as modelo, tempfile.TemporaryDirectory() as cache_dir:
+            crear_modelo_nli_minimo(modelo)
+            resultados = comparar_backends(generar_corpus(20), [modelo], ("onnx", "int8"), cache_dir=cache_dir)
+        json.dumps(resultados)
+        self.assertEqual([r["backend"] for r in resultados], ["torch", "onnx", "int8"])
+        self.assertEqual(resultados[0]["aceleracion"], 1.0)
+        self.assertEqual(resultados[0]["acuerdo_fp32"], 1.0)
+        self.assertEqual(resultados[1]["acuerdo_fp32"], 1.0)
+        self.assertGreater(resultados[2]["filas_por_segundo"], 0)
+
+    @unittest.skipUnless(importlib.util.find_spec("torch"), "torch no está instalado")
+    def test_medir_arranque(self):
+        with tempfile.TemporaryDirectory() as modelo:
+            crear_modelo_nli_minimo(modelo)
+            resultado = medir_arranque(workers=1, modelos=[modelo])
+        json.dumps(resultado)
+        self.assertEqual(resultado["workers"], 1)
+        self.assertEqual(resultado["independiente"]["motores"], [modelo])
+        self.assertEqual(resultado["servidor"]["motores"], [modelo])
+        self.assertGreater(resultado["servidor"]["servidor_rss_mb"], 0)
+        # Los workers conectados al servidor no cargan el modelo
+        self.assertLess(resultado["servidor"]["rss_mb_por_worker"], resultado["independiente"]["rss_mb_por_worker"])
+
+if __name__ == '__main__':
+    unittest.main()
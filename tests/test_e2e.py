@@ -1,8 +1,20 @@
 import unittest
 import tempfile
 import os
+import json
+import time
+import threading
+import importlib.util
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pandas as pd
-from app import demo, procesar_tickets, TicketSystem
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+import app
+from app import (
+    demo, procesar_tickets, TicketSystem, ZendeskClient, crear_ticket_store, ColaTrabajos, MicroBatcher,
+    crear_api, clasificar_para_api
+)
 
 def simulate_csv_upload(client, csv_content):
     with tempfile.NamedTemporaryFile(delete=False, suffix='.csv', mode='w', encoding='utf-8') as tmp:
@@ -43,5 +55,265 @@ class TestEndToEnd(unittest.TestCase):
         ts.limpiar_historial()
         self.assertEqual(len(ts.get_tickets()), 0)
 
+class TestColaTrabajos(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, 'subida.csv')
+        with open(self.csv, 'w', encoding='utf-8') as f:
+            f.write('id,descripcion\n1,Mi pedido no llegó\n2,¡Es urgente!\n3,Error en mi pago\n')
+        self.directorio = os.path.join(self.tmp.name, 'trabajos')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _esperar(self, cola, trabajo_id):
+        for _ in range(200):
+            trabajo = cola.estado(trabajo_id)
+            if trabajo["estado"] not in ColaTrabajos.ESTADOS_PENDIENTES:
+                return trabajo
+            time.sleep(0.05)
+        self.fail("El trabajo no terminó a tiempo")
+
+    def test_trabajo_completo_con_progreso(self):
+        cola = ColaTrabajos(self.directorio, chunksize=2)
+        trabajo = self._esperar(cola, cola.enviar(self.csv))
+        self.assertEqual(trabajo["estado"], "completado")
+        self.assertEqual((trabajo["filas"], trabajo["total"]), (3, 3))
+        self.assertEqual(len(pd.read_csv(trabajo["salida"])), 3)
+        self.assertEqual(len(pd.read_csv(trabajo["urgentes"])), 2)
+        self.assertIn("Total tickets procesados: 3", trabajo["mensaje"])
+
+    def test_trabajos_simultaneos_no_comparten_urgentes(self):
+        # Dos trabajos que empiezan en el mismo segundo escriben cada uno en su propio archivo
+        otro = os.path.join(self.tmp.name, 'otra.csv')
+        with open(otro, 'w', encoding='utf-8') as f:
+            f.write('id,descripcion\n10,Es urgente revisar mi pedido\n11,Consulta general\n')
+        cola = ColaTrabajos(self.directorio, max_concurrentes=2, chunksize=1)
+        with mock.patch.object(app.time, "strftime", return_value="20240101_000000"):
+            trabajos = [cola.enviar(self.csv), cola.enviar(otro)]
+            primero, segundo = (self._esperar(cola, t) for t in trabajos)
+        self.assertEqual(sorted(pd.read_csv(primero["urgentes"])["id"]), [2, 3])
+        self.assertEqual(list(pd.read_csv(segundo["urgentes"])["id"]), [10])
+        self.assertEqual(os.path.dirname(primero["urgentes"]), self.directorio)
+        self.assertFalse(os.path.exists("tickets_urgentes_20240101_000000.csv"))
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow no está instalado")
+    def test_trabajo_parquet(self):
+        parquet = os.path.join(self.tmp.name, 'subida.parquet')
+        pd.read_csv(self.csv).to_parquet(parquet, index=False)
+        cola = ColaTrabajos(self.directorio, chunksize=2)
+        trabajo = self._esperar(cola, cola.enviar(parquet))
+        self.assertEqual(trabajo["estado"], "completado")
+        self.assertTrue(trabajo["salida"].endswith(".parquet"))
+        self.assertEqual(len(pd.read_parquet(trabajo["salida"])), 3)
+        self.assertIsNone(trabajo["urgentes"])
+
+    def test_reinicio_marca_o_reanuda_pendientes(self):
+        cola = ColaTrabajos(self.directorio)
+        trabajo_id = cola.enviar(self.csv)
+        self._esperar(cola, trabajo_id)
+        cola._actualizar(trabajo_id, estado="procesando")
+        self.assertEqual(ColaTrabajos(self.directorio).estado(trabajo_id)["estado"], "interrumpido")
+
+        cola._actualizar(trabajo_id, estado="procesando")
+        reanudada = ColaTrabajos(self.directorio, reanudar=True)
+        self.assertEqual(self._esperar(reanudada, trabajo_id)["estado"], "completado")
+
+    def test_reinicio_lista_y_registra_los_interrumpidos(self):
+        cola = ColaTrabajos(self.directorio)
+        trabajo_id = cola.enviar(self.csv)
+        self._esperar(cola, trabajo_id)
+        cola._actualizar(trabajo_id, estado="procesando", filas=1)
+        with self.assertLogs(app.logger, level="WARNING") as registro:
+            reiniciada = ColaTrabajos(self.directorio)
+        self.assertTrue(any(trabajo_id in linea and "1/3" in linea for linea in registro.output))
+        tabla = app.tabla_trabajos(reiniciada)
+        self.assertEqual(list(tabla.columns), app.COLUMNAS_TRABAJOS)
+        fila = tabla[tabla["id"] == trabajo_id].iloc[0]
+        self.assertEqual((fila["archivo"], fila["estado"], fila["progreso"]), ("subida.csv", "interrumpido", "1/3"))
+
+class MockZendeskHandler(BaseHTTPRequestHandler):
+    """Servidor Zendesk mínimo: responde 429 a la primera petición de cada ruta."""
+    vistos = set()
+    peticiones = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo, headers=None):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for clave, valor in (headers or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _limitar(self):
+        with self.lock:
+            self.peticiones.append(self.path)
+            primera = self.path not in self.vistos
+            self.vistos.add(self.path)
+        if primera:
+            self._responder(429, {"error": "RateLimited"}, {"Retry-After": "0"})
+        return primera
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self._limitar():
+            return
+        if self.path == "/api/v2/tickets.json":
+            self._responder(201, {"ticket": {"id": 1, "status": "new"}})
+        elif self.path == "/api/v2/tickets/create_many.json":
+            total = len(cuerpo["tickets"])
+            self._responder(200, {"job_status": {"id": f"job{total}", "status": "queued"}})
+
+    def do_GET(self):
+        if self._limitar():
+            return
+        total = int(self.path.rsplit("job", 1)[1].split(".")[0])
+        resultados = [{"index": i, "id": 500 + i} for i in range(total)]
+        self._responder(200, {"job_status": {"id": f"job{total}", "status": "completed", "results": resultados}})
+
+class TestZendeskClient(unittest.TestCase):
+    def setUp(self):
+        MockZendeskHandler.vistos = set()
+        MockZendeskHandler.peticiones = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockZendeskHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.cliente = ZendeskClient(
+            "demo", "agente@example.com", "token",
+            base_url=f"http://127.0.0.1:{self.server.server_address[1]}",
+            backoff=0, intervalo_job=0
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ts = TicketSystem(store=crear_ticket_store("jsonl", os.path.join(self.tmp.name, "t.jsonl")),
+                               zendesk=self.cliente)
+        self.ts.mode = "zendesk"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_create_ticket_reintenta_429(self):
+        ticket = self.ts.create_ticket("Mi pedido no llegó", "logística", False)
+        self.assertEqual(ticket["id"], 1)
+        self.assertEqual(ticket["source"], "Zendesk")
+        self.assertEqual(MockZendeskHandler.peticiones.count("/api/v2/tickets.json"), 2)
+        self.assertGreaterEqual(app.METRICA_ZENDESK_RESPUESTAS.valor(codigo=429), 1)
+        self.assertGreaterEqual(app.METRICA_ZENDESK.conteo(metodo="POST"), 2)
+
+    def test_create_tickets_create_many(self):
+        batch = [(f"Ticket {i}", "pagos", i % 2 == 0) for i in range(3)]
+        tickets = self.ts.create_tickets(batch)
+        self.assertEqual([t["id"] for t in tickets], [500, 501, 502])
+        self.assertTrue(tickets[0]["urgent"])
+        self.assertEqual(len(self.ts.get_tickets()), 3)
+
+    def test_create_tickets_divide_en_bloques(self):
+        resultados = self.cliente.create_tickets([ZendeskClient.payload("x", "otros", False)] * 150)
+        self.assertEqual(len(resultados), 150)
+        self.assertEqual(resultados[100], {"id": 500})
+        self.assertEqual(MockZendeskHandler.peticiones.count("/api/v2/tickets/create_many.json"), 3)
+
+class TestApiHttp(unittest.TestCase):
+    def crear_cliente(self, funcion=clasificar_para_api, **opciones):
+        batcher = MicroBatcher(funcion, **opciones)
+        self.addCleanup(batcher.cerrar)
+        return TestClient(crear_api(batcher)), batcher
+
+    def test_classify_y_batch(self):
+        cliente, _ = self.crear_cliente()
+        respuesta = cliente.post("/classify", json={"text": "Mi pedido no llegó, es urgente"})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()["category"], "logística")
+        self.assertTrue(respuesta.json()["urgent"])
+        self.assertIn("score", respuesta.json())
+        respuesta = cliente.post("/classify/batch", json={"texts": ["Pantalla rota", "Error en mi pago"]})
+        self.assertEqual([r["category"] for r in respuesta.json()["results"]], ["producto defectuoso", "pagos"])
+        self.assertEqual(cliente.post("/classify", json={"text": ""}).status_code, 422)
+
+    def test_metrics(self):
+        cliente, _ = self.crear_cliente()
+        cliente.post("/classify", json={"text": "Mi pedido no llegó"})
+        respuesta = cliente.get("/metrics")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.headers["content-type"].startswith("text/plain"))
+        self.assertIn("# TYPE ticket_clasificacion_segundos histogram", respuesta.text)
+        self.assertIn('ticket_procesados_total{origen="api"}', respuesta.text)
+
+    def test_tickets_paginados(self):
+        cliente, _ = self.crear_cliente()
+        with tempfile.TemporaryDirectory() as tmp:
+            ts = TicketSystem(store=crear_ticket_store("sqlite", os.path.join(tmp, "tickets.sqlite")))
+            for i in range(3):
+                ts.create_ticket(f"Cobro {i}", "pagos", i == 0)
+            with mock.patch.object(app, "ticket_system", ts):
+                pagina = cliente.get("/tickets", params={"category": "pagos", "urgent": "false", "per_page": 1}).json()
+                self.assertEqual((pagina["total"], pagina["paginas"]), (2, 2))
+                self.assertEqual(cliente.get("/tickets/counts").json()["por_categoria"]["pagos"],
+                                 {"total": 3, "urgentes": 1})
+                self.assertEqual(cliente.get("/tickets", params={"page": 0}).status_code, 422)
+
+    def test_peticiones_concurrentes_comparten_lote(self):
+        llamadas = []
+        def funcion(textos):
+            llamadas.append(list(textos))
+            return clasificar_para_api(textos)
+        cliente, batcher = self.crear_cliente(funcion, max_lote=8, max_espera_ms=200)
+        textos = ["Mi pedido no llegó", "Pantalla rota", "Error en mi pago", "No puedo acceder a mi cuenta"]
+        with ThreadPoolExecutor(4) as pool:
+            respuestas = list(pool.map(lambda t: cliente.post("/classify", json={"text": t}), textos))
+        self.assertEqual([r.json()["category"] for r in respuestas],
+                         ["logística", "producto defectuoso", "pagos", "cuenta"])
+        self.assertLess(batcher.lotes, len(textos))
+        self.assertEqual(sorted(t for lote in llamadas for t in lote), sorted(textos))
+
+    def test_peticion_cancelada_no_detiene_el_despachador(self):
+        liberar = threading.Event()
+        llamadas = []
+        def lenta(textos):
+            liberar.wait(5)
+            llamadas.append(list(textos))
+            return [t.upper() for t in textos]
+        batcher = MicroBatcher(lenta, max_lote=1, max_espera_ms=0)
+        self.addCleanup(batcher.cerrar)
+        primera = batcher.enviar(["a"])
+        time.sleep(0.1)  # el despachador está ocupado con la primera
+        cancelada = batcher.enviar(["b"])
+        self.assertTrue(cancelada.cancel())  # como al desconectarse el cliente
+        liberar.set()
+        self.assertEqual(primera.result(timeout=5), ["A"])
+        self.assertEqual(batcher.enviar(["c"]).result(timeout=5), ["C"])
+        self.assertEqual(llamadas, [["a"], ["c"]])
+
+    def test_fallo_inesperado_no_detiene_el_despachador(self):
+        batcher = MicroBatcher(lambda textos: None if "roto" in textos else textos, max_espera_ms=0)
+        self.addCleanup(batcher.cerrar)
+        with self.assertRaises(TypeError):
+            batcher.enviar(["roto"]).result(timeout=5)  # el resultado del lote no se puede repartir
+        self.assertEqual(batcher.enviar(["ok"]).result(timeout=5), ["ok"])
+
+    def test_cola_llena_responde_429(self):
+        liberar = threading.Event()
+        def lenta(textos):
+            liberar.wait(5)
+            return clasificar_para_api(textos)
+        cliente, batcher = self.crear_cliente(lenta, max_lote=1, max_espera_ms=0, max_cola=1)
+        with ThreadPoolExecutor(2) as pool:
+            primera = pool.submit(cliente.post, "/classify", json={"text": "Pantalla rota"})
+            time.sleep(0.2)  # el despachador está ocupado con la primera
+            segunda = pool.submit(cliente.post, "/classify", json={"text": "Mi pedido no llegó"})
+            time.sleep(0.2)  # la segunda ocupa el único lugar de la cola
+            tercera = cliente.post("/classify", json={"text": "Error en mi pago"})
+            liberar.set()
+            self.assertEqual(primera.result().status_code, 200)
+            self.assertEqual(segunda.result().status_code, 200)
+        self.assertEqual(tercera.status_code, 429)
+        self.assertEqual(tercera.headers["retry-after"], "1")
+
 if __name__ == '__main__':
     unittest.main()